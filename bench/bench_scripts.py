@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mock_api import MockProgram, ghidra_namespace, install_ida_modules
+
+"""
+Benchmark of the Ghidra/IDA scripts against synthetic programs, run through
+the `mock_api` stand-in of the disassembler APIs.
+
+    ./bench_scripts.py --functions 10000 100000 1000000
+    ./bench_scripts.py --model program.json --scripts NostalgicIDA
+    ./bench_scripts.py --functions 100000 --rename-batching
+"""
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+
+# * decryptor address of the default `artradownloader_v1` profile
+DECRYPTOR = 0x004026B0
+FUNCTIONS_BASE = 0x00410000
+DATA_BASE = 0x10000000
+
+SCRIPTS = [
+    "NostalgicIDA",
+    "FunctionIdMatcher",
+    "ghidra-strings-decryptor",
+    "ida-strings-decryptor",
+]
+
+
+def synthetic_model(functions: int, seed: int = 0) -> Dict:
+    """
+    Build a program model with `functions` functions, default named globals
+    and labels, FunctionID hashes and decryptor call sites.
+
+    :param functions: Number of functions.
+    :type functions: int
+    :param seed: Random seed.
+    :type seed: int
+    :return: Program model, see `mock_api`.
+    :rtype: Dict
+    """
+    rng = random.Random(seed)
+    model: Dict = {
+        "image_base": 0x400000,
+        "functions": [
+            {
+                "name": f"FUN_{DECRYPTOR:08x}",
+                "entry": DECRYPTOR,
+                "size": 32,
+                "library": False,
+            }
+        ],
+        "symbols": [],
+        "instructions": [],
+        "references": [],
+        "data": [],
+    }
+
+    for index in range(functions):
+        entry = FUNCTIONS_BASE + index * 0x40
+        model["functions"].append(
+            {
+                "name": f"FUN_{entry:08x}",
+                "entry": entry,
+                "size": 0x40,
+                "library": index % 10 == 0,
+                "calls": [DECRYPTOR]
+                if index % 10 == 1
+                # * single call wrapper of the previous function
+                else [entry - 0x40]
+                if index % 10 == 5
+                else [],
+                # * thunk of the previous function
+                "thunk_of": entry - 0x40 if index % 10 == 3 else None,
+                "params": [f"param_{i + 1}" for i in range(rng.randint(0, 3))],
+                "locals": [f"local_{8 + 4 * i:x}" for i in range(rng.randint(0, 4))]
+                + (["local_res4"] if index % 7 == 0 else []),
+                "fid": {
+                    "full": f"0x{rng.getrandbits(64):016x}",
+                    "specific": f"0x{rng.getrandbits(64):016x}",
+                    "size": rng.randint(8, 200),
+                },
+            }
+        )
+        global_addr, label_addr = DATA_BASE + index * 0x10, entry + 0x20
+        model["symbols"].append(
+            {"name": f"DAT_{global_addr:08x}", "address": global_addr, "type": "GLOBAL"}
+        )
+        model["symbols"].append(
+            {"name": f"LAB_{label_addr:08x}", "address": label_addr, "type": "LABEL"}
+        )
+
+        if index % 10 == 1:
+            # * `MOV EAX, <string>` ; `CALL decryptor`
+            string_addr = DATA_BASE + 0x08000000 + index * 0x20
+            mov, call = entry + 0x10, entry + 0x15
+            model["instructions"].append(
+                {
+                    "address": mov,
+                    "mnemonic": "MOV",
+                    "length": 5,
+                    "writes": ["EAX"],
+                    "scalar": string_addr,
+                }
+            )
+            model["instructions"].append(
+                {"address": call, "mnemonic": "CALL", "length": 5, "writes": ["ESP"]}
+            )
+            model["references"].append({"from": call, "to": DECRYPTOR})
+            encrypted = bytes(b + 1 for b in f"string_{index}".encode()) + b"\x00"
+            model["data"].append(
+                {"address": string_addr, "hex": encrypted.hex(), "string": True}
+            )
+    return model
+
+
+def fid_database(model: Dict, path: str) -> None:
+    """
+    Write a fiddb.json matching half of the model functions.
+    """
+    functions = {}
+    for f in model["functions"][1::2]:
+        functions[f["fid"]["full"]] = {
+            "name": "lib_" + f["name"],
+            "specific_hash": f["fid"]["specific"],
+            "size": f["fid"]["size"],
+        }
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "version": "0.2",
+                "database": {
+                    "entries": len(functions),
+                    "last_update_utc": "",
+                    "functions": functions,
+                },
+            },
+            f,
+        )
+
+
+def _run_script(path: str, namespace: Dict) -> None:
+    # * as in Ghidra/IDA, scripts import helper modules from their directory
+    script_dir = os.path.dirname(path)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    # * the scripts print a lot, keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        runpy.run_path(path, init_globals=namespace, run_name="__main__")
+
+
+def bench_script(name: str, model: Dict, workdir: str) -> Dict:
+    """
+    Run a script on a fresh program built from `model`.
+
+    :return: Wall time and API counters.
+    :rtype: Dict
+    """
+    program = MockProgram(model)
+    ghidra_dir = os.path.join(workdir, "ghidra_scripts")
+    runners: Dict[str, Callable[[], None]] = {
+        "NostalgicIDA": lambda: _run_script(
+            os.path.join(ghidra_dir, "NostalgicIDA.py"), ghidra_namespace(program)
+        ),
+        "FunctionIdMatcher": lambda: _run_script(
+            os.path.join(ghidra_dir, "FunctionIdMatcher.py"),
+            ghidra_namespace(program),
+        ),
+        "ghidra-strings-decryptor": lambda: _run_script(
+            os.path.join(ghidra_dir, "ArtraDownloade-ghidra-strings-decrytor.py"),
+            ghidra_namespace(program, ["--quiet"]),
+        ),
+        "ida-strings-decryptor": lambda: _run_script(
+            os.path.join(
+                workdir, "ida_scripts", "ArtraDownloade-ida-strings-decrytor.py"
+            ),
+            install_ida_modules(program),
+        ),
+    }
+
+    start = time.perf_counter()
+    runners[name]()
+    elapsed = time.perf_counter() - start
+    return dict(program.counters, seconds=elapsed)
+
+
+def bench_rename_batching(model: Dict, workdir: str) -> List[Tuple[str, Dict]]:
+    """
+    Apply the NostalgicIDA renames of `model` one transaction per rename
+    (before) and through `apply_renames`, one batched transaction (after),
+    with the incremental change tracker listening. No script transaction
+    encloses them, every outermost transaction is an undo checkpoint.
+
+    :return: Mode, wall time and API counters of the apply phase.
+    :rtype: List[Tuple[str, Dict]]
+    """
+    path = os.path.join(workdir, "ghidra_scripts", "NostalgicIDA.py")
+    if os.path.dirname(path) not in sys.path:
+        sys.path.insert(0, os.path.dirname(path))
+    results = []
+    for mode in ("per-rename", "batched"):
+        program = MockProgram(model)
+        script = runpy.run_path(
+            path, init_globals=ghidra_namespace(program), run_name="bench"
+        )
+        tracker = script["get_tracker"](program, create=True)
+        renames = script["globals_rename"]()
+        renames.extend(
+            script["functions_rename"](
+                ren_function=True, ren_args=True, ren_local_var=True
+            )[0]
+        )
+        before = dict(program.counters)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if mode == "per-rename":
+                for obj, _, new_name, _ in renames:
+                    transaction = program.startTransaction("NostalgicIDA rename")
+                    try:
+                        obj.setName(new_name, script["SourceType"].USER_DEFINED)
+                    except Exception:
+                        pass
+                    finally:
+                        program.endTransaction(transaction, True)
+            else:
+                script["apply_renames"](renames, tracker)
+        elapsed = time.perf_counter() - start
+        results.append(
+            (
+                mode,
+                dict(
+                    ((key, program.counters[key] - before[key]) for key in before),
+                    seconds=elapsed,
+                ),
+            )
+        )
+    return results
+
+
+def prepare_workdir() -> str:
+    """
+    Copy the scripts to a scratch directory, so fiddb.json and friends
+    never land next to the repository scripts.
+    """
+    workdir = tempfile.mkdtemp(prefix="re-misc-bench-")
+    for directory in ("ghidra_scripts", "ida_scripts", "common"):
+        shutil.copytree(
+            os.path.join(REPO_ROOT, directory),
+            os.path.join(workdir, directory),
+            ignore=shutil.ignore_patterns("fiddb*", "__pycache__"),
+        )
+    return workdir
+
+
+def main(
+    sizes: List[int],
+    model_path: Optional[str],
+    scripts: List[str],
+    rename_batching: bool = False,
+) -> None:
+    workdir = prepare_workdir()
+    try:
+        if model_path:
+            with open(model_path, "r") as f:
+                models = [(model_path, json.load(f))]
+        else:
+            models = [(f"{size} functions", synthetic_model(size)) for size in sizes]
+
+        print(
+            f"{'program':<24} {'script':<26} "
+            f"{'seconds':>9} {'renames':>9} {'comments':>9}"
+        )
+        for label, model in models:
+            fid_database(model, os.path.join(workdir, "ghidra_scripts", "fiddb.json"))
+            for name in scripts:
+                result = bench_script(name, model, workdir)
+                print(
+                    f"{label:<24} {name:<26} {result['seconds']:>9.3f} "
+                    f"{result['renames']:>9} {result['comments']:>9}"
+                )
+
+        if rename_batching:
+            print(
+                f"\n{'program':<24} {'NostalgicIDA renames':<26} {'seconds':>9} "
+                f"{'renames':>9} {'trans.':>9} {'checkp.':>9} {'events':>9}"
+            )
+            for label, model in models:
+                for mode, result in bench_rename_batching(model, workdir):
+                    print(
+                        f"{label:<24} {mode:<26} {result['seconds']:>9.3f} "
+                        f"{result['renames']:>9} {result['transactions']:>9} "
+                        f"{result['checkpoints']:>9} {result['events']:>9}"
+                    )
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the disassembler scripts on synthetic programs"
+    )
+    parser.add_argument(
+        "--functions",
+        type=int,
+        nargs="+",
+        default=[10000, 100000],
+        help="Synthetic program sizes. (default: %(default)s)",
+    )
+    parser.add_argument("--model", help="JSON program model to use instead.")
+    parser.add_argument(
+        "--scripts",
+        nargs="+",
+        choices=SCRIPTS,
+        default=SCRIPTS,
+        help="Scripts to benchmark. (default: all)",
+    )
+    parser.add_argument(
+        "--rename-batching",
+        action="store_true",
+        help="Also time NostalgicIDA renames, one transaction each vs batched.",
+    )
+    args = parser.parse_args()
+
+    main(args.functions, args.model, args.scripts, args.rename_batching)
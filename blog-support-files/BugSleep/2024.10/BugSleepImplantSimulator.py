@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import random
+import ssl
+import sys
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from bugsleep_profile import ProtocolProfile, cipher_table, load_profile
+
+#! protocol constants of the simulated variant, see bugsleep_profile
+PROFILE = ProtocolProfile({})
+
+"""
+Simulated BugSleep implants, a load generator for the C2 emulators.
+
+Every implant beacons to the emulator, runs the handshake and then follows
+the command selected by the emulator (download, upload or reverse shell),
+exactly as the emulators expect it. The shell emulator has to run in batch
+mode (--script) since nobody types the commands.
+
+    ./BugSleepC2Emulator_RevShell.py --port 4443 --script cmds.txt --max-sessions 512
+    ./BugSleepImplantSimulator.py --port 4443 --implants 2000 --duration 60 \\
+        --spread-sources --beacon-interval 5
+
+    ./BugSleepC2Emulator_file_download_upload.py --port 4443 --hex-value 0 \\
+        --remote-path C:\\\\x.bin --workers 4
+    ./BugSleepImplantSimulator.py --port 4443 --implants 500 --payload-size 1048576 \\
+        --fault-rate 0.05 --faults drop stall fragment
+
+Reports the completed sessions/s and MB/s sustained by the emulator.
+
+Network faults, injected in --fault-rate of the sessions:
+    drop       close the connection at a random point of the session
+    stall      pause --stall-time seconds before a random message
+    fragment   send every message in 1-16 bytes segments
+"""
+
+COMMAND_DOWNLOAD = 0x0
+COMMAND_UPLOAD = 0x1
+COMMAND_SHELL = 0x2
+COMMAND_NAMES = {
+    COMMAND_DOWNLOAD: "download",
+    COMMAND_UPLOAD: "upload",
+    COMMAND_SHELL: "shell",
+}
+
+FAULT_DROP = "drop"
+FAULT_STALL = "stall"
+FAULT_FRAGMENT = "fragment"
+FAULTS = (FAULT_DROP, FAULT_STALL, FAULT_FRAGMENT)
+
+#! shell output alphabet, no NUL (end of output marker)
+SHELL_ALPHABET = bytes(range(0x20, 0x7F))
+
+
+class FaultInjected(Exception):
+    """
+    The session was cut short on purpose.
+    """
+
+
+class LoadStats(object):
+    """
+    Counters of the simulated sessions.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.monotonic()
+        self.sessions_ok = 0
+        self.sessions_failed = 0
+        self.sessions_faulted = 0
+        self.sessions_active = 0
+        self.commands: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.faults: Counter = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.durations: List[float] = []
+        #! (time, sessions ok, bytes) of the previous report
+        self.last: Tuple[float, int, int] = (self.start, 0, 0)
+
+    def report(self) -> None:
+        now = time.monotonic()
+        last_time, last_sessions, last_bytes = self.last
+        elapsed = max(now - last_time, 1e-9)
+        volume = self.bytes_in + self.bytes_out
+        print(
+            f"[Load] {now - self.start:7.1f}s active {self.sessions_active:5d} "
+            f"sessions/s {(self.sessions_ok - last_sessions) / elapsed:8.1f} "
+            f"MB/s {(volume - last_bytes) / elapsed / (1 << 20):8.2f} "
+            f"ok {self.sessions_ok} failed {self.sessions_failed} "
+            f"faulted {self.sessions_faulted}"
+        )
+        sys.stdout.flush()
+        self.last = (now, self.sessions_ok, volume)
+
+    def summary(self) -> None:
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        megabytes = 1 << 20
+        print("\n[Load] Summary")
+        print(f"\tDuration:        {elapsed:.1f}s")
+        print(
+            f"\tSessions:        {self.sessions_ok} ok, {self.sessions_failed} failed, "
+            f"{self.sessions_faulted} with injected faults"
+        )
+        print(f"\tSessions/s:      {self.sessions_ok / elapsed:.1f}")
+        print(
+            f"\tMB/s:            "
+            f"{(self.bytes_in + self.bytes_out) / elapsed / megabytes:.2f} "
+            f"(in {self.bytes_in / elapsed / megabytes:.2f}, "
+            f"out {self.bytes_out / elapsed / megabytes:.2f})"
+        )
+        if self.durations:
+            durations = sorted(self.durations)
+            last = len(durations) - 1
+            percentiles = ", ".join(
+                f"p{p} {durations[min(last, len(durations) * p // 100)]:.3f}s"
+                for p in (50, 95, 99)
+            )
+            print(f"\tSession time:    {percentiles}")
+        if self.commands:
+            print(
+                "\tCommands:        "
+                + ", ".join(f"{name} {count}" for name, count in self.commands.items())
+            )
+        if self.faults:
+            print(
+                "\tInjected faults: "
+                + ", ".join(f"{name} {count}" for name, count in self.faults.items())
+            )
+        for error, count in self.errors.most_common(5):
+            print(f"\t[Error] {count} x {error}")
+
+
+class Implant(object):
+    """
+    A simulated BugSleep implant.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        host: str,
+        port: int,
+        increment: int,
+        stats: LoadStats,
+        payload_size: int,
+        timeout: float,
+        source: Optional[str] = None,
+        tls_context: Optional[ssl.SSLContext] = None,
+        fault_rate: float = 0.0,
+        faults: Tuple[str, ...] = (),
+        stall_time: float = 5.0,
+    ) -> None:
+        self.index = index
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.payload_size = payload_size
+        self.timeout = timeout
+        self.source = source
+        self.tls_context = tls_context
+        self.fault_rate = fault_rate
+        self.faults = faults
+        self.stall_time = stall_time
+        self.rng = random.Random(index)
+        #! the implant subtracts the increment the C2 adds
+        self.table = cipher_table(-increment % 256)
+        self.hello = f"LOADGEN-{index:05d}/Us3R".encode()
+        #! per session fault state
+        self.fault: Optional[str] = None
+        self.fault_at = 0
+        self.sent = 0
+
+    async def beacon(
+        self,
+        deadline: float,
+        beacons: int,
+        interval: float,
+        jitter: float,
+        ramp_up: float,
+    ) -> None:
+        """
+        Run sessions until `deadline` or `beacons` sessions.
+        """
+        await asyncio.sleep(self.rng.uniform(0, ramp_up))
+        count = 0
+        while time.monotonic() < deadline and (beacons <= 0 or count < beacons):
+            await self.session()
+            count += 1
+            delay = interval * self.rng.uniform(1 - jitter, 1 + jitter)
+            await asyncio.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+
+    async def session(self) -> None:
+        stats = self.stats
+        self.fault = None
+        self.sent = 0
+        if self.faults and self.rng.random() < self.fault_rate:
+            self.fault = self.rng.choice(self.faults)
+            #! bytes sent before the drop/stall
+            self.fault_at = self.rng.randrange(max(1, self.payload_size))
+            stats.faults[self.fault] += 1
+
+        stats.sessions_active += 1
+        start = time.monotonic()
+        writer: Optional[asyncio.StreamWriter] = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    self.host,
+                    self.port,
+                    ssl=self.tls_context,
+                    server_hostname="" if self.tls_context else None,
+                    local_addr=(self.source, 0) if self.source else None,
+                ),
+                self.timeout,
+            )
+            command = await self.handshake(reader, writer)
+            stats.commands[COMMAND_NAMES.get(command, hex(command))] += 1
+            if command == COMMAND_DOWNLOAD:
+                await self.download(reader, writer)
+            elif command == COMMAND_UPLOAD:
+                await self.upload(reader, writer)
+            elif command == COMMAND_SHELL:
+                await self.shell(reader, writer)
+            else:
+                raise ValueError(f"unknown command {command:#x}")
+            stats.sessions_ok += 1
+            stats.durations.append(time.monotonic() - start)
+        except FaultInjected:
+            stats.sessions_faulted += 1
+        except Exception as err:
+            if self.fault == FAULT_DROP:
+                stats.sessions_faulted += 1
+            else:
+                stats.sessions_failed += 1
+                stats.errors[f"{type(err).__name__}: {err}".rstrip(": ")] += 1
+        finally:
+            stats.sessions_active -= 1
+            if writer is not None:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+
+    async def send(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+        data = data.translate(self.table)
+        if (
+            self.fault in (FAULT_DROP, FAULT_STALL)
+            and self.sent + len(data) > self.fault_at
+        ):
+            cut = self.fault_at - self.sent
+            writer.write(data[:cut])
+            await writer.drain()
+            self.sent += cut
+            self.stats.bytes_out += cut
+            if self.fault == FAULT_DROP:
+                raise FaultInjected()
+            await asyncio.sleep(self.stall_time)
+            #! stall once
+            self.fault = None
+            data = data[cut:]
+        if self.fault == FAULT_FRAGMENT:
+            offset = 0
+            while offset < len(data):
+                size = self.rng.randint(1, 16)
+                writer.write(data[offset : offset + size])
+                await writer.drain()
+                offset += size
+        else:
+            writer.write(data)
+            await writer.drain()
+        self.sent += len(data)
+        self.stats.bytes_out += len(data)
+
+    async def recv(self, reader: asyncio.StreamReader, size: int) -> bytes:
+        data = await asyncio.wait_for(reader.readexactly(size), self.timeout)
+        self.stats.bytes_in += size
+        return data.translate(self.table)
+
+    async def recv_int(self, reader: asyncio.StreamReader, size: int = 0) -> int:
+        return PROFILE.parse_int(await self.recv(reader, size or PROFILE.length_size))
+
+    async def handshake(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> int:
+        """
+        Phases 1-3, returns the command selected by the C2.
+        """
+        await self.send(writer, PROFILE.pack_int(len(self.hello)) + self.hello)
+        await self.recv(reader, PROFILE.random_size)
+        return await self.recv_int(reader) - PROFILE.command_offset
+
+    async def read_path(self, reader: asyncio.StreamReader) -> str:
+        size = await self.recv_int(reader)
+        return (await self.recv(reader, size)).decode("utf-16le", errors="replace")
+
+    async def download(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Command 0x0: send `payload_size` bytes of the requested file.
+        """
+        await self.read_path(reader)
+        size = max(1, self.payload_size)
+        blocks, last_block_size = divmod(size, PROFILE.block_size)
+        if last_block_size:
+            blocks += 1
+        else:
+            last_block_size = PROFILE.block_size
+        await self.send(
+            writer,
+            PROFILE.pack_int(1)
+            + PROFILE.pack_int(0)
+            + PROFILE.pack_int(blocks, PROFILE.block_count_size)
+            + PROFILE.pack_int(last_block_size),
+        )
+        #! same content every time, the emulator stores files by SHA-1
+        chunk = bytes(range(256)) * 256
+        remaining = size
+        while remaining > 0:
+            block = chunk[: min(remaining, len(chunk))]
+            await self.send(writer, block)
+            remaining -= len(block)
+
+    async def upload(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Command 0x1: receive a file from the C2.
+        """
+        await self.read_path(reader)
+        await self.send(writer, PROFILE.pack_int(1) + PROFILE.pack_int(1))
+        total_blocks = await self.recv_int(reader)
+        padded_last_block_size = await self.recv_int(reader)
+        for block_number in range(total_blocks):
+            size = (
+                PROFILE.block_size
+                if block_number < total_blocks - 1
+                else PROFILE.block_index_size + padded_last_block_size
+            )
+            await self.recv(reader, size)
+
+    async def shell(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Command 0x2: answer every command with `payload_size` bytes of output
+        until the C2 closes the session.
+        """
+        output = bytes(
+            self.rng.choice(SHELL_ALPHABET) for _ in range(self.payload_size)
+        )
+        await self.send(writer, b"Microsoft Windows\r\n" + PROFILE.output_marker)
+        while True:
+            try:
+                size = await self.recv_int(reader)
+            except asyncio.IncompleteReadError as err:
+                if err.partial:
+                    raise
+                return
+            await self.recv(reader, size)
+            await self.send(writer, output + PROFILE.output_marker)
+
+
+def source_address(index: int) -> str:
+    """
+    Distinct loopback source address of implant `index`.
+    """
+    index += 2
+    return f"127.{(index >> 16) & 0xFF}.{(index >> 8) & 0xFF}.{index & 0xFF}"
+
+
+def raise_open_files_limit(needed: int) -> None:
+    """
+    Raise the soft open files limit, one socket per implant.
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = needed + 64
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        if limit < wanted:
+            print(f"[Warning] Open files limit is {limit}, some implants will fail.")
+
+
+async def run_load(
+    args: argparse.Namespace, increment: int, stats: LoadStats
+) -> None:
+    """
+    Run the implants until the end of the test.
+    """
+    tls_context: Optional[ssl.SSLContext] = None
+    if args.tls:
+        tls_context = ssl.create_default_context()
+        tls_context.check_hostname = False
+        tls_context.verify_mode = ssl.CERT_NONE
+
+    implants = [
+        Implant(
+            index,
+            args.host,
+            args.port,
+            increment,
+            stats,
+            args.payload_size,
+            args.timeout,
+            source=source_address(index) if args.spread_sources else None,
+            tls_context=tls_context,
+            fault_rate=args.fault_rate,
+            faults=tuple(args.faults),
+            stall_time=args.stall_time,
+        )
+        for index in range(args.implants)
+    ]
+    deadline = time.monotonic() + args.duration if args.duration > 0 else float("inf")
+    tasks = [
+        asyncio.ensure_future(
+            implant.beacon(
+                deadline,
+                args.beacons,
+                args.beacon_interval,
+                args.jitter,
+                args.ramp_up,
+            )
+        )
+        for implant in implants
+    ]
+
+    async def reporter() -> None:
+        while True:
+            await asyncio.sleep(args.report_interval)
+            stats.report()
+
+    report_task = asyncio.ensure_future(reporter())
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        report_task.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulated BugSleep implants, load generator for the C2 emulators"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Emulator address. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=443,
+        help="Emulator port. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--implants",
+        type=int,
+        default=100,
+        help="Concurrent simulated implants. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=30.0,
+        help="Test duration in seconds, 0 to stop after --beacons. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--beacons",
+        type=int,
+        default=0,
+        help="Sessions per implant, 0 for no limit. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--beacon-interval",
+        type=float,
+        default=0.0,
+        help="Seconds between the sessions of an implant. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.2,
+        help="Beacon interval jitter, as a fraction. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        default=1.0,
+        help="Implants start spread over this many seconds. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--payload-size",
+        type=int,
+        default=64 << 10,
+        help="Bytes of a downloaded file or of a shell output. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30.0,
+        help="Deadline in seconds of every connect and receive. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--spread-sources",
+        action="store_true",
+        help="Give every implant its own 127.x.y.z source address (loopback "
+        "targets only), batch mode scripts each host once.",
+    )
+    parser.add_argument(
+        "--tls",
+        action="store_true",
+        help="Connect with TLS (emulator started with --tls on/auto).",
+    )
+    parser.add_argument(
+        "--fault-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of the sessions with an injected network fault. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--faults",
+        nargs="+",
+        choices=FAULTS,
+        default=list(FAULTS),
+        help="Faults to inject. (default: all)",
+    )
+    parser.add_argument(
+        "--stall-time",
+        type=float,
+        default=5.0,
+        help="Pause of the stall fault, in seconds. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between progress reports. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="Protocol profile (JSON) of the BugSleep variant, see bugsleep_profile. "
+        "(default: the 2024.10 sample)",
+    )
+    parser.add_argument(
+        "--increment",
+        type=int,
+        help="Increment used by the emulator, overrides the profile one (default: 3).",
+    )
+
+    args = parser.parse_args()
+
+    if args.duration <= 0 and args.beacons <= 0:
+        parser.error("set --duration and/or --beacons")
+    if args.profile is not None:
+        try:
+            PROFILE = load_profile(args.profile)
+        except (OSError, ValueError) as err:
+            parser.error(f"{args.profile}: {err}")
+    increment: int = PROFILE.increment if args.increment is None else args.increment
+
+    raise_open_files_limit(args.implants)
+    print(
+        f"[Load] {args.implants} implants -> {args.host}:{args.port}"
+        f"{' (TLS)' if args.tls else ''}, payload {args.payload_size} bytes"
+    )
+    load_stats = LoadStats()
+    try:
+        asyncio.run(run_load(args, increment, load_stats))
+    except KeyboardInterrupt:
+        print("\n[Load] Interrupted.")
+    load_stats.summary()
@@ -0,0 +1,918 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import random
+import socket
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+import BugSleepC2Emulator_file_download_upload as transfer
+import BugSleepC2Emulator_RevShell as revshell
+from bugsleep_net import ConnectionReader, Session
+from bugsleep_tls import is_tls_client_hello
+
+"""
+Fuzzing, conformance and throughput harness of the BugSleep frame codec
+used by the C2 emulators.
+
+    ./BugSleepProtocolHarness.py
+    ./BugSleepProtocolHarness.py --iterations 5000 --seed 1234
+    ./BugSleepProtocolHarness.py --only codec segmentation
+
+Checks:
+    codec          random messages and increments through pack_cmd, the
+                   length parsers and the encrypt/decrypt helpers, lengths
+                   around the 8/16/32-bit boundaries included
+    segmentation   random messages split in random segments (down to 1 byte)
+                   through ConnectionReader and recv_and_display_stdout,
+                   outputs with NUL runs (one at a time) and pipelined
+                   outputs with NULs and padding
+    handshake      reverse shell handshakes with random hello lengths, hello
+                   lengths above max_message_length refused unread
+    sniff          `--tls auto` detection: BugSleep hellos whose length
+                   header encodes as a TLS record header (19 and 65555
+                   bytes) stay raw, a real ClientHello is detected
+    transfer       download/upload sessions against a simulated implant,
+                   with paths longer than 255 bytes, downloads cut short by
+                   a closing or stalling implant saved as .partial.bin
+    framing        BlockFramer upload stream against the legacy per-block
+                   framing, random file sizes and batch sizes
+    throughput     codec MB/s, upload framing allocations (tracemalloc),
+                   peak memory and MB/s
+
+The harness plays the implant side: it encodes by subtracting the increment
+and decodes by subtracting it again, as BugSleep does. Every case is seeded
+from --seed, a failure prints the seed of the case to replay it.
+"""
+
+#! message lengths worth hitting on every run
+BOUNDARY_LENGTHS: Tuple[int, ...] = (
+    0,
+    1,
+    254,
+    255,
+    256,
+    257,
+    1020,
+    1024,
+    65535,
+    65536,
+    65537,
+)
+MAX_FUZZ_LENGTH: int = 70000
+#! implant side deadline, a desynchronised emulator fails instead of hanging
+IMPLANT_TIMEOUT: float = 10.0
+#! printable, no NUL (end of output marker) and no CR (stripped from outputs)
+ALPHABET: bytes = bytes(range(0x20, 0x7F)) + b"\n\t"
+
+
+def implant_encode(data: bytes, increment: int) -> bytes:
+    """
+    Encode `data` as the implant sends it.
+
+    :param data: Plain data.
+    :type data: bytes
+    :param increment: Increment value of the session.
+    :type increment: int
+    :return: Data on the wire.
+    :rtype: bytes
+    """
+    return bytes((b - increment) % 256 for b in data)
+
+
+#! the implant decodes the C2 messages the same way
+implant_decode = implant_encode
+
+
+def initial_message(command: int) -> bytes:
+    """
+    Phase 3 message expected by the implant for `command`, decrypted.
+    """
+    return (command + 1).to_bytes(4, byteorder="little")
+
+
+def random_length(rng: random.Random) -> int:
+    if rng.random() < 0.3:
+        return rng.choice(BOUNDARY_LENGTHS)
+    return rng.randrange(MAX_FUZZ_LENGTH)
+
+
+def random_text(rng: random.Random, length: int) -> bytes:
+    return bytes(rng.choice(ALPHABET) for _ in range(length))
+
+
+def random_nul_text(rng: random.Random, length: int, max_run: int) -> bytes:
+    """
+    Printable text with NUL runs of up to `max_run` bytes inside, never at
+    its ends (the emulator strips them from an output).
+    """
+    pieces = [random_text(rng, 1 + length // 5) for _ in range(rng.randint(2, 5))]
+    #! printable pieces between the runs, so the runs never merge
+    return (
+        b"".join(piece + b"\x00" * rng.randint(1, max_run) for piece in pieces[:-1])
+        + pieces[-1]
+    )
+
+
+def send_segmented(
+    sock: socket.socket, data: bytes, rng: random.Random, max_segment: int = 2048
+) -> None:
+    """
+    Send `data` in random segments, forcing short reads on the other side.
+    """
+    offset = 0
+    while offset < len(data):
+        size = 1 if rng.random() < 0.1 else rng.randint(1, max_segment)
+        sock.sendall(data[offset : offset + size])
+        offset += size
+
+
+def recv_all(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError(f"expected {size} bytes, got {len(data)}")
+        data += chunk
+    return bytes(data)
+
+
+class Results(object):
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.cases = 0
+        self.failures: List[str] = []
+        self.lock = threading.Lock()
+
+    def check(self, condition: bool, case_seed: int, message: str) -> None:
+        with self.lock:
+            if not condition:
+                self.failures.append(f"seed {case_seed}: {message}")
+
+    def report(self, elapsed: float) -> None:
+        print(
+            f"[Harness] {self.name}: {self.cases} cases, "
+            f"{len(self.failures)} failures ({elapsed:.2f}s)"
+        )
+        for failure in self.failures[:10]:
+            print(f"\t[Fail] {failure}")
+        if len(self.failures) > 10:
+            print(f"\t[Fail] ... {len(self.failures) - 10} more")
+
+
+def check_codec(results: Results, seeds: List[int]) -> None:
+    """
+    Round-trip random messages through the codec helpers.
+    """
+    for case_seed in seeds:
+        rng = random.Random(case_seed)
+        increment = rng.randrange(256)
+        length = random_length(rng)
+        results.cases += 1
+
+        command = random_text(rng, length).decode("ascii")
+        packed = revshell.pack_cmd(command, increment)
+        header = implant_decode(packed[:4], increment)
+        results.check(
+            int.from_bytes(header, byteorder="little") == length,
+            case_seed,
+            f"pack_cmd length {length} packed as {header.hex()} (increment {increment})",
+        )
+        results.check(
+            implant_decode(packed[4:], increment) == command.encode("ascii"),
+            case_seed,
+            f"pack_cmd payload of {length} bytes corrupted (increment {increment})",
+        )
+
+        wire_length = rng.choice((length, rng.randrange(1 << 32)))
+        wire_header = implant_encode(
+            wire_length.to_bytes(4, byteorder="little"), increment
+        )
+        for name, parse in (
+            ("parse_msg_length", revshell.parse_msg_length),
+            ("parse_message_length", transfer.parse_message_length),
+        ):
+            parsed = parse(wire_header, increment)
+            results.check(
+                parsed == wire_length,
+                case_seed,
+                f"{name} read {parsed} instead of {wire_length} (increment {increment})",
+            )
+
+        data = os.urandom(rng.randrange(4096))
+        for name, encrypt, decrypt in (
+            ("RevShell", revshell.encrypt_message, revshell.decrypt_message),
+            (
+                "download_upload",
+                transfer.encrypt_bytes_sent,
+                transfer.decrypt_bytes_received,
+            ),
+        ):
+            results.check(
+                implant_decode(encrypt(data, increment), increment) == data
+                and decrypt(implant_encode(data, increment), increment) == data,
+                case_seed,
+                f"{name} encrypt/decrypt not inverse of the implant codec",
+            )
+
+
+def check_segmentation(results: Results, seeds: List[int]) -> None:
+    """
+    Receive random messages split in random segments.
+    """
+    for case_seed in seeds:
+        rng = random.Random(case_seed)
+        increment = rng.randrange(256)
+        results.cases += 1
+        server, client = socket.socketpair()
+        client.settimeout(IMPLANT_TIMEOUT)
+        try:
+            #! length prefixed message, as the implant first message
+            payload = os.urandom(random_length(rng))
+            frame = len(payload).to_bytes(4, byteorder="little") + payload
+            sender = threading.Thread(
+                target=send_segmented,
+                args=(client, implant_encode(frame, increment), rng),
+            )
+            sender.start()
+            reader = ConnectionReader(server, 5.0)
+            length = revshell.parse_msg_length(reader.recv_exact(4), increment)
+            received = revshell.decrypt_message(reader.recv_exact(length), increment)
+            sender.join()
+            results.check(
+                received == payload,
+                case_seed,
+                f"segmented frame of {len(payload)} bytes received as {len(received)}",
+            )
+
+            #! shell output closed by the end of message marker
+            text = random_text(rng, random_length(rng))
+            sender = threading.Thread(
+                target=send_segmented,
+                args=(client, implant_encode(text + b"\x00" * 4, increment), rng),
+            )
+            sender.start()
+            sink = io.StringIO()
+            completed = revshell.recv_and_display_stdout(server, increment, sink=sink)
+            sender.join()
+            results.check(
+                completed and sink.getvalue() == text.decode("ascii") + "\n",
+                case_seed,
+                f"segmented output of {len(text)} bytes not received as sent",
+            )
+
+            #! NUL runs longer than the marker, and zero padding after it:
+            #! one command at a time, the output only ends with a chunk
+            text = random_nul_text(rng, rng.randrange(1, 900), max_run=8)
+            padded = text + b"\x00" * (4 + rng.randrange(8))
+            client.sendall(implant_encode(padded, increment))
+            sink = io.StringIO()
+            completed = revshell.recv_and_display_stdout(server, increment, sink=sink)
+            results.check(
+                completed and sink.getvalue() == text.decode("ascii") + "\n",
+                case_seed,
+                f"output of {len(text)} bytes with NUL runs cut short",
+            )
+
+            #! pipelined outputs back to back, NULs inside and padding after
+            texts = [
+                random_nul_text(rng, rng.randrange(1, 3000), max_run=3)
+                for _ in range(rng.randint(2, 6))
+            ]
+            stream = b"".join(t + b"\x00" * (4 + rng.randrange(4)) for t in texts)
+            sender = threading.Thread(
+                target=send_segmented,
+                args=(client, implant_encode(stream, increment), rng),
+            )
+            sender.start()
+            leftover = bytearray()
+            received_texts = []
+            for _ in texts:
+                sink = io.StringIO()
+                if not revshell.recv_and_display_stdout(
+                    server, increment, sink=sink, leftover=leftover
+                ):
+                    break
+                received_texts.append(sink.getvalue())
+            sender.join()
+            results.check(
+                received_texts == [t.decode("ascii") + "\n" for t in texts]
+                and not leftover,
+                case_seed,
+                f"{len(texts)} pipelined outputs with NULs received out of step",
+            )
+        finally:
+            server.close()
+            client.close()
+
+
+def parallel(cases: List[Callable[[], None]]) -> None:
+    """
+    Run `cases` concurrently, each session waits 1s in its handshake.
+    """
+    threads = [threading.Thread(target=case) for case in cases]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def check_handshake(results: Results, seeds: List[int]) -> None:
+    """
+    Run reverse shell handshakes with random hello messages.
+    """
+
+    def case(case_seed: int) -> None:
+        rng = random.Random(case_seed)
+        increment = rng.randrange(256)
+        server, client = socket.socketpair()
+        client.settimeout(IMPLANT_TIMEOUT)
+        outcome: List[bool] = []
+        handler = threading.Thread(
+            target=lambda: outcome.append(
+                revshell.client_handshake(
+                    server, increment, Session(case_seed, server, ("harness", 0))
+                )
+            )
+        )
+        handler.start()
+        try:
+            hello = random_text(rng, random_length(rng))
+            send_segmented(
+                client,
+                implant_encode(
+                    len(hello).to_bytes(4, byteorder="little") + hello, increment
+                ),
+                rng,
+            )
+            recv_all(client, 4)
+            message = recv_all(client, 4)
+            handler.join()
+            results.check(
+                outcome == [True],
+                case_seed,
+                f"handshake with a {len(hello)} bytes hello failed",
+            )
+            results.check(
+                implant_decode(message, increment) == initial_message(0x2),
+                case_seed,
+                f"unexpected initial message {message.hex()} (increment {increment})",
+            )
+        except Exception as err:
+            results.check(False, case_seed, f"handshake: {err!r}")
+        finally:
+            client.close()
+            handler.join()
+            server.close()
+
+    def oversized(
+        case_seed: int, handler: Callable[[socket.socket, int], object]
+    ) -> None:
+        rng = random.Random(case_seed)
+        increment = rng.randrange(256)
+        length = rng.choice(
+            (revshell.PROFILE.max_message_length + 1, rng.randrange(1 << 21, 1 << 32))
+        )
+        server, client = socket.socketpair()
+        client.settimeout(IMPLANT_TIMEOUT)
+        try:
+            #! only the header, reading the body would wait for RECV_TIMEOUT_S
+            client.sendall(
+                implant_encode(length.to_bytes(4, byteorder="little"), increment)
+            )
+            start = time.perf_counter()
+            outcome = handler(server, increment)
+            elapsed = time.perf_counter() - start
+            server.close()
+            results.check(
+                outcome is not True and elapsed < 1.0 and client.recv(1) == b"",
+                case_seed,
+                f"hello length {length} above the limit not refused "
+                f"({elapsed:.2f}s, increment {increment})",
+            )
+        except Exception as err:
+            results.check(False, case_seed, f"oversized hello: {err!r}")
+        finally:
+            server.close()
+            client.close()
+
+    results.cases += len(seeds) + 2
+    with contextlib.redirect_stdout(io.StringIO()):
+        parallel([lambda case_seed=case_seed: case(case_seed) for case_seed in seeds])
+        oversized(
+            seeds[0],
+            lambda server, increment: revshell.client_handshake(
+                server, increment, Session(seeds[0], server, ("harness", 0))
+            ),
+        )
+        oversized(
+            seeds[-1],
+            lambda server, increment: transfer.handle_client_connection(
+                server, increment, 0x0, "C:\\x"
+            ),
+        )
+
+
+#! hello lengths whose header encodes as `16 03 0x` with increment -3/3
+TLS_LOOKALIKE_LENGTHS: Tuple[int, ...] = (19, 65555)
+
+
+def check_sniff(results: Results, seeds: List[int]) -> None:
+    """
+    Peek at BugSleep hellos and at a real ClientHello as `--tls auto` does.
+    """
+
+    def sniff(data: bytes) -> bool:
+        server, client = socket.socketpair()
+        try:
+            client.sendall(data)
+            return is_tls_client_hello(server, 2.0)
+        finally:
+            server.close()
+            client.close()
+
+    for case_seed in seeds:
+        rng = random.Random(case_seed)
+        length = rng.choice(TLS_LOOKALIKE_LENGTHS + (random_length(rng),))
+        increment = rng.choice((3, 253, rng.randrange(256)))
+        results.cases += 1
+        #! the whole first message, as the implant sends it
+        hello = random_text(rng, min(length, 1024))
+        frame = implant_encode(
+            length.to_bytes(4, byteorder="little") + hello, increment
+        )
+        results.check(
+            not sniff(frame),
+            case_seed,
+            f"{length} bytes hello (increment {increment}, header {frame[:6].hex()}) "
+            "taken for TLS",
+        )
+
+    #! a ClientHello of the ssl module, the handshake itself never completes
+    results.cases += 1
+    server, client = socket.socketpair()
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    client.settimeout(2.0)
+    tls_client = context.wrap_socket(client, do_handshake_on_connect=False)
+    handshake = threading.Thread(target=lambda: _ignore_errors(tls_client.do_handshake))
+    handshake.start()
+    try:
+        detected = is_tls_client_hello(server, 2.0)
+    finally:
+        server.close()
+        handshake.join()
+        tls_client.close()
+    results.check(detected, 0, "ClientHello not detected")
+
+
+def _ignore_errors(function: Callable[[], None]) -> None:
+    try:
+        function()
+    except (OSError, ValueError):
+        pass
+
+
+def implant_session(
+    client: socket.socket, increment: int, rng: random.Random
+) -> Tuple[bytes, str]:
+    """
+    Implant side of the download/upload handshake.
+
+    :return: (initial message, decoded path) sent by the C2.
+    :rtype: Tuple[bytes, str]
+    """
+    hello = b"D3SKT0P-T0A11ER/Us3R"
+    send_segmented(
+        client,
+        implant_encode(len(hello).to_bytes(4, byteorder="little") + hello, increment),
+        rng,
+    )
+    recv_all(client, 4)
+    message = recv_all(client, 4)
+    size = int.from_bytes(implant_decode(recv_all(client, 4), increment), "little")
+    path = implant_decode(recv_all(client, size), increment).decode("utf-16le")
+    return message, path
+
+
+def random_path(rng: random.Random) -> str:
+    #! long enough, as UTF-16, to overflow a 1-byte length
+    depth = rng.randint(1, 40)
+    return "C:\\" + "\\".join(
+        random_text(rng, rng.randint(1, 12)).decode().replace("\\", "_").strip() or "d"
+        for _ in range(depth)
+    )
+
+
+def check_transfer(results: Results, seeds: List[int], workdir: str) -> None:
+    """
+    Download and upload sessions against a simulated implant.
+    """
+
+    def download(case_seed: int, cut: Optional[str] = None) -> None:
+        rng = random.Random(case_seed)
+        increment = rng.randrange(256)
+        remote_path = os.path.normpath(random_path(rng))
+        content = os.urandom(rng.randrange(2, 64 << 10))
+        #! the implant closes or stalls after `sent` bytes of the file
+        sent = rng.randrange(1, len(content)) if cut else len(content)
+        server, client = socket.socketpair()
+        client.settimeout(IMPLANT_TIMEOUT)
+        handler = threading.Thread(
+            target=transfer.handle_client_connection,
+            args=(server, increment, 0x0, remote_path),
+        )
+        handler.start()
+        try:
+            message, path = implant_session(client, increment, rng)
+            results.check(
+                implant_decode(message, increment) == initial_message(0x0),
+                case_seed,
+                f"unexpected download initial message {message.hex()}",
+            )
+            results.check(
+                path == remote_path,
+                case_seed,
+                f"download path of {len(remote_path)} chars received as {len(path)}",
+            )
+            blocks, last_block_size = divmod(len(content), 1024)
+            if last_block_size:
+                blocks += 1
+            else:
+                last_block_size = 1024
+            header = (
+                (1).to_bytes(4, "little")
+                + (0).to_bytes(4, "little")
+                + blocks.to_bytes(8, "little")
+                + last_block_size.to_bytes(4, "little")
+            )
+            send_segmented(
+                client, implant_encode(header + content[:sent], increment), rng
+            )
+            if cut == "close":
+                client.close()
+            handler.join()
+            saved = os.path.join(
+                workdir,
+                f"{hashlib.sha1(content[:sent]).hexdigest()}"
+                + (".partial.bin" if cut else ".bin"),
+            )
+            with open(saved, "rb") as file:
+                results.check(
+                    file.read() == content[:sent],
+                    case_seed,
+                    f"downloaded file of {sent}/{len(content)} bytes "
+                    f"({cut or 'complete'}) corrupted",
+                )
+            os.remove(saved)
+        except Exception as err:
+            results.check(False, case_seed, f"download: {err!r}")
+        finally:
+            client.close()
+            handler.join()
+
+    def upload(case_seed: int) -> None:
+        rng = random.Random(case_seed)
+        increment = rng.randrange(256)
+        drop_location = os.path.normpath(random_path(rng))
+        content = os.urandom(rng.randrange(64 << 10))
+        file_path = os.path.join(workdir, f"upload_{case_seed}.bin")
+        with open(file_path, "wb") as file:
+            file.write(content)
+        server, client = socket.socketpair()
+        client.settimeout(IMPLANT_TIMEOUT)
+        handler = threading.Thread(
+            target=transfer.handle_client_connection,
+            args=(server, increment, 0x1, None, drop_location, file_path),
+        )
+        handler.start()
+        try:
+            message, path = implant_session(client, increment, rng)
+            results.check(
+                implant_decode(message, increment) == initial_message(0x1),
+                case_seed,
+                f"unexpected upload initial message {message.hex()}",
+            )
+            results.check(
+                path == drop_location,
+                case_seed,
+                f"upload path of {len(drop_location)} chars received as {len(path)}",
+            )
+            client.sendall(
+                implant_encode(
+                    (1).to_bytes(4, "little") + (1).to_bytes(4, "little"), increment
+                )
+            )
+            total_blocks = int.from_bytes(
+                implant_decode(recv_all(client, 4), increment), "little"
+            )
+            padded_last_block_size = int.from_bytes(
+                implant_decode(recv_all(client, 4), increment), "little"
+            )
+            received = bytearray()
+            for block_number in range(total_blocks):
+                size = (
+                    1024
+                    if block_number < total_blocks - 1
+                    else padded_last_block_size + 4
+                )
+                block = implant_decode(recv_all(client, size), increment)
+                results.check(
+                    int.from_bytes(block[:4], "little") == block_number,
+                    case_seed,
+                    f"block {block_number} sent with index {block[:4].hex()}",
+                )
+                received += block[4:]
+            results.check(
+                bytes(received[: len(content)]) == content
+                and received[len(content) :] == b"\x00" * 4,
+                case_seed,
+                f"uploaded file of {len(content)} bytes corrupted",
+            )
+        except Exception as err:
+            results.check(False, case_seed, f"upload: {err!r}")
+        finally:
+            client.close()
+            handler.join()
+            os.remove(file_path)
+
+    cases: List[Callable[[], None]] = []
+    for index, case_seed in enumerate(seeds):
+        function = download if index % 2 == 0 else upload
+        cases.append(lambda function=function, case_seed=case_seed: function(case_seed))
+    results.cases += len(cases) + 2
+    with contextlib.redirect_stdout(io.StringIO()):
+        parallel(cases)
+        download(seeds[0], "close")
+        #! sequential, the stalled download waits for the patched deadline
+        recv_timeout = transfer.RECV_TIMEOUT_S
+        transfer.RECV_TIMEOUT_S = 0.5
+        try:
+            download(seeds[-1], "stall")
+        finally:
+            transfer.RECV_TIMEOUT_S = recv_timeout
+
+
+class SinkSocket(object):
+    """
+    sendall target of the framing check and benchmark.
+
+    With `filenames`, every send counts the memory blocks allocated from
+    those files and still alive (tracemalloc must be tracing).
+    """
+
+    def __init__(self, keep: bool = True, filenames: Tuple[str, ...] = ()) -> None:
+        self.keep = keep
+        self.data = bytearray()
+        self.size = 0
+        self.filenames = filenames
+        self.baseline = 0
+        self.allocations = 0
+
+    def live_allocations(self) -> int:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, filename) for filename in self.filenames]
+        )
+        return len(snapshot.traces)
+
+    def sendall(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.keep:
+            self.data += data
+        if self.filenames:
+            self.allocations += self.live_allocations() - self.baseline
+
+
+def legacy_send_file(
+    client_socket: SinkSocket, file_content: bytes, increment: int
+) -> None:
+    """
+    Upload blocks framed one by one, as function_for_hex_1 did before
+    BlockFramer: reference of the framing check and benchmark.
+    """
+    content_size = 1020
+    full_blocks = len(file_content) // content_size
+    last_block_size = len(file_content) % content_size
+    for block_number in range(full_blocks):
+        block_header = block_number.to_bytes(4, byteorder="little")
+        start = block_number * content_size
+        end = start + content_size
+        block_content = file_content[start:end]
+        block_data = block_header + block_content
+        encrypted_block_data = transfer.encrypt_bytes_sent(block_data, increment)
+        client_socket.sendall(encrypted_block_data)
+
+    last_block_content = file_content[-last_block_size:] if last_block_size > 0 else b""
+    padded_last_block_content = last_block_content + b"\x00" * 4
+    last_block_header = full_blocks.to_bytes(4, byteorder="little")
+    last_block_data = last_block_header + padded_last_block_content
+    client_socket.sendall(transfer.encrypt_bytes_sent(last_block_data, increment))
+
+
+def framer_send_file(
+    client_socket: SinkSocket, file: BinaryIO, increment: int, batch_blocks: int
+) -> None:
+    file.seek(0, os.SEEK_END)
+    full_blocks, last_block_size = divmod(file.tell(), transfer.PROFILE.content_size)
+    file.seek(0)
+    transfer.BlockFramer(increment, batch_blocks).send_file(
+        client_socket, file, full_blocks, last_block_size
+    )
+
+
+def check_framing(results: Results, seeds: List[int], workdir: str) -> None:
+    """
+    BlockFramer sends the same stream as the legacy per-block framing.
+    """
+    content_size = transfer.PROFILE.content_size
+    path = os.path.join(workdir, "framing.bin")
+    for case_seed in seeds:
+        rng = random.Random(case_seed)
+        increment = rng.randrange(256)
+        batch_blocks = rng.randint(1, 80)
+        blocks = rng.choice((0, 1, batch_blocks, rng.randrange(300)))
+        size = max(0, blocks * content_size + rng.choice((-4, -3, -1, 0, 1, 4, 500)))
+        content = os.urandom(size)
+        results.cases += 1
+
+        legacy = SinkSocket()
+        legacy_send_file(legacy, content, increment)
+        with open(path, "wb") as file:
+            file.write(content)
+        framed = SinkSocket()
+        with open(path, "rb") as file:
+            framer_send_file(framed, file, increment, batch_blocks)
+        results.check(
+            framed.data == legacy.data,
+            case_seed,
+            f"{size} bytes file framed differently ({batch_blocks} blocks batches)",
+        )
+    os.remove(path)
+
+
+def measure_framing(size: int, workdir: str) -> None:
+    """
+    Print the allocations, peak memory and throughput of the upload framing.
+    """
+    path = os.path.join(workdir, "framing.bin")
+    with open(path, "wb") as file:
+        file.write(os.urandom(size))
+    blocks = size // transfer.PROFILE.content_size + 1
+    filenames = (__file__, transfer.__file__)
+
+    def legacy(sink: SinkSocket, traced: bool) -> None:
+        with open(path, "rb") as file:
+            #! the legacy framing loads the whole file
+            if traced:
+                tracemalloc.start()
+                sink.baseline = sink.live_allocations()
+            legacy_send_file(sink, file.read(), 3)
+
+    def framer(sink: SinkSocket, traced: bool) -> None:
+        with open(path, "rb") as file:
+            if traced:
+                tracemalloc.start()
+                sink.baseline = sink.live_allocations()
+            framer_send_file(sink, file, 3, 64)
+
+    for name, run in (("legacy", legacy), ("BlockFramer", framer)):
+        sink = SinkSocket(keep=False)
+        start = time.perf_counter()
+        run(sink, False)
+        elapsed = time.perf_counter() - start
+
+        sink = SinkSocket(keep=False, filenames=filenames)
+        try:
+            run(sink, True)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        print(
+            f"[Harness] framing {name:<12} {blocks} blocks, "
+            f"{sink.allocations / blocks:6.3f} live allocations/block at send, "
+            f"peak {peak / 1024:9.1f} KB, {size / elapsed / (1 << 20):8.2f} MB/s"
+        )
+    os.remove(path)
+
+
+def measure_throughput(size: int) -> None:
+    """
+    Print the codec throughput over `size` bytes.
+    """
+    data = os.urandom(size)
+    command = random_text(random.Random(0), size).decode("ascii")
+    header = implant_encode(size.to_bytes(4, byteorder="little"), 3)
+
+    def timed(name: str, function: Callable[[], object], volume: int) -> None:
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        print(
+            f"[Harness] throughput {name:<24} {volume / elapsed / (1 << 20):10.2f} MB/s"
+        )
+
+    timed("encrypt_message", lambda: revshell.encrypt_message(data, 3), size)
+    timed("decrypt_message", lambda: revshell.decrypt_message(data, 3), size)
+    timed("encrypt_bytes_sent", lambda: transfer.encrypt_bytes_sent(data, 3), size)
+    timed("pack_cmd", lambda: revshell.pack_cmd(command, 3), size)
+    timed(
+        "parse_msg_length x 100k",
+        lambda: [revshell.parse_msg_length(header, 3) for _ in range(100000)],
+        4 * 100000,
+    )
+
+
+CHECKS = (
+    "codec",
+    "segmentation",
+    "handshake",
+    "sniff",
+    "transfer",
+    "framing",
+    "throughput",
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="BugSleep frame codec fuzzing, conformance and throughput harness"
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=CHECKS,
+        default=list(CHECKS),
+        help="Checks to run. (default: all)",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=500,
+        help="Random cases of the codec and segmentation checks. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        default=16,
+        help="Concurrent handshake and transfer sessions. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed of the run, random if missing.",
+    )
+    parser.add_argument(
+        "--throughput-size",
+        type=int,
+        default=4 << 20,
+        help="Bytes encoded by the throughput check. (default: %(default)s)",
+    )
+
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    print(f"[Harness] seed {seed}")
+    run_rng = random.Random(seed)
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        #! the download emulator saves files in the working directory
+        os.chdir(workdir)
+        for name in args.only:
+            if name == "throughput":
+                measure_throughput(args.throughput_size)
+                measure_framing(min(args.throughput_size, 1 << 20), workdir)
+                continue
+            count = (
+                args.sessions if name in ("handshake", "transfer") else args.iterations
+            )
+            seeds = [run_rng.randrange(1 << 32) for _ in range(count)]
+            results = Results(name)
+            start = time.perf_counter()
+            if name == "codec":
+                check_codec(results, seeds)
+            elif name == "segmentation":
+                check_segmentation(results, seeds)
+            elif name == "handshake":
+                check_handshake(results, seeds)
+            elif name == "sniff":
+                check_sniff(results, seeds)
+            elif name == "transfer":
+                check_transfer(results, seeds, workdir)
+            elif name == "framing":
+                check_framing(results, seeds, workdir)
+            results.report(time.perf_counter() - start)
+            failures += len(results.failures)
+        os.chdir(os.path.dirname(workdir))
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from typing import List, Tuple
+
+from bugsleep_net import (
+    ConnectionReader,
+    RecvTimeoutError,
+    ShortReadError,
+    recv_exact,
+    recv_exact_into,
+)
+
+"""
+Loopback stress test of the exact-size receive helpers of bugsleep_net.
+
+    ./BugSleepRecvStress.py
+    ./BugSleepRecvStress.py --messages 20000 --seed 1234
+
+A sender thread writes length prefixed messages over a loopback TCP
+connection (Nagle disabled) in random segments, down to 1 byte, with short
+pauses so the receiver sees them as separate reads. The receiver reads them
+back with `ConnectionReader` (one buffer per connection) and
+`recv_exact_into`/`recv_exact`, then checks a peer closing mid-message
+(ShortReadError with the received count) and a stalled peer (deadline,
+RecvTimeoutError with the received count).
+"""
+
+#! receiver deadline, a lost byte fails the run instead of hanging it
+STRESS_TIMEOUT: float = 10.0
+MAX_MESSAGE_LENGTH: int = 70000
+
+
+def loopback_pair() -> Tuple[socket.socket, socket.socket]:
+    """
+    Connected loopback TCP sockets, Nagle disabled on the sending side.
+
+    :return: Receiving and sending sockets.
+    :rtype: Tuple[socket.socket, socket.socket]
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        sender = socket.create_connection(listener.getsockname())
+        receiver, _ = listener.accept()
+    sender.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return receiver, sender
+
+
+def send_fragmented(sock: socket.socket, data: bytes, rng: random.Random) -> None:
+    """
+    Send `data` in random segments, pausing now and then so they are not
+    coalesced before the receiver reads them.
+    """
+    offset = 0
+    while offset < len(data):
+        size = 1 if rng.random() < 0.2 else rng.randint(1, 1500)
+        sock.sendall(data[offset : offset + size])
+        offset += size
+        if rng.random() < 0.05:
+            time.sleep(0.0005)
+
+
+def stress_messages(count: int, seed: int) -> List[str]:
+    """
+    Send `count` random messages fragmented over loopback and read them back.
+
+    :return: Failure descriptions.
+    :rtype: List[str]
+    """
+    rng = random.Random(seed)
+    messages = [
+        os.urandom(rng.choice((0, 1, 3, 4, 5, rng.randrange(MAX_MESSAGE_LENGTH))))
+        for _ in range(count)
+    ]
+    failures: List[str] = []
+    receiver, sender = loopback_pair()
+    stream = b"".join(len(m).to_bytes(4, byteorder="little") + m for m in messages)
+    thread = threading.Thread(
+        target=send_fragmented, args=(sender, stream, random.Random(seed + 1))
+    )
+    thread.start()
+    try:
+        reader = ConnectionReader(receiver, STRESS_TIMEOUT, buffer_size=4)
+        header = bytearray(4)
+        for index, message in enumerate(messages):
+            #! alternate the helpers, they share the same receive loop
+            if index % 2:
+                recv_exact_into(receiver, memoryview(header), STRESS_TIMEOUT)
+                length = int.from_bytes(header, byteorder="little")
+                received = recv_exact(receiver, length, STRESS_TIMEOUT)
+            else:
+                length = int.from_bytes(reader.recv_exact(4), byteorder="little")
+                received = bytes(reader.recv_exact(length))
+            if received != message:
+                failures.append(
+                    f"message {index}: {len(message)} bytes sent, "
+                    f"{len(received)} received or corrupted"
+                )
+                break
+    finally:
+        thread.join()
+        sender.close()
+        receiver.close()
+    return failures
+
+
+def check_short_read(seed: int) -> List[str]:
+    """
+    Close the sending side mid-message.
+
+    :return: Failure descriptions.
+    :rtype: List[str]
+    """
+    rng = random.Random(seed)
+    size = rng.randint(2, 8192)
+    sent = rng.randrange(1, size)
+    receiver, sender = loopback_pair()
+    try:
+        send_fragmented(sender, b"\x41" * sent, rng)
+        sender.close()
+        reader = ConnectionReader(receiver, STRESS_TIMEOUT)
+        try:
+            reader.recv_exact(size)
+        except ShortReadError as err:
+            if (err.expected, err.received) != (size, sent):
+                return [
+                    f"short read reported {err.received}/{err.expected}, "
+                    f"expected {sent}/{size}"
+                ]
+            if bytes(reader.view[:sent]) != b"\x41" * sent:
+                return ["short read lost the bytes that arrived"]
+            return []
+        return [f"{sent}/{size} bytes read as a full message"]
+    finally:
+        receiver.close()
+
+
+def check_deadline(timeout: float = 0.2) -> List[str]:
+    """
+    A peer that stalls mid-message hits the deadline, even when it keeps
+    trickling bytes.
+
+    :return: Failure descriptions.
+    :rtype: List[str]
+    """
+    receiver, sender = loopback_pair()
+    stop = threading.Event()
+
+    def trickle() -> None:
+        while not stop.wait(timeout / 4):
+            try:
+                sender.sendall(b"\x00")
+            except OSError:
+                break
+
+    thread = threading.Thread(target=trickle)
+    thread.start()
+    start = time.monotonic()
+    try:
+        recv_exact(receiver, 1 << 16, timeout)
+    except socket.timeout as err:
+        elapsed = time.monotonic() - start
+        if elapsed > timeout * 5:
+            return [f"deadline of {timeout}s expired after {elapsed:.2f}s"]
+        if not isinstance(err, RecvTimeoutError) or not err.received:
+            return [f"deadline did not report the bytes received: {err!r}"]
+        if receiver.gettimeout() is not None:
+            return ["socket timeout not restored after the deadline"]
+        return []
+    finally:
+        stop.set()
+        thread.join()
+        sender.close()
+        receiver.close()
+    return ["stalled read did not time out"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Loopback fragmentation stress test of bugsleep_net.recv_exact"
+    )
+    parser.add_argument(
+        "--messages",
+        type=int,
+        default=2000,
+        help="Messages sent over the loopback connection. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed of the run, random if missing.",
+    )
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    print(f"[Stress] seed {seed}")
+    failures = 0
+    for name, check in (
+        ("fragmented messages", lambda: stress_messages(args.messages, seed)),
+        ("short read", lambda: check_short_read(seed)),
+        ("deadline", check_deadline),
+    ):
+        start = time.monotonic()
+        check_failures = check()
+        print(
+            f"[Stress] {name}: {len(check_failures)} failures "
+            f"({time.monotonic() - start:.2f}s)"
+        )
+        for failure in check_failures:
+            print(f"\t[Fail] {failure}")
+        failures += len(check_failures)
+    sys.exit(1 if failures else 0)
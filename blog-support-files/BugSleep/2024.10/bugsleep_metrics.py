@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Tuple
+
+import bugsleep_profile
+
+"""
+Live metrics of the BugSleep C2 emulators, in the Prometheus text format.
+
+    ./BugSleepC2Emulator_RevShell.py --metrics-port 9464
+    curl http://127.0.0.1:9464/metrics
+
+Exposed metrics:
+    bugsleep_sessions_active               sessions being handled
+    bugsleep_sessions_total                sessions accepted
+    bugsleep_handshakes_total              completed handshakes (use rate())
+    bugsleep_bytes_total{command,direction}
+    bugsleep_phase_seconds{phase}          latency histogram (the handshake
+                                           one without the profile
+                                           handshake_delay)
+    bugsleep_cipher_bytes_total            bytes through bugsleep_profile.cipher
+    bugsleep_cipher_seconds_total          time spent in bugsleep_profile.cipher
+
+Counters are integer updates under the metrics lock in the hot paths (the
+sessions run in threads); they are only formatted when the endpoint is
+scraped.
+"""
+
+#! latency histogram buckets (seconds)
+PHASE_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+COMMAND_LABELS: Dict[int, str] = {0x0: "0x0", 0x1: "0x1"}
+
+
+class Histogram(object):
+    def __init__(self, buckets: Tuple[float, ...] = PHASE_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics(object):
+    """
+    Emulator counters, gauges and histograms.
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.sessions_active = 0
+        self.sessions_total = 0
+        self.handshakes_total = 0
+        #! (command, direction) -> one item list, updated in place by MeteredSocket
+        self.bytes_total: Dict[Tuple[str, str], List[int]] = {}
+        self.phases: Dict[str, Histogram] = {}
+        self.cipher_bytes = 0
+        self.cipher_seconds = 0.0
+
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        """
+        Track a client session for the duration of the block.
+        """
+        with self.lock:
+            self.sessions_active += 1
+            self.sessions_total += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.sessions_active -= 1
+
+    def handshake(self) -> None:
+        with self.lock:
+            self.handshakes_total += 1
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Add a `seconds` sample to the `name` phase histogram.
+        """
+        with self.lock:
+            if name not in self.phases:
+                self.phases[name] = Histogram()
+            self.phases[name].observe(seconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Observe the duration of the block in the `name` phase histogram.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def byte_counter(self, command: str, direction: str) -> List[int]:
+        """
+        Counter cell of the bytes of `command` going `direction` (in/out).
+        """
+        with self.lock:
+            return self.bytes_total.setdefault((command, direction), [0])
+
+    def observe_cipher(self, size: int, seconds: float) -> None:
+        """
+        Account `size` bytes translated in `seconds`.
+        """
+        with self.lock:
+            self.cipher_bytes += size
+            self.cipher_seconds += seconds
+
+    def meter_cipher(self) -> None:
+        """
+        Measure the throughput of every bugsleep_profile.cipher call.
+        """
+        bugsleep_profile.CIPHER_METER = self.observe_cipher
+
+    def render(self) -> str:
+        """
+        Format the metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            lines = [
+                "# TYPE bugsleep_sessions_active gauge",
+                f"bugsleep_sessions_active {self.sessions_active}",
+                "# TYPE bugsleep_sessions_total counter",
+                f"bugsleep_sessions_total {self.sessions_total}",
+                "# TYPE bugsleep_handshakes_total counter",
+                f"bugsleep_handshakes_total {self.handshakes_total}",
+                "# TYPE bugsleep_bytes_total counter",
+            ]
+            bytes_total = sorted(self.bytes_total.items())
+            phases = sorted(self.phases.items())
+            cipher_bytes, cipher_seconds = self.cipher_bytes, self.cipher_seconds
+        for (command, direction), cell in bytes_total:
+            lines.append(
+                f'bugsleep_bytes_total{{command="{command}",direction="{direction}"}} '
+                f"{cell[0]}"
+            )
+        lines.append("# TYPE bugsleep_phase_seconds histogram")
+        for name, histogram in phases:
+            cumulative = 0
+            for bucket, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'bugsleep_phase_seconds_bucket{{phase="{name}",le="{bucket}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(
+                f'bugsleep_phase_seconds_bucket{{phase="{name}",le="+Inf"}} '
+                f"{histogram.count}"
+            )
+            lines.append(
+                f'bugsleep_phase_seconds_sum{{phase="{name}"}} {histogram.total}'
+            )
+            lines.append(
+                f'bugsleep_phase_seconds_count{{phase="{name}"}} {histogram.count}'
+            )
+        lines.extend(
+            [
+                "# TYPE bugsleep_cipher_bytes_total counter",
+                f"bugsleep_cipher_bytes_total {cipher_bytes}",
+                "# TYPE bugsleep_cipher_seconds_total counter",
+                f"bugsleep_cipher_seconds_total {cipher_seconds}",
+            ]
+        )
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str, port: int) -> ThreadingHTTPServer:
+        """
+        Serve `/metrics` from a daemon thread.
+
+        :param host: Address to bind to, keep it local.
+        :type host: str
+        :param port: Port to bind to.
+        :type port: int
+        :return: The running HTTP server.
+        :rtype: ThreadingHTTPServer
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class NullMetrics(object):
+    """
+    Disabled metrics, same interface as Metrics.
+    """
+
+    enabled = False
+
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        yield
+
+    def handshake(self) -> None:
+        pass
+
+    def observe(self, name: str, seconds: float) -> None:
+        pass
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        yield
+
+
+class MeteredSocket(object):
+    """
+    Socket proxy counting the bytes received and sent.
+    """
+
+    def __init__(self, client_socket: Any, metrics: Metrics, command: str) -> None:
+        self._socket = client_socket
+        #! the counter cells are shared by the sessions of the same command
+        self._lock = metrics.lock
+        self._bytes_in = metrics.byte_counter(command, "in")
+        self._bytes_out = metrics.byte_counter(command, "out")
+
+    def recv(self, size: int, *args: Any) -> bytes:
+        data = self._socket.recv(size, *args)
+        with self._lock:
+            self._bytes_in[0] += len(data)
+        return data
+
+    def recv_into(self, buffer: Any, size: int = 0, *args: Any) -> int:
+        count = self._socket.recv_into(buffer, size, *args)
+        with self._lock:
+            self._bytes_in[0] += count
+        return count
+
+    def sendall(self, data: bytes, *args: Any) -> None:
+        self._socket.sendall(data, *args)
+        with self._lock:
+            self._bytes_out[0] += len(data)
+
+    def send(self, data: bytes, *args: Any) -> int:
+        count = self._socket.send(data, *args)
+        with self._lock:
+            self._bytes_out[0] += count
+        return count
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._socket, name)
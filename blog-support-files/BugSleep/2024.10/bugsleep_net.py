@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import select
+import signal
+import socket
+import ssl
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+"""
+Socket helpers shared by the BugSleep C2 emulators.
+
+`socket.recv(n)` returns as soon as *some* data is available, so a single
+call can hand back less than the `n` bytes a BugSleep message is made of
+when segments get split on the way. `recv_exact` keeps reading until the
+whole message is there, the peer closes or the deadline expires.
+
+`WorkerPool` runs the emulators accept loop in several processes,
+`SessionRegistry` reaps idle or dead client sessions.
+"""
+
+#! default deadline (seconds) for a single fixed-size message
+RECV_TIMEOUT: float = 30.0
+#! workers exiting sooner (seconds) are not respawned, see WorkerPool
+WORKER_MIN_UPTIME: float = 1.0
+#! sessions without network activity for longer (seconds) are reaped
+SESSION_IDLE_TIMEOUT: float = 300.0
+
+
+class ShortReadError(ConnectionError):
+    """
+    The peer closed the connection before a full message was received.
+    """
+
+    def __init__(self, expected: int, received: int) -> None:
+        super().__init__(f"connection closed after {received}/{expected} bytes")
+        self.expected = expected
+        self.received = received
+
+
+class RecvTimeoutError(socket.timeout):
+    """
+    The deadline expired before a full message was received.
+    """
+
+    def __init__(self, expected: int, received: int) -> None:
+        super().__init__(f"timed out after {received}/{expected} bytes")
+        self.expected = expected
+        self.received = received
+
+
+def recv_exact_into(
+    client_socket: socket.socket,
+    view: memoryview,
+    timeout: Optional[float] = RECV_TIMEOUT,
+) -> None:
+    """
+    Fill `view` with exactly `len(view)` bytes read from the socket.
+
+    :param client_socket: Client socket.
+    :type client_socket: socket.socket
+    :param view: Writable buffer to fill.
+    :type view: memoryview
+    :param timeout: Deadline in seconds for the whole read, None to wait forever.
+    :type timeout: Optional[float]
+    :raises ShortReadError: The peer closed the connection first.
+    :raises RecvTimeoutError: The deadline expired first (a socket.timeout).
+    """
+    size = len(view)
+    received = 0
+    previous_timeout = client_socket.gettimeout()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    try:
+        while received < size:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RecvTimeoutError(size, received)
+                client_socket.settimeout(remaining)
+            try:
+                count = client_socket.recv_into(view[received:], size - received)
+            except socket.timeout:
+                raise RecvTimeoutError(size, received) from None
+            if count == 0:
+                raise ShortReadError(size, received)
+            received += count
+    finally:
+        client_socket.settimeout(previous_timeout)
+
+
+def recv_exact(
+    client_socket: socket.socket, size: int, timeout: Optional[float] = RECV_TIMEOUT
+) -> bytes:
+    """
+    Receive exactly `size` bytes, see `recv_exact_into`.
+
+    :param client_socket: Client socket.
+    :type client_socket: socket.socket
+    :param size: Number of bytes to receive.
+    :type size: int
+    :param timeout: Deadline in seconds for the whole read, None to wait forever.
+    :type timeout: Optional[float]
+    :return: Received bytes.
+    :rtype: bytes
+    """
+    buffer = bytearray(size)
+    recv_exact_into(client_socket, memoryview(buffer), timeout)
+    return bytes(buffer)
+
+
+class ConnectionReader(object):
+    """
+    Exact-size reads over a per-connection buffer, reused across messages.
+
+    The buffer only grows (to the largest message seen), so the 4/8 bytes
+    headers and control messages of a session never allocate.
+    """
+
+    def __init__(
+        self,
+        client_socket: socket.socket,
+        timeout: Optional[float] = RECV_TIMEOUT,
+        buffer_size: int = 4096,
+    ) -> None:
+        self.client_socket = client_socket
+        self.timeout = timeout
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+
+    def recv_exact(self, size: int, timeout: Optional[float] = None) -> memoryview:
+        """
+        Receive exactly `size` bytes.
+
+        :param size: Number of bytes to receive.
+        :type size: int
+        :param timeout: Deadline in seconds, defaults to the reader one.
+        :type timeout: Optional[float]
+        :return: View over the reader buffer, only valid until the next read.
+        :rtype: memoryview
+        """
+        if size > len(self.buffer):
+            self.buffer = bytearray(size)
+            self.view = memoryview(self.buffer)
+        view = self.view[:size]
+        recv_exact_into(
+            self.client_socket, view, self.timeout if timeout is None else timeout
+        )
+        return view
+
+
+def create_server_socket(
+    host: str, port: int, reuse_port: bool = False, backlog: int = 5
+) -> socket.socket:
+    """
+    Create a listening TCP socket.
+
+    :param host: Address to bind to.
+    :type host: str
+    :param port: Port to bind to.
+    :type port: int
+    :param reuse_port: Set SO_REUSEPORT, so several processes can bind the same port.
+    :type reuse_port: bool
+    :param backlog: Listen backlog.
+    :type backlog: int
+    :return: Listening socket.
+    :rtype: socket.socket
+    """
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(backlog)
+    return server_socket
+
+
+class WorkerPool(object):
+    """
+    Pre-forked listener: N worker processes accept and handle connections.
+
+    With SO_REUSEPORT (Linux, BSD) every worker binds its own socket and the
+    kernel balances connections across them, otherwise the workers accept on
+    the socket bound by the parent. Workers report their counters to the
+    parent over a pipe (one JSON line per handled connection), kept per
+    worker process so a respawned slot adds to the counts of the process it
+    replaces; on Ctrl+C the parent stops the workers and prints the
+    aggregated counters.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        workers: int,
+        handler: Callable[[socket.socket, Tuple[str, int]], None],
+        name: str = "BugSleepC2",
+        worker_init: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.handler = handler
+        self.name = name
+        #! called with the worker index in every worker, once forked
+        self.worker_init = worker_init
+        self.reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self.server_socket: Optional[socket.socket] = None
+        self.pids: Dict[int, int] = {}
+        self.spawned: Dict[int, float] = {}
+        #! worker index -> pid -> last counters of that process
+        self.stats: Dict[int, Dict[int, Dict[str, float]]] = {}
+        self.stopping = False
+        self.stats_read, self.stats_write = -1, -1
+        self.pending = b""
+
+    def run(self) -> None:
+        """
+        Fork the workers and supervise them until SIGINT/SIGTERM.
+        """
+        if not hasattr(os, "fork"):
+            raise OSError("--workers requires os.fork (POSIX only)")
+
+        if self.reuse_port:
+            # * bind errors (port in use, privileged port) show up here
+            # * rather than in every worker
+            create_server_socket(self.host, self.port, reuse_port=True).close()
+        else:
+            self.server_socket = create_server_socket(self.host, self.port)
+        self.stats_read, self.stats_write = os.pipe()
+
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        for index in range(self.workers):
+            self._spawn(index)
+        mode = "SO_REUSEPORT" if self.reuse_port else "shared accept"
+        print(
+            f"[{self.name}] Listening on {self.host}:{self.port} "
+            f"with {self.workers} workers ({mode})"
+        )
+
+        while not self.stopping:
+            try:
+                readable, _, _ = select.select([self.stats_read], [], [], 0.5)
+            except InterruptedError:
+                continue
+            if readable:
+                self._read_stats()
+            self._reap(respawn=True)
+
+        print(f"\n[{self.name}] Shutting down {len(self.pids)} workers...")
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        while self.pids:
+            self._reap(respawn=False, block=True)
+        self._read_stats()
+        os.close(self.stats_read)
+        os.close(self.stats_write)
+        if self.server_socket is not None:
+            self.server_socket.close()
+        self.report()
+
+    def report(self) -> None:
+        """
+        Print per-worker and total counters.
+        """
+        totals: Dict[str, float] = {}
+        for index in sorted(self.stats):
+            worker_stats: Dict[str, float] = {}
+            for process_stats in self.stats[index].values():
+                for key, value in process_stats.items():
+                    worker_stats[key] = worker_stats.get(key, 0) + value
+            print(
+                f"[{self.name}] worker {index}: "
+                + ", ".join(f"{key}={value:g}" for key, value in worker_stats.items())
+            )
+            for key, value in worker_stats.items():
+                totals[key] = totals.get(key, 0) + value
+        print(
+            f"[{self.name}] total: "
+            + ", ".join(f"{key}={value:g}" for key, value in totals.items())
+        )
+
+    def _stop(self, signum: int, frame: Any) -> None:
+        self.stopping = True
+
+    def _spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self._worker(index)
+            except BaseException:
+                status = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        self.pids[pid] = index
+        self.spawned[index] = time.monotonic()
+
+    def _reap(self, respawn: bool, block: bool = False) -> None:
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                self.pids.clear()
+                return
+            if pid == 0:
+                return
+            index = self.pids.pop(pid, None)
+            if index is None:
+                continue
+            if respawn and not self.stopping:
+                if time.monotonic() - self.spawned[index] < WORKER_MIN_UPTIME:
+                    print(f"[{self.name}] worker {index} failed at startup, stopping")
+                    self.stopping = True
+                    continue
+                print(f"[{self.name}] worker {index} exited ({status}), respawning")
+                self._spawn(index)
+            if block:
+                return
+
+    def _read_stats(self) -> None:
+        while True:
+            readable, _, _ = select.select([self.stats_read], [], [], 0)
+            if not readable:
+                break
+            self.pending += os.read(self.stats_read, 65536)
+        *lines, self.pending = self.pending.split(b"\n")
+        for line in lines:
+            record = json.loads(line)
+            index, pid = record.pop("worker"), record.pop("pid")
+            self.stats.setdefault(index, {})[pid] = record
+
+    def _worker(self, index: int) -> None:
+        # * the terminal Ctrl+C reaches the whole process group, only the
+        # * parent handles it and stops the workers with SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, _raise_system_exit)
+        os.close(self.stats_read)
+        if self.worker_init is not None:
+            self.worker_init(index)
+
+        server_socket = self.server_socket
+        if server_socket is None:
+            server_socket = create_server_socket(self.host, self.port, reuse_port=True)
+
+        worker_stats = {"connections": 0, "errors": 0, "busy_seconds": 0.0}
+        try:
+            while True:
+                client_socket, address = server_socket.accept()
+                start = time.monotonic()
+                try:
+                    self.handler(client_socket, address)
+                except Exception as err:
+                    worker_stats["errors"] += 1
+                    print(f"[{self.name}] worker {index}: {err}")
+                worker_stats["connections"] += 1
+                worker_stats["busy_seconds"] += time.monotonic() - start
+                record = dict(worker_stats, worker=index, pid=os.getpid())
+                # * a single write of less than PIPE_BUF bytes is atomic
+                os.write(self.stats_write, json.dumps(record).encode() + b"\n")
+        except SystemExit:
+            pass
+        finally:
+            server_socket.close()
+
+
+def _raise_system_exit(signum: int, frame: Any) -> None:
+    raise SystemExit(0)
+
+
+class Session(object):
+    """
+    A registered client session.
+    """
+
+    #! waiting on the implant
+    STATE_NETWORK = "network"
+    #! waiting on the operator, the implant is expected to be quiet
+    STATE_OPERATOR = "operator"
+
+    def __init__(
+        self, session_id: int, client_socket: socket.socket, address: Tuple[str, int]
+    ) -> None:
+        self.session_id = session_id
+        self.client_socket = client_socket
+        self.address = address
+        self.state = self.STATE_NETWORK
+        self.last_activity = time.monotonic()
+
+    def touch(self) -> None:
+        """
+        Record network activity on the session.
+        """
+        self.last_activity = time.monotonic()
+
+    def peer_closed(self) -> bool:
+        """
+        Check, without consuming data, whether the peer closed the connection.
+
+        Only safe while no other thread reads the socket.
+        """
+        try:
+            readable, _, _ = select.select([self.client_socket], [], [], 0)
+            if not readable:
+                return False
+            if isinstance(self.client_socket, ssl.SSLSocket):
+                #! TLS sockets refuse MSG_PEEK, peek at the TCP stream below
+                with socket.socket(fileno=os.dup(self.client_socket.fileno())) as raw:
+                    return raw.recv(1, socket.MSG_PEEK) == b""
+            return self.client_socket.recv(1, socket.MSG_PEEK) == b""
+        except (OSError, ValueError):
+            return True
+
+
+class SessionRegistry(object):
+    """
+    Registry of the live sessions of a listener, with a reaper thread that
+    shuts down sessions idle for longer than `idle_timeout` on the network
+    side, or whose peer went away while waiting on the operator. The
+    handler blocked on the socket then sees the connection end and cleans up.
+    """
+
+    def __init__(
+        self, idle_timeout: float = SESSION_IDLE_TIMEOUT, reap_interval: float = 5.0
+    ) -> None:
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.lock = threading.Lock()
+        self.sessions: Dict[int, Session] = {}
+        self.next_id = 1
+        self.reaper: Optional[threading.Thread] = None
+
+    def register(
+        self, client_socket: socket.socket, address: Tuple[str, int]
+    ) -> Session:
+        with self.lock:
+            session = Session(self.next_id, client_socket, address)
+            self.sessions[session.session_id] = session
+            self.next_id += 1
+        return session
+
+    def unregister(self, session: Session) -> None:
+        with self.lock:
+            self.sessions.pop(session.session_id, None)
+
+    def reap(self) -> List[Session]:
+        """
+        Shut down idle and dead sessions.
+
+        :return: Reaped sessions.
+        :rtype: List[Session]
+        """
+        now = time.monotonic()
+        with self.lock:
+            sessions = list(self.sessions.values())
+        reaped = []
+        for session in sessions:
+            if session.client_socket.fileno() == -1:
+                dead = True
+            elif session.state == Session.STATE_OPERATOR:
+                dead = session.peer_closed()
+            else:
+                dead = now - session.last_activity > self.idle_timeout
+            if not dead:
+                continue
+            try:
+                session.client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.unregister(session)
+            reaped.append(session)
+        return reaped
+
+    def start_reaper(self) -> None:
+        """
+        Run `reap` every `reap_interval` seconds from a daemon thread.
+        """
+        if self.reaper is not None:
+            return
+
+        def reaper_loop() -> None:
+            while True:
+                time.sleep(self.reap_interval)
+                for session in self.reap():
+                    print(
+                        f"[Session] Reaped session {session.session_id} "
+                        f"from {session.address}"
+                    )
+
+        self.reaper = threading.Thread(target=reaper_loop, daemon=True)
+        self.reaper.start()
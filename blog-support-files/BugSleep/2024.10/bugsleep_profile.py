@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import json
+import struct
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+"""
+Per-variant BugSleep protocol profiles.
+
+The protocol constants of the analyzed sample (increment, header layout,
+transfer block size, padding quirks and handshake delay) live in a JSON
+profile, so a new BugSleep variant only needs a new profile:
+
+    ./BugSleepC2Emulator_RevShell.py --profile profiles/bugsleep_2024.10.json
+
+Missing keys take the values of DEFAULT_PROFILE (the 2024.10 sample). A
+profile is compiled once at startup and the cipher is a bytes.translate
+table built once per increment, so the hot loops never branch per byte.
+"""
+
+#! the 2024.10 sample, as documented in the blog article
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "name": "BugSleep 2024.10",
+    #! added to every byte sent and received by the C2
+    "increment": 3,
+    #! size and byte order of the length/integer fields
+    "length_size": 4,
+    "byteorder": "little",
+    #! largest length field accepted before the C2 allocates for it
+    "max_message_length": 1 << 20,
+    #! Phase 2, random bytes sent back to the implant
+    "random_size": 4,
+    #! Phase 2 -> Phase 3 delay (seconds)
+    "handshake_delay": 1.0,
+    #! Phase 3, the initial message carries the command id + this offset
+    "command_offset": 1,
+    #! download header, number of blocks field
+    "block_count_size": 8,
+    #! transfer blocks: index header + content
+    "block_size": 1024,
+    "block_index_size": 4,
+    #! zero bytes appended to the last upload block (and to its size)
+    "last_block_padding": 4,
+    #! end of a reverse shell output (hex)
+    "output_marker": "00000000",
+}
+
+
+#! struct codes of the supported integer field sizes
+STRUCT_CODES: Dict[int, str] = {1: "B", 2: "H", 4: "I", 8: "Q"}
+#! called with (bytes, seconds) of every `cipher` call, see bugsleep_metrics
+CIPHER_METER: Optional[Callable[[int, float], None]] = None
+
+
+@lru_cache(maxsize=None)
+def cipher_table(increment: int) -> bytes:
+    """
+    bytes.translate table adding `increment` to every byte.
+
+    :param increment: Increment value.
+    :type increment: int
+    :return: 256 bytes translation table.
+    :rtype: bytes
+    """
+    return bytes((byte + increment) % 256 for byte in range(256))
+
+
+def cipher(data: bytes, increment: int) -> bytes:
+    """
+    Add `increment` to every byte of `data`, both ways of the BugSleep cipher.
+
+    :param data: Data to encrypt or decrypt.
+    :type data: bytes
+    :param increment: Increment value.
+    :type increment: int
+    :return: Translated data.
+    :rtype: bytes
+    """
+    if CIPHER_METER is None:
+        return bytes(data).translate(cipher_table(increment))
+    start = time.perf_counter()
+    result = bytes(data).translate(cipher_table(increment))
+    CIPHER_METER(len(data), time.perf_counter() - start)
+    return result
+
+
+def cipher_buffer(buffer: bytearray, increment: int) -> bytearray:
+    """
+    `cipher` of a whole reusable buffer: translate can not write in place,
+    the translated copy is the only one made (no bytes() copy of a slice).
+
+    :param buffer: Buffer to encrypt or decrypt, left untouched.
+    :type buffer: bytearray
+    :param increment: Increment value.
+    :type increment: int
+    :return: Translated copy of `buffer`.
+    :rtype: bytearray
+    """
+    if CIPHER_METER is None:
+        return buffer.translate(cipher_table(increment))
+    start = time.perf_counter()
+    result = buffer.translate(cipher_table(increment))
+    CIPHER_METER(len(buffer), time.perf_counter() - start)
+    return result
+
+
+class ProtocolProfile(object):
+    """
+    A compiled protocol profile.
+    """
+
+    def __init__(self, settings: Dict[str, Any]) -> None:
+        unknown = set(settings) - set(DEFAULT_PROFILE)
+        if unknown:
+            raise ValueError(f"unknown profile keys: {', '.join(sorted(unknown))}")
+        values = dict(DEFAULT_PROFILE, **settings)
+
+        self.name: str = values["name"]
+        self.increment: int = int(values["increment"]) % 256
+        self.length_size: int = int(values["length_size"])
+        self.byteorder: str = values["byteorder"]
+        self.max_message_length: int = int(values["max_message_length"])
+        self.random_size: int = int(values["random_size"])
+        self.handshake_delay: float = float(values["handshake_delay"])
+        self.command_offset: int = int(values["command_offset"])
+        self.block_count_size: int = int(values["block_count_size"])
+        self.block_size: int = int(values["block_size"])
+        self.block_index_size: int = int(values["block_index_size"])
+        self.last_block_padding: int = int(values["last_block_padding"])
+        self.output_marker: bytes = bytes.fromhex(values["output_marker"])
+
+        if self.byteorder not in ("little", "big"):
+            raise ValueError(f"byteorder must be little or big, not {self.byteorder}")
+        if self.max_message_length <= 0:
+            raise ValueError("max_message_length must be positive")
+        if self.block_size <= self.block_index_size:
+            raise ValueError("block_size must be bigger than block_index_size")
+        if not self.output_marker:
+            raise ValueError("output_marker can not be empty")
+        if self.block_index_size not in STRUCT_CODES:
+            raise ValueError(
+                f"block_index_size must be one of {sorted(STRUCT_CODES)} bytes"
+            )
+
+        #! file content carried by a transfer block
+        self.content_size: int = self.block_size - self.block_index_size
+        self.padding: bytes = b"\x00" * self.last_block_padding
+        #! packs a block index in place, see pack_into
+        self.block_index: struct.Struct = struct.Struct(
+            ("<" if self.byteorder == "little" else ">")
+            + STRUCT_CODES[self.block_index_size]
+        )
+
+    def pack_int(self, value: int, size: int = 0) -> bytes:
+        """
+        Plain integer field, `length_size` bytes unless `size` is given.
+        """
+        return value.to_bytes(size or self.length_size, byteorder=self.byteorder)
+
+    def parse_int(self, data: bytes) -> int:
+        """
+        Integer field, already decrypted.
+        """
+        return int.from_bytes(data, byteorder=self.byteorder)
+
+    def initial_message(self, command: int, increment: int) -> bytes:
+        """
+        Phase 3 message, encrypted, selecting `command` on the implant side.
+        """
+        return cipher(self.pack_int(command + self.command_offset), increment)
+
+    def __repr__(self) -> str:
+        return f"<ProtocolProfile {self.name!r} increment={self.increment}>"
+
+
+def load_profile(path: str) -> ProtocolProfile:
+    """
+    Load and compile a JSON protocol profile.
+
+    :param path: Profile path.
+    :type path: str
+    :return: Compiled profile.
+    :rtype: ProtocolProfile
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        settings = json.load(file)
+    if not isinstance(settings, dict):
+        raise ValueError(f"{path}: a profile is a JSON object")
+    return ProtocolProfile(settings)
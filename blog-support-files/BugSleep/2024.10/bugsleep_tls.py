@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import ssl
+import subprocess
+import time
+from typing import Optional
+
+"""
+Optional TLS termination for the BugSleep C2 emulators.
+
+    ./BugSleepC2Emulator_RevShell.py --tls on      # TLS only
+    ./BugSleepC2Emulator_RevShell.py --tls auto    # TLS and raw BugSleep, same port
+
+With `auto` the first 6 bytes of every connection are peeked: a TLS
+record header (handshake content type 0x16, version 0x03 0x00-0x04, a
+length a ClientHello fits in) followed by the ClientHello handshake type
+0x01 is terminated in-process, anything else is handed to the emulator
+untouched. The record header alone is not enough: with the default
+increment, the length header of a 19 or 65555 bytes BugSleep hello encodes
+as `16 03 03`/`16 03 04`, the record length and handshake type then come
+from the (encrypted) hello itself.
+
+The certificate and key default to a self-signed pair, generated with the
+openssl CLI on first use. Session resumption (tickets and the server
+session cache) is left enabled, so reconnecting lab clients skip the full
+handshake.
+"""
+
+#! TLS record header: handshake content type, major version 3
+TLS_CONTENT_HANDSHAKE: int = 0x16
+TLS_MAJOR_VERSION: int = 0x03
+TLS_MAX_MINOR_VERSION: int = 0x04
+#! record length bounds: the smallest ClientHello (handshake header, version,
+#! random, empty session id, one cipher suite, one compression method) and
+#! the largest plaintext record
+TLS_MIN_CLIENT_HELLO_LENGTH: int = 45
+TLS_MAX_RECORD_LENGTH: int = 1 << 14
+#! handshake type of the first message of the record
+TLS_HANDSHAKE_CLIENT_HELLO: int = 0x01
+#! record header (5 bytes) and handshake type
+TLS_SNIFF_LENGTH: int = 6
+
+TLS_OFF = "off"
+TLS_ON = "on"
+TLS_AUTO = "auto"
+
+DEFAULT_CERTFILE: str = "bugsleep_c2.crt"
+DEFAULT_KEYFILE: str = "bugsleep_c2.key"
+
+
+def generate_self_signed_cert(
+    certfile: str, keyfile: str, common_name: str = "bugsleep-c2", days: int = 365
+) -> None:
+    """
+    Generate a self-signed lab certificate with the openssl CLI.
+
+    :param certfile: Certificate (PEM) path, overwritten.
+    :type certfile: str
+    :param keyfile: Private key (PEM) path, overwritten.
+    :type keyfile: str
+    :param common_name: Certificate subject CN.
+    :type common_name: str
+    :param days: Validity in days.
+    :type days: int
+    :raises OSError: openssl is missing or failed.
+    """
+    try:
+        subprocess.run(
+            [
+                "openssl",
+                "req",
+                "-x509",
+                "-newkey",
+                "rsa:2048",
+                "-nodes",
+                "-sha256",
+                "-days",
+                str(days),
+                "-subj",
+                f"/CN={common_name}",
+                "-keyout",
+                keyfile,
+                "-out",
+                certfile,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+    except subprocess.CalledProcessError as err:
+        raise OSError(
+            f"openssl failed: {err.stderr.decode(errors='replace').strip()}"
+        ) from err
+    os.chmod(keyfile, 0o600)
+
+
+def create_server_context(certfile: str, keyfile: str) -> ssl.SSLContext:
+    """
+    Server-side TLS context with session resumption enabled.
+
+    :param certfile: Certificate (PEM) path.
+    :type certfile: str
+    :param keyfile: Private key (PEM) path.
+    :type keyfile: str
+    :return: TLS context.
+    :rtype: ssl.SSLContext
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile)
+    #! stateless resumption, the OpenSSL server session cache is on by default
+    context.options &= ~ssl.OP_NO_TICKET
+    return context
+
+
+def could_be_client_hello(header: bytes) -> bool:
+    """
+    Check the first bytes of a connection against a TLS ClientHello record.
+
+    :param header: Up to TLS_SNIFF_LENGTH bytes, fewer while still arriving.
+    :type header: bytes
+    :return: False as soon as a byte rules a ClientHello out.
+    :rtype: bool
+    """
+    if len(header) > 0 and header[0] != TLS_CONTENT_HANDSHAKE:
+        return False
+    if len(header) > 1 and header[1] != TLS_MAJOR_VERSION:
+        return False
+    if len(header) > 2 and header[2] > TLS_MAX_MINOR_VERSION:
+        return False
+    if len(header) > 4 and not (
+        TLS_MIN_CLIENT_HELLO_LENGTH
+        <= int.from_bytes(header[3:5], byteorder="big")
+        <= TLS_MAX_RECORD_LENGTH
+    ):
+        return False
+    if len(header) > 5 and header[5] != TLS_HANDSHAKE_CLIENT_HELLO:
+        return False
+    return True
+
+
+def is_tls_client_hello(client_socket: socket.socket, timeout: float) -> bool:
+    """
+    Peek, without consuming them, at the first bytes sent by the client.
+
+    :param client_socket: Accepted client socket.
+    :type client_socket: socket.socket
+    :param timeout: Deadline (seconds) for the first TLS_SNIFF_LENGTH bytes.
+    :type timeout: float
+    :return: True if they are a TLS record header starting a ClientHello.
+    :rtype: bool
+    """
+    deadline = time.monotonic() + timeout
+    header = b""
+    while len(header) < TLS_SNIFF_LENGTH:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        client_socket.settimeout(remaining)
+        try:
+            peeked = client_socket.recv(TLS_SNIFF_LENGTH, socket.MSG_PEEK)
+        except socket.timeout:
+            break
+        if len(peeked) == len(header):
+            if not peeked:
+                break
+            #! nothing new yet, MSG_PEEK returns at once if data is buffered
+            time.sleep(0.01)
+        header = peeked
+        #! a raw client with a short first message is not kept waiting
+        if not could_be_client_hello(header):
+            return False
+    return len(header) == TLS_SNIFF_LENGTH and could_be_client_hello(header)
+
+
+class TlsTerminator(object):
+    """
+    Wrap accepted connections in TLS, all of them or only the TLS ones.
+    """
+
+    def __init__(self, context: ssl.SSLContext, sniff: bool, timeout: float) -> None:
+        self.context = context
+        self.sniff = sniff
+        self.timeout = timeout
+
+    def accept(self, client_socket: socket.socket) -> Optional[socket.socket]:
+        """
+        Terminate TLS on `client_socket` when needed.
+
+        :param client_socket: Accepted client socket.
+        :type client_socket: socket.socket
+        :return: The TLS socket, `client_socket` itself for a raw BugSleep
+        connection, None if the TLS handshake failed (the socket is closed).
+        :rtype: Optional[socket.socket]
+        """
+        try:
+            if self.sniff and not is_tls_client_hello(client_socket, self.timeout):
+                client_socket.settimeout(None)
+                return client_socket
+            client_socket.settimeout(self.timeout)
+            tls_socket = self.context.wrap_socket(client_socket, server_side=True)
+            #! back to blocking, the emulators set their own deadlines
+            tls_socket.settimeout(None)
+            return tls_socket
+        except (ssl.SSLError, OSError) as err:
+            print(f"[TLS] Handshake failed: {err}")
+            client_socket.close()
+            return None
+
+    @classmethod
+    def from_files(
+        cls, mode: str, certfile: str, keyfile: str, timeout: float
+    ) -> "TlsTerminator":
+        """
+        Build a terminator, generating a self-signed pair if both files are missing.
+
+        :raises OSError: certificate generation or loading failed.
+        :raises ssl.SSLError: invalid certificate or key.
+        """
+        if not os.path.exists(certfile) and not os.path.exists(keyfile):
+            generate_self_signed_cert(certfile, keyfile)
+            print(f"[TLS] Generated a self-signed certificate: {certfile}, {keyfile}")
+        return cls(create_server_context(certfile, keyfile), mode == TLS_AUTO, timeout)
@@ -0,0 +1,266 @@
+# @author _raw_data_ @ https://github.com/raw-data
+
+"""
+Table-driven strings decryption engine shared by the Ghidra and IDA decryptor
+scripts (Jython 2.7 and Python 3 compatible)
+
+A sample profile declares where the decryption routine is, which register
+carries the encrypted string address and the byte transform, e.g.
+
+    "artradownloader_v1": {
+        "decryptor": "0x004026b0",
+        "arg_register": "EAX",
+        "transform": [{"op": "sub", "value": 1}]
+    }
+
+Transform steps are composed once into a 256-byte translation table, so
+decrypting a string is a single `bytes.translate` call.
+
+Profiles without a decryptor address (or scripts run in scan mode) look for
+candidate routines with the optional `scan` settings
+
+    "scan": {
+        "signature": "8A 0? 80 E9 01",  # IDA style byte pattern, ?? wildcards
+        "fid_names": ["artra_decrypt"],  # function names in fiddb.json
+        "min_xrefs": 10,                 # xref-count heuristic, null disables it
+        "max_size": 128,                 # heuristic candidates max size (bytes)
+        "min_resolved": 0.8              # ratio of call sites with a string arg
+    }
+"""
+
+from collections import OrderedDict
+import binascii
+import csv
+import io
+import json
+import os
+import re
+import sys
+
+PROFILES_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "strdecrypt_profiles.json"
+)
+
+_TRANSFORM_OPS = {
+    "add": lambda b, value: (b + value) & 0xFF,
+    "sub": lambda b, value: (b - value) & 0xFF,
+    "xor": lambda b, value: b ^ value,
+    "not": lambda b, value: ~b & 0xFF,
+    "rol": lambda b, value: ((b << value) | (b >> (8 - value))) & 0xFF,
+    "ror": lambda b, value: ((b >> value) | (b << (8 - value))) & 0xFF,
+}
+
+
+def compile_transform(steps):
+    # type (list) -> bytes
+    """Compose transform steps into a 256-byte translation table"""
+    table = list(range(256))
+    for step in steps:
+        op = step["op"]
+        if op == "map":
+            # * explicit substitution, {"op": "map", "table": {"0x41": "0x61"}}
+            mapping = dict(
+                (int(k, 0), int(v, 0)) for k, v in step["table"].items()
+            )
+            table = [mapping.get(b, b) for b in table]
+            continue
+        if op not in _TRANSFORM_OPS:
+            raise ValueError("Unknown transform op: %s" % op)
+        value = int(str(step.get("value", 0)), 0)
+        table = [_TRANSFORM_OPS[op](b, value) for b in table]
+    return bytes(bytearray(table))
+
+
+def to_bytes(data):
+    # type (bytes|str|list) -> bytes
+    """Convert disassembler byte buffers (e.g. Java signed byte[]) to bytes"""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, (bytearray, memoryview)):
+        return bytes(data)
+    if hasattr(data, "encode"):
+        return data.encode("latin-1")
+    return bytes(bytearray(b & 0xFF for b in data))
+
+
+def c_string(data):
+    # type (bytes) -> bytes
+    """Cut a buffer at its first NUL byte"""
+    end = data.find(b"\x00")
+    return data if end < 0 else data[:end]
+
+
+def _signature_tokens(signature):
+    # type (str) -> list
+    tokens = signature.split()
+    for token in tokens:
+        if len(token) != 2 or not re.match(r"^[0-9A-Fa-f?]{2}$", token):
+            raise ValueError("Invalid signature token: %s" % token)
+    return tokens
+
+
+def _token_regex(token, escape):
+    # type (str, callable) -> str
+    if token == "??":
+        return "."
+    if "?" in token:
+        # * half wildcard, e.g. `0?` matches 0x00-0x0F
+        values = [
+            int(token.replace("?", "%x" % nibble), 16) for nibble in range(16)
+        ]
+        return "[%s]" % "".join(escape(value) for value in values)
+    return escape(int(token, 16))
+
+
+def signature_regex(signature):
+    # type (str) -> re.Pattern
+    """Compile an IDA style byte pattern (`8A 08 ?? 80`) to a bytes regex"""
+    return re.compile(ghidra_signature(signature).encode("ascii"), re.DOTALL)
+
+
+def ghidra_signature(signature):
+    # type (str) -> str
+    """IDA style byte pattern to the regex string taken by Ghidra `findBytes`"""
+    return "".join(
+        _token_regex(token, lambda value: "\\x%02x" % value)
+        for token in _signature_tokens(signature)
+    )
+
+
+_SCAN_DEFAULTS = {
+    "signature": None,
+    "fid_names": [],
+    "min_xrefs": None,
+    "max_size": 128,
+    "min_resolved": 0.8,
+}
+
+
+class Profile(object):
+    def __init__(self, name, config):
+        self.name = name
+        self.description = config.get("description", "")
+        decryptor = config.get("decryptor")
+        self.decryptor = int(decryptor, 0) if decryptor else None
+        self.signature = config.get("signature")
+        self.arg_register = config.get("arg_register", "EAX")
+        self.encoding = config.get("encoding", "latin-1")
+        self.max_length = config.get("max_length", 1024)
+        self.table = compile_transform(config.get("transform", []))
+        self.scan = dict(_SCAN_DEFAULTS)
+        self.scan.update(config.get("scan", {}))
+        # * a top-level signature is a scan signature too
+        if self.signature and not self.scan["signature"]:
+            self.scan["signature"] = self.signature
+
+    def decrypt(self, enc_str):
+        # type (bytes) -> str
+        return enc_str.translate(self.table).decode(self.encoding, "replace")
+
+    def decrypt_many(self, enc_strs):
+        # type (list) -> list
+        """Decrypt a batch of strings with a single translate call"""
+        if not enc_strs:
+            return []
+        blob = b"".join(enc_strs).translate(self.table)
+        dec_strs = list()
+        offset = 0
+        for enc_str in enc_strs:
+            end = offset + len(enc_str)
+            dec_strs.append(blob[offset:end].decode(self.encoding, "replace"))
+            offset = end
+        return dec_strs
+
+
+def load_profiles(path=PROFILES_PATH):
+    # type (str) -> OrderedDict
+    with open(path, "r") as f:
+        config = json.load(f, object_pairs_hook=OrderedDict)
+    return OrderedDict((name, Profile(name, c)) for name, c in config.items())
+
+
+def load_profile(name, path=PROFILES_PATH):
+    # type (str, str) -> Profile
+    profiles = load_profiles(path)
+    if name not in profiles:
+        raise KeyError(
+            "Unknown profile %s, available: %s" % (name, ", ".join(profiles))
+        )
+    return profiles[name]
+
+
+def make_result(address, call_sites, enc_str, dec_str):
+    # type (int, list, bytes, str) -> OrderedDict
+    return OrderedDict(
+        [
+            ("address", address),
+            ("call_sites", list(call_sites)),
+            ("encrypted", enc_str),
+            ("decrypted", dec_str),
+        ]
+    )
+
+
+def label_name(dec_str, prefix="s_", max_length=32):
+    # type (str, str, int) -> str
+    """IDA like label for a decrypted string, e.g. `s_Hello_world`"""
+    name = re.sub(r"[^0-9A-Za-z]+", "_", dec_str).strip("_")[:max_length]
+    return prefix + (name or "empty")
+
+
+def unique_label(name, taken):
+    # type (str, callable) -> str
+    """`name`, or `name_<n>` with the lowest n for which `taken` is False"""
+    candidate = name
+    suffix = 0
+    while taken(candidate):
+        suffix += 1
+        candidate = "%s_%d" % (name, suffix)
+    return candidate
+
+
+def export_results(results, path):
+    # type (list, str) -> None
+    """Export results keyed by string address, CSV when `path` ends with .csv,
+    JSON otherwise"""
+    rows = [
+        (
+            "0x%08x" % r["address"],
+            " ".join("0x%08x" % call_site for call_site in r["call_sites"]),
+            binascii.hexlify(r["encrypted"]).decode("ascii"),
+            r["decrypted"],
+        )
+        for r in results
+    ]
+
+    if path.lower().endswith(".csv"):
+        header = ("address", "call_sites", "encrypted_hex", "decrypted")
+        if sys.version_info[0] < 3:
+            # * Python 2 csv only deals with bytes
+            with open(path, "wb") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                for row in rows:
+                    writer.writerow([field.encode("utf-8") for field in row])
+        else:
+            with io.open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+        return
+
+    exported = OrderedDict(
+        (
+            address,
+            OrderedDict(
+                [
+                    ("call_sites", call_sites.split()),
+                    ("encrypted_hex", encrypted),
+                    ("decrypted", decrypted),
+                ]
+            ),
+        )
+        for address, call_sites, encrypted, decrypted in rows
+    )
+    with open(path, "w") as f:
+        f.write(json.dumps(exported, indent=2))
@@ -1,75 +1,314 @@
-# ArtraDownloader v1 - strings decryptor
-#
-# Ref sample:
-#	file name: winsvc
-#   md5: 7cc0b212d1b8ceb808c250495d83bae4  
-#   sha1: d2c161ce52240b61d632607a2262890327d82502
-#   sha256: ef0cb0a1a29bcdf2b36622f72734aec8d38326fc8f7270f78bd956e706a5fd57
-#
-# Ref links: 
-#	2018.12.19 https://twitter.com/malwrhunterteam/status/1075454863008382976
-#	2018.12.21 https://gist.github.com/raw-data/14915eca4e5e2963a9056f935442358d
-#	2019.02.25 https://unit42.paloaltonetworks.com/multiple-artradownloader-variants-used-by-bitter-to-target-pakistan/
-
-#@author raw-data
-#@category malware strings decryptor
-#@keybinding 
-#@menupath 
-#@toolbar 
-
-import ghidra.app.script.GhidraScript
-import exceptions
-
-enc_buffer = []
-
-listing = currentProgram.getListing()
-
-def decrypt_string(enc_str):
-	mapping = (enc_str, ''.join([chr(ord(char) - 1) for char in enc_str]))
-	return(mapping[1])
-
-def get_function_args(addr):
-	while True:
-		# get instruction at given address
-		ins = getInstructionBefore(toAddr(addr))
-		# get instruction offset address
-		ins_addr = ins.getAddress()
-		# check pattern
-		get_ins = getInstructionAt(toAddr(addr))
-		op = get_ins.toString().split()[0]
-		if "MOV" == op and get_ins.getDefaultOperandRepresentation(0) == "EAX" and "0x" in get_ins.getDefaultOperandRepresentation(1):
-			enc_string = getDataAt(toAddr(get_ins.getDefaultOperandRepresentation(1)))
-			if enc_string:
-				# map encrypted string and its offset address
-				mapping = (toAddr(get_ins.getDefaultOperandRepresentation(1)), enc_string)
-				enc_buffer.append(mapping)
-			break
-		else:
-			get_function_args(ins_addr.toString())
-		break
-
-def extract_encrypted_str(xrefs):
-	for xref in xrefs:
-		ref_addr = (xref.getFromAddress())
-		get_function_args(ref_addr.toString())
-
-	decrypt_enc_str_and_comment()
-
-def decrypt_enc_str_and_comment():
-	for enc_str_addr, enc_str in enc_buffer:
-		enc_str = enc_str.toString().split()[1].strip("\"")
-		dec_str = decrypt_string(enc_str)
-		
-		# add comments
-		codeUnit = listing.getCodeUnitAt(toAddr(enc_str_addr.toString()))
-		ds_string = getDataAt(toAddr(enc_str_addr.toString()))
-		ds_string.setComment(codeUnit.EOL_COMMENT, dec_str)
-		
-		# print results to console
-		print("Address: %-40s Enc string: %-40s Dec string: %-40s" % (toAddr(enc_str_addr.toString()), enc_str, dec_str))
-
-def run():
-	xrefs = getReferencesTo(toAddr(0x004026b0))
-	extract_encrypted_str(xrefs)
-
-run()
+# Strings decryptor - ArtraDownloader v1 by default
+#
+# Ref sample:
+#	file name: winsvc
+#   md5: 7cc0b212d1b8ceb808c250495d83bae4
+#   sha1: d2c161ce52240b61d632607a2262890327d82502
+#   sha256: ef0cb0a1a29bcdf2b36622f72734aec8d38326fc8f7270f78bd956e706a5fd57
+#
+# Ref links:
+#	2018.12.19 https://twitter.com/malwrhunterteam/status/1075454863008382976
+#	2018.12.21 https://gist.github.com/raw-data/14915eca4e5e2963a9056f935442358d
+#	2019.02.25 https://unit42.paloaltonetworks.com/multiple-artradownloader-variants-used-by-bitter-to-target-pakistan/
+#
+# The sample profile (decryptor address, argument register, transform) is read
+# from common/strdecrypt_profiles.json, pass another profile name as first
+# script argument to decrypt other families.
+#
+# With the `--scan` script argument, or a profile without a decryptor address,
+# candidate decryption routines are discovered by byte signature, FunctionID
+# hash (fiddb.json) or xref-count heuristic, and every xref is decrypted.
+#
+# Results are written in a single transaction once all strings are decrypted.
+# Other script arguments:
+#   --export <path>   export results to JSON (or CSV, .csv extension)
+#   --create-data     define the encrypted strings as byte arrays
+#   --labels          label the decrypted strings (s_<decrypted string>)
+#   --quiet           do not print every decrypted string
+#   --stats           print per-phase timings and counters (see script_stats.py)
+#   --stats-json <p>  also dump them as JSON
+
+#@author raw-data
+#@category malware strings decryptor
+#@keybinding
+#@menupath
+#@toolbar
+
+import os
+import sys
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common")
+)
+
+from ghidra.feature.fid.service import FidService
+from ghidra.program.model.data import ArrayDataType, ByteDataType
+from ghidra.program.model.lang import Register
+from ghidra.program.model.symbol import SourceType
+from fid_db import FunctionIdDb, hash_function
+from script_stats import stats_from_args
+from strdecrypt import (
+    c_string,
+    export_results,
+    ghidra_signature,
+    label_name,
+    load_profile,
+    make_result,
+    to_bytes,
+)
+
+PROFILE = "artradownloader_v1"
+# instructions walked back from a call site looking for the string argument
+ARG_WINDOW = 32
+# signature hits considered in scan mode
+MAX_SIGNATURE_HITS = 1000
+
+# encrypted string address -> (encrypted string, call sites)
+enc_buffer = {}
+# call site address -> encrypted string address (None when unresolved)
+resolved_call_sites = {}
+
+listing = currentProgram.getListing()
+
+
+def read_enc_string(addr, max_length):
+    # read the NUL terminated string, defined as data or not
+    data = getDataAt(addr)
+    if data is not None and data.hasStringValue():
+        return c_string(to_bytes(data.getBytes()))
+    return c_string(to_bytes(getBytes(addr, max_length)))
+
+
+def get_function_args(call_addr, profile, window=ARG_WINDOW):
+    # walk back from the call site, at most `window` instructions, looking
+    # for the `MOV <arg_register>, <imm>` loading the encrypted string address
+    if call_addr in resolved_call_sites:
+        return resolved_call_sites[call_addr]
+
+    enc_str_addr = None
+    arg_register = profile.arg_register.upper()
+    ins = getInstructionBefore(call_addr)
+    for _ in range(window):
+        if ins is None:
+            break
+        if any(
+            isinstance(obj, Register) and obj.getName().upper() == arg_register
+            for obj in ins.getResultObjects()
+        ):
+            # any other write to the register ends the slice unresolved
+            scalar = ins.getScalar(1)
+            if ins.getMnemonicString() == "MOV" and scalar is not None:
+                enc_str_addr = toAddr(scalar.getUnsignedValue())
+            break
+        ins = ins.getPrevious()
+
+    resolved_call_sites[call_addr] = enc_str_addr
+    return enc_str_addr
+
+
+def extract_encrypted_str(xrefs, profile):
+    for xref in xrefs:
+        enc_str_addr = get_function_args(xref.getFromAddress(), profile)
+        if enc_str_addr is None:
+            print("Address: %-40s Enc string: not resolved" % xref.getFromAddress())
+            continue
+        if enc_str_addr in enc_buffer:
+            enc_buffer[enc_str_addr][1].append(xref.getFromAddress())
+            continue
+        enc_str = read_enc_string(enc_str_addr, profile.max_length)
+        if enc_str:
+            # map encrypted string, its offset address and call sites
+            enc_buffer[enc_str_addr] = (enc_str, [xref.getFromAddress()])
+
+
+def decrypt_enc_str(profile):
+    addresses = sorted(enc_buffer)
+    enc_strs = [enc_buffer[addr][0] for addr in addresses]
+    dec_strs = profile.decrypt_many(enc_strs)
+    return [
+        make_result(addr, enc_buffer[addr][1], enc_str, dec_str)
+        for addr, enc_str, dec_str in zip(addresses, enc_strs, dec_strs)
+    ]
+
+
+def write_annotations(results, create_data=False, create_labels=False):
+    # all the listing changes go in one transaction, events off until done
+    transaction = currentProgram.startTransaction("Strings decryptor annotations")
+    currentProgram.setEventsEnabled(False)
+    try:
+        for result in results:
+            addr = result["address"]
+            codeUnit = listing.getCodeUnitAt(addr)
+            if codeUnit is not None:
+                codeUnit.setComment(codeUnit.EOL_COMMENT, result["decrypted"])
+            # the bytes are still encrypted: an array, not a string to display,
+            # strings defined by auto-analysis over them are replaced as well
+            data = getDataAt(addr) if create_data else None
+            if create_data and (data is None or data.hasStringValue()):
+                size = len(result["encrypted"]) + 1
+                try:
+                    clearListing(addr, addr.add(size - 1))
+                    createData(addr, ArrayDataType(ByteDataType.dataType, size, 1))
+                except Exception as err:
+                    print("[!] Cannot define byte array @ %s: %s" % (addr, err))
+            if create_labels:
+                createLabel(addr, label_name(result["decrypted"]), False, SourceType.USER_DEFINED)
+    finally:
+        currentProgram.setEventsEnabled(True)
+        currentProgram.endTransaction(transaction, True)
+
+
+def print_results(results, profile):
+    # a single write to the console
+    print("\n".join(
+        "Address: %-40s Enc string: %-40s Dec string: %-40s" % (r["address"], r["encrypted"].decode(profile.encoding, "replace"), r["decrypted"])
+        for r in results
+    ))
+
+
+def load_fid_hashes(fid_names):
+    # full hashes of the fiddb.json functions named as a known decryptor
+    if not fid_names:
+        return set()
+    db_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fiddb.json")
+    try:
+        functions = FunctionIdDb(db_path).load_database()["database"]["functions"]
+    except (IOError, OSError, ValueError):
+        print("[!] No FunctionID database @ %s, FunctionID scan disabled" % db_path)
+        return set()
+    return set(h for h, entry in functions.items() if entry["name"] in fid_names)
+
+
+def find_decryptors(profile):
+    # candidate entry point -> how it was found
+    candidates = {}
+    scan = profile.scan
+
+    if scan["signature"]:
+        hits = findBytes(
+            currentProgram.getMinAddress(),
+            ghidra_signature(scan["signature"]),
+            MAX_SIGNATURE_HITS,
+        )
+        for hit in hits or []:
+            f = getFunctionContaining(hit)
+            if f is not None:
+                candidates.setdefault(f.getEntryPoint(), "signature")
+
+    # single pass over the function list for the FunctionID and xref heuristics
+    fid_hashes = load_fid_hashes(scan["fid_names"])
+    fid_service = FidService() if fid_hashes else None
+    reference_manager = currentProgram.getReferenceManager()
+    for f in currentProgram.getFunctionManager().getFunctions(True):
+        entry_point = f.getEntryPoint()
+        if entry_point in candidates:
+            continue
+        if fid_service is not None:
+            try:
+                function_hashes = hash_function(fid_service, f)
+            except:
+                function_hashes = None
+            if function_hashes is not None and function_hashes[0] in fid_hashes:
+                candidates[entry_point] = "FunctionID"
+                continue
+        if (
+            scan["min_xrefs"] is not None
+            and f.getBody().getNumAddresses() <= scan["max_size"]
+            and reference_manager.getReferenceCountTo(entry_point) >= scan["min_xrefs"]
+        ):
+            candidates[entry_point] = "xrefs"
+
+    # keep candidates whose call sites mostly load a string argument
+    decryptors = []
+    for entry_point, reason in sorted(candidates.items()):
+        xrefs = list(getReferencesTo(entry_point))
+        if not xrefs:
+            continue
+        resolved = [
+            xref for xref in xrefs
+            if get_function_args(xref.getFromAddress(), profile) is not None
+        ]
+        ratio = float(len(resolved)) / len(xrefs)
+        if ratio >= scan["min_resolved"]:
+            print("[+] Decryptor candidate @ %s (%s, %d/%d call sites resolved)" % (entry_point, reason, len(resolved), len(xrefs)))
+            decryptors.append(entry_point)
+    return decryptors
+
+
+def parse_args(args):
+    options = {
+        "profile": PROFILE,
+        "scan": False,
+        "export": None,
+        "create_data": False,
+        "labels": False,
+        "quiet": False,
+    }
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--scan":
+            options["scan"] = True
+        elif arg == "--export":
+            options["export"] = args.pop(0)
+        elif arg == "--create-data":
+            options["create_data"] = True
+        elif arg == "--labels":
+            options["labels"] = True
+        elif arg == "--quiet":
+            options["quiet"] = True
+        else:
+            options["profile"] = arg
+    return options
+
+
+def run():
+    stats, args = stats_from_args("strings-decryptor", getScriptArgs())
+    options = parse_args(args)
+    profile = load_profile(options["profile"])
+
+    if options["scan"] or profile.decryptor is None:
+        with stats.phase("find decryptors"):
+            decryptors = find_decryptors(profile)
+    else:
+        decryptors = [toAddr(profile.decryptor)]
+
+    with stats.phase("extract"):
+        for decryptor in decryptors:
+            xrefs = list(getReferencesTo(decryptor))
+            stats.count("xrefs", len(xrefs))
+            extract_encrypted_str(xrefs, profile)
+    stats.count(
+        "resolved args",
+        sum(1 for addr in resolved_call_sites.values() if addr is not None),
+    )
+
+    with stats.phase("decrypt"):
+        results = decrypt_enc_str(profile)
+    stats.count("strings", len(results))
+
+    with stats.phase("annotate"):
+        write_annotations(results, options["create_data"], options["labels"])
+    stats.count("comments", len(results))
+    if not options["quiet"]:
+        print_results(results, profile)
+    if options["export"]:
+        with stats.phase("export"):
+            export_results(
+                [
+                    make_result(
+                        r["address"].getOffset(),
+                        [call_site.getOffset() for call_site in r["call_sites"]],
+                        r["encrypted"],
+                        r["decrypted"],
+                    )
+                    for r in results
+                ],
+                options["export"],
+            )
+        print("[+] Results exported to %s" % options["export"])
+    print("[+] %d strings decrypted from %d decryptor(s)" % (len(results), len(decryptors)))
+    stats.report()
+
+
+run()
@@ -6,82 +6,352 @@
 
 """
 Check current binary's functions against a FunctionIdMatcher database
+
+When a `fiddb_layers.json` file sits next to the script, all the listed
+databases are loaded and merged by priority (first layer wins on name
+conflicts), see fid_db.load_layers
+
+Otherwise a `fiddb.bin` binary database (tools/fiddb_tool.py to-binary) is
+searched in place when it is not older than `fiddb.json` and its journal
+
+Run with `--workers <N>` to hash functions in N threads, each with its own
+FidService, over contiguous chunks of the function list (output order is
+unchanged). Run with `--propagate` to also name the thunks (`j_<name>`) and
+small wrappers (`w_<name>`) of the matched functions, see fid_propagate.py.
+Run with the `--stats` script argument to print per-phase timings and
+counters, see script_stats.py
 """
 
 from ghidra.feature.fid.service import FidService
-import json
+from fid_db import (
+    TIER_SIZE,
+    FunctionIdBinaryIndex,
+    FunctionIdDb,
+    FunctionIdIndex,
+    hash_function,
+    load_layers,
+    merge_functions,
+)
+from fid_propagate import (
+    PROPAGATION_TAGS,
+    CallGraph,
+    propagate_names,
+)
+from script_stats import stats_from_args
 import os
+import threading
+
+# * renames below this confidence are only reported, see fid_db.TIER_CONFIDENCE
+MIN_CONFIDENCE = 0.5
+# * report the database functions of the same size when no hash matches
+SIZE_HINTS = True
+# * hashing threads, overridden by the `--workers <N>` script argument
+HASH_WORKERS = 1
+# * propagate matched names to thunks and wrappers, or `--propagate`
+PROPAGATE = False
 
 fm = currentProgram.getFunctionManager()
 
 
-def generate_function_ids():
-    # type (None) -> tuple (str, str, str)
-    functions = fm.getFunctions(True)
+def _hash_functions(functions, results):
+    # type (list, list) -> None
+    """Hash `functions` into `results`, None for the ones that failed"""
+    fid_service = FidService()
     for function in functions:
         try:
-            function_id = (
-                FidService()
-                .hashFunction(function)
-                .toString()
-                .encode("utf-8")
-                .split(":")[1]
-                .split("(")[0]
-                .strip()
-            )
+            results.append(hash_function(fid_service, function))
+        except:
+            results.append(None)
+
+
+def _parallel_function_ids(workers):
+    # type (int) -> tuple (Function, tuple (str, str, int))
+    functions = list(fm.getFunctions(True))
+    chunk_size = max(1, (len(functions) + workers - 1) // workers)
+    chunks = [
+        functions[start : start + chunk_size]
+        for start in range(0, len(functions), chunk_size)
+    ]
+    chunks_results = [list() for _ in chunks]
+    threads = [
+        threading.Thread(target=_hash_functions, args=(chunk, results))
+        for chunk, results in zip(chunks, chunks_results)
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # * chunks are contiguous, walking them in order keeps the listing order
+    for chunk, results in zip(chunks, chunks_results):
+        for function, function_hashes in zip(chunk, results):
+            yield function, function_hashes
+
+
+def _sequential_function_ids():
+    # type (None) -> tuple (Function, tuple (str, str, int))
+    fid_service = FidService()
+    for function in fm.getFunctions(True):
+        try:
+            function_hashes = hash_function(fid_service, function)
         except:
-            pass
+            function_hashes = None
+        yield function, function_hashes
+
+
+def generate_function_ids(counters, workers=1):
+    # type (dict, int) -> tuple (str, Address, tuple (str, str, int))
+    if workers > 1:
+        hashed = _parallel_function_ids(workers)
+    else:
+        hashed = _sequential_function_ids()
+    for function, function_hashes in hashed:
+        if function_hashes is None:
+            counters["hash failures"] += 1
+            continue
+        counters["hashes computed"] += 1
+        yield (function.getName(), function.getEntryPoint(), function_hashes)
+
+
+def matching_function(config, stats, workers=HASH_WORKERS, propagate=PROPAGATE):
+    # type (dict, ScriptStats, int, bool) -> None
+    with stats.phase("build index"):
+        index = FunctionIdIndex(config["database"]["functions"])
+    matching_index(index, stats, workers, propagate)
+
+
+def matching_index(index, stats, workers=HASH_WORKERS, propagate=PROPAGATE):
+    # type (FunctionIdIndex|FunctionIdBinaryIndex, ScriptStats, int, bool) -> None
+    counters = {"hashes computed": 0, "hash failures": 0, "renames": 0}
+    tiers = {}
+    seeds = {}
+    with stats.phase("hash and match"):
+        _match_functions(index, counters, tiers, workers, seeds)
+
+    if propagate:
+        with stats.phase("build call graph"):
+            graph = build_call_graph()
+        with stats.phase("propagate"):
+            propagated = propagate_matches(graph, seeds)
+        stats.count("call graph functions", len(graph))
+        stats.count("propagated names", propagated)
+
+    if counters["hash failures"]:
+        print("[!] %d functions could not be hashed" % counters["hash failures"])
+
+    stats.count("database entries", len(index))
+    for name, value in counters.items():
+        stats.count(name, value)
+    stats.count("database lookups", counters["hashes computed"])
+    for tier, value in tiers.items():
+        if tier == TIER_SIZE:
+            stats.count("size hints", value)
         else:
-            yield (function.getName(), function.getEntryPoint(), "0x" + function_id)
+            stats.count("matches (%s)" % tier, value)
 
 
-def matching_function(config):
-    # type (dict) -> None
-    functions_ids_db = config["database"]["functions"]
-    for function_name, function_entrypoint, function_id in generate_function_ids():
-        if function_id in list(functions_ids_db):
+def _match_functions(index, counters, tiers, workers, seeds):
+    # type (FunctionIdIndex|FunctionIdBinaryIndex, dict, dict, int, dict) -> None
+    for function_name, function_entrypoint, function_hashes in generate_function_ids(
+        counters, workers
+    ):
+        match = index.lookup(*function_hashes)
+        if match is None:
+            if SIZE_HINTS:
+                _report_size_hints(
+                    index, function_name, function_entrypoint, function_hashes, tiers
+                )
+            continue
 
+        new_function_name, tier, confidence = match
+        tiers[tier] = tiers.get(tier, 0) + 1
+        renamed = confidence >= MIN_CONFIDENCE
+        if renamed:
+            seeds[function_entrypoint.getOffset()] = (new_function_name, confidence)
+        if renamed and function_name != new_function_name:
+            counters["renames"] += 1
             current_function = fm.getFunctionContaining(function_entrypoint)
-            if function_name != functions_ids_db[function_id]:
-                current_function.setName(
-                    functions_ids_db[function_id],
-                    ghidra.program.model.symbol.SourceType.USER_DEFINED,
-                )
+            current_function.setName(
+                new_function_name,
+                ghidra.program.model.symbol.SourceType.USER_DEFINED,
+            )
 
-            print(
-                "FunctionEntryPoint: %s\tFunctionID: %s\tOriginalFunctionName: %s\tNewFunctionName: %s"
-                % (
-                    function_entrypoint,
-                    function_id,
-                    function_name,
-                    functions_ids_db[function_id],
-                )
+        print(
+            "FunctionEntryPoint: %s\tFunctionID: %s\tOriginalFunctionName: %s\t%s: %s\tTier: %s\tConfidence: %.2f"
+            % (
+                function_entrypoint,
+                function_hashes[0],
+                function_name,
+                "NewFunctionName" if renamed else "CandidateName",
+                new_function_name,
+                tier,
+                confidence,
             )
+        )
+
+
+def _report_size_hints(
+    index, function_name, function_entrypoint, function_hashes, tiers
+):
+    # type (FunctionIdIndex|FunctionIdBinaryIndex, str, Address, tuple, dict) -> None
+    """Print the database functions sharing the function size, nothing is renamed"""
+    names, bucket_size = index.size_candidates(function_hashes[2])
+    if not names:
+        return
+    tiers[TIER_SIZE] = tiers.get(TIER_SIZE, 0) + 1
+    if bucket_size > len(names):
+        names.append("... %d more" % (bucket_size - len(names)))
+    print(
+        "FunctionEntryPoint: %s\tFunctionID: %s\tOriginalFunctionName: %s\tSizeHint: %s"
+        % (function_entrypoint, function_hashes[0], function_name, ", ".join(names))
+    )
+
+
+def build_call_graph():
+    # type (None) -> CallGraph
+    """Single pass over the functions and their callees"""
+    graph = CallGraph()
+    default_source = ghidra.program.model.symbol.SourceType.DEFAULT
+    for function in fm.getFunctions(True):
+        key = function.getEntryPoint().getOffset()
+        thunked = function.getThunkedFunction(False) if function.isThunk() else None
+        graph.add_function(
+            key,
+            function.getBody().getNumAddresses(),
+            function.getSymbol().getSource() == default_source,
+            thunked.getEntryPoint().getOffset() if thunked is not None else None,
+        )
+        for callee in function.getCalledFunctions(monitor):
+            graph.add_call(key, callee.getEntryPoint().getOffset())
+    return graph
+
+
+def propagate_matches(graph, seeds):
+    # type (CallGraph, dict) -> int
+    """Name, tag and comment the thunks and wrappers of the matched functions"""
+    inferred = propagate_names(graph, seeds, MIN_CONFIDENCE)
+    for key, (name, kind, confidence, source) in inferred.items():
+        function = fm.getFunctionAt(toAddr(key))
+        old_name = function.getName()
+        function.setName(name, ghidra.program.model.symbol.SourceType.ANALYSIS)
+        function.addTag(PROPAGATION_TAGS[kind])
+        source_name = (seeds[source] if source in seeds else inferred[source])[0]
+        _append_comment(
+            function,
+            "FunctionID %s of %s (confidence %.2f)" % (kind, source_name, confidence),
+        )
+        print(
+            "FunctionEntryPoint: %s\tOriginalFunctionName: %s\tNewFunctionName: %s\tPropagated: %s\tConfidence: %.2f"
+            % (function.getEntryPoint(), old_name, name, kind, confidence)
+        )
+    return len(inferred)
+
+
+def _append_comment(function, line):
+    # type (Function, str) -> None
+    """Add `line` below the analyst's function comment, once"""
+    comment = function.getComment()
+    if not comment:
+        function.setComment(line)
+    elif line not in comment.splitlines():
+        function.setComment(comment + "\n" + line)
 
 
 def _load_function_ids_database(config_path):
     # type (str) -> dict
-    with open(config_path, "r") as f:
-        config = json.loads(f.read())
-    return config
+    return FunctionIdDb(config_path).load_database()
+
+
+def _binary_database_path(config_path):
+    # type (str) -> str
+    """Path of the binary database, None if missing or stale"""
+    binary_path = os.path.splitext(config_path)[0] + ".bin"
+    if not os.path.exists(binary_path):
+        return None
+    binary_mtime = os.path.getmtime(binary_path)
+    for path in (config_path, config_path + ".journal"):
+        if os.path.exists(path) and os.path.getmtime(path) > binary_mtime:
+            print("[!] %s is older than %s, ignoring it" % (binary_path, path))
+            return None
+    return binary_path
+
+
+def _load_function_ids_layers(layers_path):
+    # type (str) -> dict
+    layers_functions = list()
+    for layer_name, db in load_layers(layers_path):
+        try:
+            functions = db.load_database()["database"]["functions"]
+        except (IOError, OSError, ValueError) as err:
+            print("[!] Skipping database layer %s: %s" % (layer_name, err))
+            continue
+        print("[i] Database layer %s: %d entries" % (layer_name, len(functions)))
+        layers_functions.append(functions)
+
+    functions, conflicts = merge_functions(layers_functions)
+    for function_id, kept_name, other_names in conflicts:
+        print(
+            "[i] FunctionID: %s known as %s, keeping %s"
+            % (function_id, ", ".join(other_names), kept_name)
+        )
+    return {"database": {"entries": len(functions), "functions": functions}}
 
 
 def main():
     config = None
-    try:
-        config_path = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)), "fiddb.json"
-        )
-        config = _load_function_ids_database(config_path)
+    stats, args = stats_from_args("FunctionIdMatcher", getScriptArgs())
+    workers = HASH_WORKERS
+    propagate = PROPAGATE or "--propagate" in args
+    if "--workers" in args:
+        workers = int(args[args.index("--workers") + 1])
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    layers_path = os.path.join(script_dir, "fiddb_layers.json")
+    if os.path.exists(layers_path):
+        print("Database layers file found @ %s" % layers_path)
+        with stats.phase("load database"):
+            config = _load_function_ids_layers(layers_path)
+        matching_function(config, stats, workers, propagate)
+        stats.report()
+        return
+
+    config_path = os.path.join(script_dir, "fiddb.json")
+    binary_path = _binary_database_path(config_path)
+    if binary_path is not None:
+        print("Binary database found @ %s" % binary_path)
+        try:
+            with stats.phase("load database"):
+                index = FunctionIdBinaryIndex(binary_path)
+        except (IOError, OSError, ValueError) as err:
+            print("[!] Cannot read %s: %s" % (binary_path, err))
+            print(
+                "[!] Rebuild it with `tools/fiddb_tool.py to-binary %s`, or delete it"
+                " to use %s" % (config_path, config_path)
+            )
+            return
+        try:
+            matching_index(index, stats, workers, propagate)
+        finally:
+            index.close()
+        stats.report()
+        return
+
+    if os.path.exists(config_path):
         print("Previous configuration file found @ %s" % config_path)
-    except:
-        config = askFile("fiddb.json", "Choose a FunctionIdMatcher database")
-        import shutil
+    else:
+        chosen_path = str(
+            askFile("fiddb.json", "Choose a FunctionIdMatcher database")
+        )
+        # * a database created meanwhile (FunctionIdHashFunction) is kept
+        if not FunctionIdDb(config_path).install_database(chosen_path):
+            print("[i] %s was created meanwhile, keeping it" % config_path)
 
-        shutil.copy2(str(config), config_path)
+    # * read errors are reported as is, the database is never replaced here
+    with stats.phase("load database"):
         config = _load_function_ids_database(config_path)
 
-    matching_function(config)
+    matching_function(config, stats, workers, propagate)
+    stats.report()
 
 
 if __name__ == "__main__":
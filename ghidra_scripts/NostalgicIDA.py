@@ -10,47 +10,240 @@ some custom ones
     - Rename all `local_xxxx` variables to `var_xxxx`
     - Rename all `FUN_xxxx` functions to `sub_xxxx`
     - Rename all `_DAT_xxxx` or `DAT_xxxx` globals to `glob_`
+
+Every function is visited by default. Run with the `--incremental` script
+argument to only visit the functions added or changed since the previous
+run, as recorded by a program change listener (see ChangeTracker). Add
+`--stats` (or `--stats-json <path>`) to print per-phase timings and
+counters, see script_stats.py.
 """
 
-__version__ = "v0.0.3"
+__version__ = "v0.0.4"
+
+import re
+import threading
+import time
 
+from ghidra.framework.model import DomainObjectEvent, DomainObjectListener
 from ghidra.program.model.symbol import SourceType
 from ghidra.program.model.symbol import SymbolType
+from ghidra.program.util import ProgramEvent
+from java.lang import System
 
+from script_stats import stats_from_args
 
-def globals_rename():
-    # type (None) -> None
-    """Rename global variables with prefix
-    `DAT_` or `_DAT_` to `glob_`
+# * print every single rename, slow on large programs
+VERBOSE = False
+# * only visit functions added or changed since the previous run, or `--incremental`
+INCREMENTAL = False
+# * system property holding the ChangeTracker of a program, by identity hash
+TRACKER_PROPERTY = "NostalgicIDA.tracker.%d"
+# * program events marking the function at (or containing) their address
+TRACKED_EVENTS = (
+    ProgramEvent.FUNCTION_ADDED,
+    ProgramEvent.FUNCTION_BODY_CHANGED,
+    ProgramEvent.FUNCTION_CHANGED,
+    ProgramEvent.SYMBOL_ADDED,
+    ProgramEvent.SYMBOL_RENAMED,
+)
+
+# * global symbols rename rules: (prefix, new prefix, symbol type, uppercase suffix)
+# * a symbol type of None matches any symbol type
+RENAME_RULES = [
+    ("DAT_", "glob_", None, False),
+    ("_DAT_", "glob_", None, False),
+    ("LAB_", "loc_", SymbolType.LABEL, True),
+]
+
+
+def compile_rename_rules(rules):
+    # type (list) -> tuple (re.Pattern, dict)
+    """Compile rename rules into a single prefix matcher
+
+    Returns:
+        tuple: (compiled pattern, {prefix: rule})
     """
+    by_prefix = dict((rule[0], rule) for rule in rules)
+    # * longest prefixes first, so `_DAT_` is never shadowed by a shorter one
+    prefixes = sorted(by_prefix, key=len, reverse=True)
+    pattern = re.compile(
+        "^(%s)(.*)$" % "|".join(re.escape(prefix) for prefix in prefixes),
+        re.DOTALL,
+    )
+    return pattern, by_prefix
 
-    glob_types = {"DAT_": "", "_DAT_": ""}
 
-    for s in currentProgram.getSymbolTable().getAllSymbols(True):
-        symbol_name = s.getName()
+def globals_rename(rules=RENAME_RULES):
+    # type (list) -> list
+    """Collect renames of global symbols matching `rules`, by default
+    `DAT_` or `_DAT_` to `glob_` and labels `LAB_` to `loc_`
 
-        for prefix, var_type in glob_types.items():
-            if symbol_name.startswith(prefix):
-                _new_symbol_name = var_type + "glob_" + symbol_name[len(prefix) :]
-                s.setName(
-                    _new_symbol_name,
-                    SourceType.USER_DEFINED,
-                )
-                print("[i] Renamed %s to %s" % (symbol_name, _new_symbol_name))
-                break
+    Only symbols whose name starts with a rule prefix are visited.
+
+    Returns:
+        list: (symbol, old_name, new_name, kind) tuples
+    """
+
+    pattern, by_prefix = compile_rename_rules(rules)
+    symbol_table = currentProgram.getSymbolTable()
+    renames = list()
+    seen = set()
+
+    for prefix in by_prefix:
+        for s in symbol_table.getSymbolIterator(prefix + "*", True):
+            symbol_name = s.getName()
+            match = pattern.match(symbol_name)
+            if match is None or s.getID() in seen:
+                continue
+            # * overlapping rule prefixes report the same symbol more than once
+            seen.add(s.getID())
+
+            _, new_prefix, symbol_type, upper = by_prefix[match.group(1)]
+            if symbol_type is not None and s.getSymbolType() != symbol_type:
+                continue
+
+            suffix = match.group(2)
+            _new_symbol_name = new_prefix + (suffix.upper() if upper else suffix)
+            kind = "label" if s.getSymbolType() == SymbolType.LABEL else "global"
+            renames.append((s, symbol_name, _new_symbol_name, kind))
+
+    return renames
+
+
+def _changed_address(record):
+    # type (DomainObjectChangeRecord) -> Address
+    """Memory address a change record is about, None if it has none"""
+    start = record.getStart() if hasattr(record, "getStart") else None
+    if start is not None and start.isMemoryAddress():
+        return start
+    # * parameters and local variables live in the stack/register spaces
+    for value in (record.getObject(), record.getNewValue()):
+        if hasattr(value, "getSymbolType") and value.getSymbolType() in (
+            SymbolType.PARAMETER,
+            SymbolType.LOCAL_VAR,
+        ):
+            return value.getParentSymbol().getAddress()
+    return None
+
+
+class ChangeTracker(DomainObjectListener):
+    """Addresses of the functions and symbols added or changed in a program
+    since the previous incremental run
+
+    The tracker listens to the program from the first incremental run until
+    the program is closed, in a JVM-wide registry (the system properties) as
+    every script run gets a new interpreter. Undo/redo, or events re-enabled
+    by another script, flag a full rescan: the first incremental run after
+    opening a program visits every function as well.
+
+    The change events of the script's own renames are filtered out by
+    address (see expect_changes), events stay enabled so the changes made
+    meanwhile by anything else, auto-analysis included, are recorded.
+    """
+
+    def __init__(self, program, key):
+        self.program = program
+        self.key = key
+        self.lock = threading.Lock()
+        self.addresses = set()
+        self.rescan = True
+        # * address -> change events of the script's own renames still to come
+        self.expected_changes = dict()
+
+    def domainObjectChanged(self, event):
+        with self.lock:
+            for index in range(event.numRecords()):
+                record = event.getChangeRecord(index)
+                event_type = record.getEventType()
+                if event_type == DomainObjectEvent.RESTORED:
+                    self.rescan = True
+                elif event_type == DomainObjectEvent.CLOSED:
+                    self.close()
+                elif event_type in TRACKED_EVENTS:
+                    address = _changed_address(record)
+                    if address is None:
+                        continue
+                    expected = self.expected_changes.get(address, 0)
+                    if expected:
+                        self.expected_changes[address] = expected - 1
+                    else:
+                        self.addresses.add(address)
+
+    def take(self):
+        # type (None) -> tuple (bool, set)
+        """Return (rescan, addresses) and start tracking from scratch"""
+        with self.lock:
+            changes = (self.rescan, self.addresses)
+            self.rescan = False
+            self.addresses = set()
+            # * a rename sending fewer events than expected never hides a change
+            self.expected_changes = dict()
+        return changes
+
+    def retry(self, addresses):
+        # type (iterable) -> None
+        """Visit `addresses` again on the next run"""
+        with self.lock:
+            self.addresses.update(addresses)
 
-        if s.getSymbolType() == SymbolType.LABEL:
-            if symbol_name.startswith("LAB_"):
-                hexAddress = symbol_name[4:].upper()
-                _new_symbol_name = "loc_" + hexAddress
+    def expect_changes(self, addresses, count=1):
+        # type (iterable, int) -> None
+        """Ignore the next change event at each of `addresses`, the script's
+        own renames, a negative `count` withdraws them (the renames failed)"""
+        with self.lock:
+            for address in addresses:
+                expected = self.expected_changes.get(address, 0) + count
+                if expected > 0:
+                    self.expected_changes[address] = expected
+                else:
+                    self.expected_changes.pop(address, None)
 
-                s.setName(_new_symbol_name, SourceType.USER_DEFINED)
-                print("[i] Renamed %s to %s" % (symbol_name, _new_symbol_name))
+    def close(self):
+        # type (None) -> None
+        self.program.removeListener(self)
+        System.getProperties().remove(self.key)
 
 
-def functions_rename(ren_function=True, ren_args=False, ren_local_var=False):
-    # type (bool, bool, bool) -> None
-    """Rename functions, arguments and local variables
+def get_tracker(program, create=False):
+    # type (Program, bool) -> ChangeTracker
+    """ChangeTracker of `program`, registered first if `create`, else None"""
+    key = TRACKER_PROPERTY % System.identityHashCode(program)
+    properties = System.getProperties()
+    tracker = properties.get(key)
+    if tracker is None and create:
+        tracker = ChangeTracker(program, key)
+        program.addListener(tracker)
+        properties.put(key, tracker)
+    return tracker
+
+
+def changed_functions(addresses):
+    # type (iterable) -> list
+    """Functions at or containing `addresses`, in address order"""
+    func_manager = currentProgram.getFunctionManager()
+    functions = dict()
+    for address in addresses:
+        f = func_manager.getFunctionContaining(address)
+        if f is not None:
+            functions[f.getEntryPoint()] = f
+    return [functions[entry_point] for entry_point in sorted(functions)]
+
+
+def _rename_address(obj, kind):
+    # type (object, str) -> Address
+    """Address to visit again when the rename of `obj` failed"""
+    if kind == "function":
+        return obj.getEntryPoint()
+    if kind in ("parameter", "local var"):
+        return obj.getFunction().getEntryPoint()
+    return obj.getAddress()
+
+
+def functions_rename(
+    ren_function=True, ren_args=False, ren_local_var=False, functions=None
+):
+    # type (bool, bool, bool, list) -> tuple (list, int)
+    """Collect renames of functions, arguments and local variables
 
     Args:
         ren_function (bool, optional): rename function to `sub_<hex_value_uppercase>`.
@@ -59,37 +252,36 @@ def functions_rename(ren_function=True, ren_args=False, ren_local_var=False):
                                         Defaults to False.
         ren_local_var (bool, optional): rename local variables to `var<integer_number>`.
                                         Defaults to False.
+        functions (list, optional): functions to visit.
+                                        Defaults to every function.
+
+    Returns:
+        tuple: (object, old_name, new_name, kind) tuples, number of visited
+                functions
     """
-    func_manager = currentProgram.getFunctionManager()
+    if functions is None:
+        functions = currentProgram.getFunctionManager().getFunctions(True)
+    renames = list()
+    visited = 0
 
     if ren_function:
-        for f in func_manager.getFunctions(True):
+        for f in functions:
+            visited += 1
             function_name = f.getName()
             if not (f.isLibrary()):
                 if function_name.startswith("FUN_"):
                     _new_function_name = "sub_" + function_name[len("FUN_") :].upper()
-                    f.setName(_new_function_name, SourceType.USER_DEFINED)
-                    print(
-                        "[i] Renamed fnc: %s to %s"
-                        % (function_name, _new_function_name)
-                    )
+                    renames.append((f, function_name, _new_function_name, "function"))
 
                 if ren_args:
-                    print("[+] Starting renaming function's arguments ...")
                     args = f.getParameters()
                     for p in args:
                         arg = p.getName()
                         if arg.startswith("param_"):
                             _new_arg_name = "a" + arg[len("param_") :]
-
-                            p.setName(_new_arg_name, SourceType.USER_DEFINED)
-                            print(
-                                "[i] Renamed parameter: %s to %s in function %s"
-                                % (arg, _new_arg_name, function_name)
-                            )
+                            renames.append((p, arg, _new_arg_name, "parameter"))
 
                 if ren_local_var:
-                    print("[+] Starting renaming function's local variables ...")
                     variables = f.getAllVariables()
                     for local_var in variables:
                         str_symbol = local_var.getSymbol().getName()
@@ -99,33 +291,123 @@ def functions_rename(ren_function=True, ren_args=False, ren_local_var=False):
                             if str_symbol.startswith("local_"):
                                 str_symbol_ending = str_symbol[len("local_") :]
                                 _symbol = "var" + str_symbol_ending
-                                local_var.setName(_symbol, SourceType.USER_DEFINED)
-                                print(
-                                    "[i] Renamed local var: %s to %s in fnc %s"
-                                    % (str_symbol, _symbol, function_name)
+                                renames.append(
+                                    (local_var, str_symbol, _symbol, "local var")
                                 )
                         else:
                             # * usually found in listing (Assembly) view
                             str_symbol_ending = str_symbol[len("local_res") :]
                             _symbol = "arg_" + str_symbol_ending + "h"
-                            local_var.setName(_symbol, SourceType.USER_DEFINED)
-                            print(
-                                "[i] Renamed local var: %s to %s in fnc %s"
-                                % (str_symbol, _symbol, function_name)
+                            renames.append(
+                                (local_var, str_symbol, _symbol, "local var")
                             )
             else:
-                print("[ii] Function library %s found, skipping ..." % function_name)
+                if VERBOSE:
+                    print(
+                        "[ii] Function library %s found, skipping ..." % function_name
+                    )
+
+    return renames, visited
+
+
+def apply_renames(renames, tracker=None):
+    # type (list, ChangeTracker) -> tuple (dict, list)
+    """Apply collected renames in a single transaction
+
+    Ghidra runs a script inside its own transaction, the transaction opened
+    here nests into it: renames are committed together at the end of the
+    script either way. Program events stay enabled, the change event of
+    every rename is filtered out by `tracker` (see ChangeTracker).
+
+    Returns:
+        tuple: {kind: [renamed, failed]}, (object, kind) of the failed renames
+    """
+    summary = dict()
+    failed = list()
+    if tracker is not None:
+        # * registered before renaming, events may be sent synchronously
+        tracker.expect_changes(
+            _rename_address(obj, kind) for obj, _, _, kind in renames
+        )
+    transaction = currentProgram.startTransaction("NostalgicIDA renames")
+    try:
+        for obj, old_name, new_name, kind in renames:
+            counters = summary.setdefault(kind, [0, 0])
+            try:
+                obj.setName(new_name, SourceType.USER_DEFINED)
+            except Exception as err:
+                counters[1] += 1
+                failed.append((obj, kind))
+                print(
+                    "[!] Cannot rename %s %s to %s: %s"
+                    % (kind, old_name, new_name, err)
+                )
+                continue
+            counters[0] += 1
+            if VERBOSE:
+                print("[i] Renamed %s: %s to %s" % (kind, old_name, new_name))
+    finally:
+        currentProgram.endTransaction(transaction, True)
+        if tracker is not None and failed:
+            tracker.expect_changes(
+                (_rename_address(obj, kind) for obj, kind in failed), -1
+            )
+    return summary, failed
 
 
 def main():
     # type (None) -> None
 
-    print("[+] Starting renaming global symbols ...")
-    globals_rename()
-    print("[+] Starting renaming functions ...")
-    functions_rename(ren_function=True, ren_args=True, ren_local_var=True)
+    stats, args = stats_from_args("NostalgicIDA", getScriptArgs())
+    incremental = INCREMENTAL or "--incremental" in args
+    # * a full run also resets the tracker left by a previous incremental run
+    tracker = get_tracker(currentProgram, create=incremental)
+    functions = None
+    if tracker is not None:
+        rescan, addresses = tracker.take()
+        if incremental and not rescan:
+            functions = changed_functions(addresses)
+
+    start = time.time()
+    print("[+] Collecting global symbols ...")
+    with stats.phase("collect globals"):
+        renames = globals_rename()
+    stats.count("global renames collected", len(renames))
+    print(
+        "[+] Collecting %s functions ..."
+        % ("all" if functions is None else "%d changed" % len(functions))
+    )
+    with stats.phase("collect functions"):
+        function_renames, visited = functions_rename(
+            ren_function=True,
+            ren_args=True,
+            ren_local_var=True,
+            functions=functions,
+        )
+    stats.count("functions visited", visited)
+    stats.count("function renames collected", len(function_renames))
+    renames.extend(function_renames)
+    collected = time.time()
+
+    print("[+] Applying %d renames over %d functions ..." % (len(renames), visited))
+    with stats.phase("apply renames"):
+        summary, failed = apply_renames(renames, tracker)
+    if tracker is not None:
+        # * only successful renames count as processed
+        tracker.retry(_rename_address(obj, kind) for obj, kind in failed)
+    applied = time.time()
+
+    for kind in sorted(summary):
+        renamed, failures = summary[kind]
+        stats.count("%s renamed" % kind, renamed)
+        stats.count("%s failed" % kind, failures)
+        print("[i] %-10s renamed: %-8d failed: %d" % (kind, renamed, failures))
+    print(
+        "[i] Collected in %.2fs, applied in %.2fs"
+        % (collected - start, applied - collected)
+    )
+    stats.report()
 
 
 if __name__ == "__main__":
     main()
-
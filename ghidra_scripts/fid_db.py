@@ -0,0 +1,697 @@
+# @author _raw_data_ @ https://github.com/raw-data
+
+"""
+FunctionID database helpers shared by FunctionIdHashFunction and FunctionIdMatcher
+
+Each database entry is keyed by the FunctionID full hash and stores
+    - name: function name
+    - specific_hash: FunctionID specific hash
+    - size: function size in code units
+
+New entries are appended to a `<database>.journal` file (one JSON
+object per line) under a lock file, so concurrent writers never
+rewrite each other's data. The journal is folded back into the
+database by `FunctionIdDb.compact`, which writes a new file aside and
+atomically renames it over the database (see replace_file), readers
+always find either the old or the new database.
+
+`write_binary_database` exports the same content to a compact binary
+file (`fiddb.bin`) which `FunctionIdBinaryIndex` binary-searches in place,
+see the layout below.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import errno
+import json
+import os
+import shutil
+import struct
+import time
+
+try:
+    import mmap
+except ImportError:  # Jython 2.7
+    mmap = None
+
+try:
+    from java.nio.file import Files, Paths, StandardCopyOption
+except ImportError:  # CPython
+    Files = None
+
+DB_VERSION = "0.2"
+
+TIER_FULL = "full"
+TIER_SPECIFIC = "specific"
+TIER_SIZE = "size"
+
+# * confidence reported for a rename, by matching tier
+TIER_CONFIDENCE = {TIER_FULL: 1.0, TIER_SPECIFIC: 0.8}
+
+# * names reported per size bucket, see FunctionIdIndex.size_candidates
+SIZE_HINT_LIMIT = 5
+
+_HASH_MASK = 0xFFFFFFFFFFFFFFFF
+
+# * journal entries folded into the database by update_database
+JOURNAL_COMPACT_THRESHOLD = 1000
+
+MERGE_PRIORITY = "priority"
+MERGE_MAJORITY = "majority"
+
+# * binary database layout, all integers little endian
+#   header   BIN_HEADER: magic, format version, entries, offsets of the
+#            specific hash index, size index and string table,
+#            string table offset of last_update_utc
+#   records  `entries` x BIN_RECORD sorted by full hash:
+#            full hash, specific hash, size, name string offset
+#   specific BIN_SPECIFIC (specific hash, record number) sorted by hash
+#   size     BIN_SIZE (size, record number) sorted by size
+#   strings  NUL terminated UTF-8 strings
+BIN_MAGIC = b"FIDB"
+BIN_VERSION = 1
+BIN_HEADER = struct.Struct("<4sHHIIIII")
+BIN_RECORD = struct.Struct("<QQII")
+BIN_SPECIFIC = struct.Struct("<QI")
+BIN_SIZE = struct.Struct("<II")
+# * size of entries without one
+_BIN_NO_SIZE = 0xFFFFFFFF
+# * name offset flag of entries without a specific hash
+_BIN_NO_SPECIFIC = 0x80000000
+
+try:
+    _string_types = basestring  # Jython 2.7
+except NameError:
+    _string_types = str
+
+
+def format_hash(value):
+    # type (int|long|str) -> str
+    """Normalize a FunctionID hash (Java long or hex string) to `0x%016x`"""
+    if value is None:
+        return None
+    if isinstance(value, _string_types):
+        value = int(value, 16)
+    return "0x%016x" % (value & _HASH_MASK)
+
+
+def hash_function(fid_service, function):
+    # type (FidService, Function) -> tuple (str, str, int)
+    """Return (full_hash, specific_hash, size) of a function, None if it cannot be hashed"""
+    quad = fid_service.hashFunction(function)
+    if quad is None:
+        return None
+    return (
+        format_hash(quad.getFullHash()),
+        format_hash(quad.getSpecificHash()),
+        int(quad.getCodeUnitSize()),
+    )
+
+
+def make_entry(name, specific_hash=None, size=None):
+    # type (str, str, int) -> OrderedDict
+    return OrderedDict(
+        [("name", name), ("specific_hash", specific_hash), ("size", size)]
+    )
+
+
+def normalize_functions(functions):
+    # type (dict) -> OrderedDict
+    """Upgrade v0.1 entries (`{"0x...": "name"}`) and normalize hash keys"""
+    normalized = OrderedDict()
+    for full_hash, entry in functions.items():
+        if isinstance(entry, dict):
+            entry = make_entry(
+                entry["name"],
+                format_hash(entry.get("specific_hash")),
+                entry.get("size"),
+            )
+        else:
+            entry = make_entry(entry)
+        normalized[format_hash(full_hash)] = entry
+    return normalized
+
+
+def replace_file(source, destination):
+    # type (str, str) -> None
+    """Atomically rename `source` over `destination`, replacing it if it exists"""
+    if hasattr(os, "replace"):  # CPython 3
+        os.replace(source, destination)
+    elif Files is not None:
+        # * rename(2) on POSIX, MoveFileEx(MOVEFILE_REPLACE_EXISTING) on Windows
+        Files.move(
+            Paths.get(source),
+            Paths.get(destination),
+            StandardCopyOption.ATOMIC_MOVE,
+            StandardCopyOption.REPLACE_EXISTING,
+        )
+    else:
+        # * CPython 2 on POSIX, rename(2) replaces an existing file
+        os.rename(source, destination)
+
+
+class FileLock(object):
+    """Cross-process lock held by exclusively creating `<path>.lock`"""
+
+    def __init__(self, path, timeout=30.0, stale_after=120.0):
+        self.lock_path = path + ".lock"
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._fd = None
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                self._fd = os.open(
+                    self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY
+                )
+                return self
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            # * a crashed writer leaves the lock behind, break it once stale
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) > self.stale_after:
+                    os.remove(self.lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise IOError("Timeout waiting for lock %s" % self.lock_path)
+            time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        os.close(self._fd)
+        os.remove(self.lock_path)
+        return False
+
+
+class FunctionIdDb(object):
+    def __init__(self, config_path):
+        self.DB_SCHEMA = OrderedDict(
+            [
+                ("version", DB_VERSION),
+                (
+                    "database",
+                    OrderedDict(
+                        [("entries", 0), ("last_update_utc", ""), ("functions", {})]
+                    ),
+                ),
+            ]
+        )
+        self.config_path = config_path
+        self.journal_path = config_path + ".journal"
+
+    def init_database(self):
+        # type (None) -> bool
+        """Create an empty database, an existing one is never overwritten"""
+        with FileLock(self.config_path):
+            if os.path.exists(self.config_path):
+                return False
+            self._write_database(self.DB_SCHEMA)
+        return True
+
+    def install_database(self, source_path):
+        # type (str) -> bool
+        """Copy `source_path` as the database, unless one already exists"""
+        with FileLock(self.config_path):
+            if os.path.exists(self.config_path):
+                return False
+            tmp_path = self.config_path + ".tmp"
+            shutil.copy2(source_path, tmp_path)
+            replace_file(tmp_path, self.config_path)
+        return True
+
+    def load_database(self):
+        with open(self.config_path, "r") as f:
+            db = json.load(f, object_pairs_hook=OrderedDict)
+        db["version"] = DB_VERSION
+        functions = normalize_functions(db["database"]["functions"])
+        # * first writer wins, as in update_database
+        for full_hash, entry in self._read_journal():
+            if full_hash not in functions:
+                functions[full_hash] = entry
+        db["database"]["functions"] = functions
+        db["database"]["entries"] = len(functions)
+        return db
+
+    def update_database(self, new_entries):
+        # type (list) -> None
+        """Append `(full_hash, entry)` pairs not yet known to the database"""
+        with FileLock(self.config_path):
+            current_db = self.load_database()
+            functions = current_db["database"]["functions"]
+            journal_lines = list()
+            for full_hash, entry in new_entries:
+                if full_hash not in functions:
+                    print(
+                        "[+] FunctionName: %s\tFunctionID: %s added to database"
+                        % (entry["name"], full_hash)
+                    )
+                    functions[full_hash] = entry
+                    record = OrderedDict([("full_hash", full_hash)])
+                    record.update(entry)
+                    journal_lines.append(json.dumps(record) + "\n")
+                else:
+                    print(
+                        "[i] FunctionName: %s with FunctionID: %s is already known to the current database, skipping ..."
+                        % (entry["name"], full_hash)
+                    )
+
+            if journal_lines:
+                with open(self.journal_path, "a") as f:
+                    f.write("".join(journal_lines))
+
+            if self._journal_size() >= JOURNAL_COMPACT_THRESHOLD:
+                self._compact(current_db)
+
+    def replace_functions(self, functions, last_update_utc=None):
+        # type (dict, str) -> None
+        """Overwrite the database with the given function table"""
+        db = self.DB_SCHEMA
+        db["database"]["functions"] = functions
+        with FileLock(self.config_path):
+            self._compact(db, last_update_utc)
+
+    def compact(self):
+        # type (None) -> None
+        """Fold the journal into the database file"""
+        with FileLock(self.config_path):
+            self._compact(self.load_database())
+
+    def merge_databases(self, paths, strategy=MERGE_PRIORITY):
+        # type (list, str) -> tuple
+        """Overwrite the database with the merge of the databases at `paths`
+
+        The lock is held from loading the inputs to writing the result, an
+        entry journaled meanwhile (this database being one of the inputs) is
+        never dropped. Returns the entries count of each input, the merged
+        function table and the name conflicts (see merge_functions).
+        """
+        with FileLock(self.config_path):
+            functions_list = [
+                FunctionIdDb(path).load_database()["database"]["functions"]
+                for path in paths
+            ]
+            functions, conflicts = merge_functions(functions_list, strategy)
+            db = self.DB_SCHEMA
+            db["database"]["functions"] = functions
+            self._compact(db)
+        return [len(entries) for entries in functions_list], functions, conflicts
+
+    def _compact(self, current_db, last_update_utc=None):
+        current_db["database"]["entries"] = len(current_db["database"]["functions"])
+        current_db["database"]["last_update_utc"] = (
+            last_update_utc
+            if last_update_utc is not None
+            else datetime.utcnow().isoformat()
+        )
+        self._write_database(current_db)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def _write_database(self, db):
+        # * write aside and swap, readers never see a half written database
+        tmp_path = self.config_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(db, indent=2))
+        replace_file(tmp_path, self.config_path)
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                # * skip a trailing line cut short by a crashed writer
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                yield (
+                    format_hash(record["full_hash"]),
+                    make_entry(
+                        record["name"],
+                        format_hash(record.get("specific_hash")),
+                        record.get("size"),
+                    ),
+                )
+
+    def _journal_size(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, "r") as f:
+            return sum(1 for _ in f)
+
+
+def load_layers(layers_path):
+    # type (str) -> list
+    """Load a layers file and return its databases, highest priority first
+
+    {"layers": [{"name": "personal", "path": "fiddb.json"},
+                {"name": "family", "path": "families/artra.json"},
+                {"name": "team", "path": "/share/fid/team.json"}]}
+
+    Relative paths are resolved against the layers file directory.
+    """
+    with open(layers_path, "r") as f:
+        layers = json.load(f, object_pairs_hook=OrderedDict)["layers"]
+    base_dir = os.path.dirname(os.path.realpath(layers_path))
+    databases = list()
+    for layer in layers:
+        path = os.path.join(base_dir, os.path.expanduser(layer["path"]))
+        databases.append((layer.get("name", path), FunctionIdDb(path)))
+    return databases
+
+
+def merge_functions(functions_list, strategy=MERGE_PRIORITY):
+    # type (list, str) -> tuple (OrderedDict, list)
+    """Merge function tables, highest priority first
+
+    Entries are deduplicated by full hash. When the same full hash is known
+    under different names, `priority` keeps the name from the highest
+    priority table, `majority` keeps the most common name (ties go to
+    priority). Missing specific hash/size are filled from the other tables.
+
+    Returns the merged table and a list of (full_hash, kept_name, other_names).
+    """
+    merged = OrderedDict()
+    names = dict()
+    for functions in functions_list:
+        for full_hash, entry in functions.items():
+            names.setdefault(full_hash, list()).append(entry["name"])
+            if full_hash not in merged:
+                merged[full_hash] = make_entry(
+                    entry["name"], entry.get("specific_hash"), entry.get("size")
+                )
+                continue
+            kept = merged[full_hash]
+            if kept["specific_hash"] is None:
+                kept["specific_hash"] = entry.get("specific_hash")
+            if kept["size"] is None:
+                kept["size"] = entry.get("size")
+
+    conflicts = list()
+    for full_hash, candidates in names.items():
+        distinct = set(candidates)
+        if len(distinct) < 2:
+            continue
+        if strategy == MERGE_MAJORITY:
+            # * max() keeps the first (highest priority) name among ties
+            merged[full_hash]["name"] = max(candidates, key=candidates.count)
+        kept_name = merged[full_hash]["name"]
+        conflicts.append((full_hash, kept_name, sorted(distinct - set([kept_name]))))
+    return merged, conflicts
+
+
+class FunctionIdIndex(object):
+    """Precomputed lookup tables over the database functions
+
+    Matching tiers, tried in order:
+        - full hash equality
+        - specific hash equality, when unambiguous
+
+    Functions matching neither tier can look up the database functions of
+    the same size (size bucket). Both hashes already differ from every
+    entry of the bucket, so these are only hints, never renamed.
+    """
+
+    def __init__(self, functions):
+        # type (dict) -> None
+        self.by_full = dict()
+        self.by_specific = dict()
+        self.by_size = dict()
+
+        for full_hash, entry in functions.items():
+            name = entry["name"]
+            self.by_full[full_hash] = name
+            if entry.get("specific_hash"):
+                self._add_unique(self.by_specific, entry["specific_hash"], name)
+            if entry.get("size"):
+                bucket = self.by_size.setdefault(entry["size"], list())
+                if name not in bucket:
+                    bucket.append(name)
+
+    def __len__(self):
+        return len(self.by_full)
+
+    @staticmethod
+    def _add_unique(index, key, name):
+        # * None flags a key shared by different function names
+        if key not in index:
+            index[key] = name
+        elif index[key] != name:
+            index[key] = None
+
+    def lookup(self, full_hash, specific_hash=None, size=None):
+        # type (str, str, int) -> tuple (str, str, float)
+        """Return (name, tier, confidence) of the best match, None otherwise"""
+        name = self.by_full.get(full_hash)
+        if name is not None:
+            return (name, TIER_FULL, TIER_CONFIDENCE[TIER_FULL])
+        name = self.by_specific.get(specific_hash)
+        if name is not None:
+            return (name, TIER_SPECIFIC, TIER_CONFIDENCE[TIER_SPECIFIC])
+        return None
+
+    def size_candidates(self, size, limit=SIZE_HINT_LIMIT):
+        # type (int, int) -> tuple (list, int)
+        """Return (first `limit` names, number of names) of the size bucket"""
+        bucket = self.by_size.get(size, ())
+        return sorted(bucket)[:limit], len(bucket)
+
+
+def _hash_value(value):
+    # type (str) -> int
+    return int(value, 16) & _HASH_MASK
+
+
+def write_binary_database(functions, path, last_update_utc=""):
+    # type (dict, str, str) -> None
+    """Write a function table to the binary database format
+
+    The JSON entry order is not kept, records are sorted by full hash.
+    """
+    strings = bytearray()
+    string_offsets = dict()
+
+    def add_string(value):
+        data = value.encode("utf-8")
+        if data not in string_offsets:
+            string_offsets[data] = len(strings)
+            strings.extend(data + b"\x00")
+        return string_offsets[data]
+
+    update_offset = add_string(last_update_utc or "")
+    records = list()
+    for full_hash, entry in functions.items():
+        specific_hash = entry.get("specific_hash")
+        size = entry.get("size")
+        name_offset = add_string(entry["name"])
+        if specific_hash is None:
+            name_offset |= _BIN_NO_SPECIFIC
+        records.append(
+            (
+                _hash_value(full_hash),
+                _hash_value(specific_hash) if specific_hash is not None else 0,
+                size if size is not None else _BIN_NO_SIZE,
+                name_offset,
+            )
+        )
+    records.sort()
+
+    specific_index = sorted(
+        (record[1], number)
+        for number, record in enumerate(records)
+        if not record[3] & _BIN_NO_SPECIFIC
+    )
+    size_index = sorted(
+        (record[2], number)
+        for number, record in enumerate(records)
+        if record[2] != _BIN_NO_SIZE
+    )
+
+    specific_offset = BIN_HEADER.size + len(records) * BIN_RECORD.size
+    size_offset = specific_offset + len(specific_index) * BIN_SPECIFIC.size
+    strings_offset = size_offset + len(size_index) * BIN_SIZE.size
+
+    chunks = [
+        BIN_HEADER.pack(
+            BIN_MAGIC,
+            BIN_VERSION,
+            0,
+            len(records),
+            specific_offset,
+            size_offset,
+            strings_offset,
+            update_offset,
+        )
+    ]
+    chunks.extend(BIN_RECORD.pack(*record) for record in records)
+    chunks.extend(BIN_SPECIFIC.pack(*item) for item in specific_index)
+    chunks.extend(BIN_SIZE.pack(*item) for item in size_index)
+    chunks.append(bytes(strings))
+
+    # * write aside and swap, as FunctionIdDb._write_database
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(chunks))
+    replace_file(tmp_path, path)
+
+
+class FunctionIdBinaryIndex(object):
+    """Lookups over a binary database, same interface as FunctionIdIndex
+
+    The file is memory-mapped (read in one go under Jython, which has no
+    mmap module) and binary-searched in place, nothing is decoded upfront.
+    """
+
+    def __init__(self, path):
+        # type (str) -> None
+        self.path = path
+        with open(path, "rb") as f:
+            if mmap is not None and os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # * mmap refuses empty files
+                self.data = f.read()
+        if len(self.data) < BIN_HEADER.size:
+            self.close()
+            raise ValueError("%s is truncated (%d bytes)" % (path, len(self.data)))
+        (
+            magic,
+            version,
+            _,
+            self.entries,
+            self.specific_offset,
+            self.size_offset,
+            self.strings_offset,
+            self.update_offset,
+        ) = BIN_HEADER.unpack_from(self.data, 0)
+        if magic != BIN_MAGIC or version != BIN_VERSION:
+            self.close()
+            raise ValueError("%s is not a FunctionID binary database" % path)
+        if not (
+            BIN_HEADER.size + self.entries * BIN_RECORD.size
+            == self.specific_offset
+            <= self.size_offset
+            <= self.strings_offset
+            <= len(self.data)
+        ):
+            self.close()
+            raise ValueError("%s is truncated or corrupt" % path)
+        self.specific_entries = (
+            self.size_offset - self.specific_offset
+        ) // BIN_SPECIFIC.size
+        self.size_entries = (self.strings_offset - self.size_offset) // BIN_SIZE.size
+
+    def __len__(self):
+        return self.entries
+
+    def close(self):
+        if mmap is not None and isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def _string(self, offset):
+        # type (int) -> unicode
+        start = self.strings_offset + offset
+        return self.data[start : self.data.find(b"\x00", start)].decode("utf-8")
+
+    def _record(self, number):
+        # type (int) -> tuple (int, int, int, int)
+        return BIN_RECORD.unpack_from(
+            self.data, BIN_HEADER.size + number * BIN_RECORD.size
+        )
+
+    def _record_name(self, number):
+        return self._string(self._record(number)[3] & ~_BIN_NO_SPECIFIC)
+
+    def _lower_bound(self, base, record_struct, count, key):
+        # type (int, struct.Struct, int, int) -> int
+        """First position of a sorted table whose leading field is >= key"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = record_struct.unpack_from(self.data, base + mid * record_struct.size)
+            if value[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _unique_name(self, base, record_struct, count, key):
+        # type (int, struct.Struct, int, int) -> str
+        """Name shared by every record indexed under `key`, None if ambiguous"""
+        position = self._lower_bound(base, record_struct, count, key)
+        name = None
+        while position < count:
+            value, number = record_struct.unpack_from(
+                self.data, base + position * record_struct.size
+            )
+            if value != key:
+                break
+            record_name = self._record_name(number)
+            if name is not None and record_name != name:
+                return None
+            name = record_name
+            position += 1
+        return name
+
+    def lookup(self, full_hash, specific_hash=None, size=None):
+        # type (str, str, int) -> tuple (str, str, float)
+        """Return (name, tier, confidence) of the best match, None otherwise"""
+        key = _hash_value(full_hash)
+        position = self._lower_bound(BIN_HEADER.size, BIN_RECORD, self.entries, key)
+        if position < self.entries:
+            record = self._record(position)
+            if record[0] == key:
+                name = self._string(record[3] & ~_BIN_NO_SPECIFIC)
+                return (name, TIER_FULL, TIER_CONFIDENCE[TIER_FULL])
+        if specific_hash is not None:
+            name = self._unique_name(
+                self.specific_offset,
+                BIN_SPECIFIC,
+                self.specific_entries,
+                _hash_value(specific_hash),
+            )
+            if name is not None:
+                return (name, TIER_SPECIFIC, TIER_CONFIDENCE[TIER_SPECIFIC])
+        return None
+
+    def size_candidates(self, size, limit=SIZE_HINT_LIMIT):
+        # type (int, int) -> tuple (list, int)
+        """Return (first `limit` names, number of names) of the size bucket"""
+        if not size:
+            return [], 0
+        position = self._lower_bound(
+            self.size_offset, BIN_SIZE, self.size_entries, size
+        )
+        names = set()
+        while position < self.size_entries:
+            value, number = BIN_SIZE.unpack_from(
+                self.data, self.size_offset + position * BIN_SIZE.size
+            )
+            if value != size:
+                break
+            names.add(self._record_name(number))
+            position += 1
+        return sorted(names)[:limit], len(names)
+
+    def functions(self):
+        # type (None) -> OrderedDict
+        """Decode the whole function table, in the JSON database schema"""
+        functions = OrderedDict()
+        for number in range(self.entries):
+            full_hash, specific_hash, size, name_offset = self._record(number)
+            functions[format_hash(full_hash)] = make_entry(
+                self._string(name_offset & ~_BIN_NO_SPECIFIC),
+                None
+                if name_offset & _BIN_NO_SPECIFIC
+                else format_hash(specific_hash),
+                None if size == _BIN_NO_SIZE else size,
+            )
+        return functions
+
+    def last_update_utc(self):
+        # type (None) -> str
+        return self._string(self.update_offset)
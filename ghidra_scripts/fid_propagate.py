@@ -0,0 +1,112 @@
+# @author _raw_data_ @ https://github.com/raw-data
+
+"""
+Name propagation from FunctionID matches, used by FunctionIdMatcher
+
+Once functions are matched, their names are pushed to the functions that
+only exist to reach them:
+    - thunks of a named function become `j_<name>`
+    - small wrappers whose single callee is a named function become `w_<name>`
+
+Propagated names can propagate further (a thunk of a wrapper becomes
+`j_w_<name>`), each hop multiplying the confidence by PROPAGATION_DECAY.
+The call graph is built once and every function enters the worklist at
+most once, so a pass is linear in the call graph size.
+"""
+
+from collections import OrderedDict, deque
+
+THUNK_PREFIX = "j_"
+WRAPPER_PREFIX = "w_"
+
+KIND_THUNK = "thunk"
+KIND_WRAPPER = "wrapper"
+
+# * function tags of the propagated names
+PROPAGATION_TAGS = {KIND_THUNK: "FID_THUNK", KIND_WRAPPER: "FID_WRAPPER"}
+
+# * confidence kept at each propagation hop
+PROPAGATION_DECAY = 0.9
+# * biggest function (in addresses) considered a wrapper
+WRAPPER_MAX_SIZE = 64
+
+
+class CallGraph(object):
+    """Call graph keyed by function entry point offsets"""
+
+    def __init__(self):
+        self.callees = dict()
+        self.callers = dict()
+        self.thunk_of = dict()
+        self.sizes = dict()
+        # * functions still carrying a default (analysis generated) name
+        self.renamable = set()
+
+    def add_function(self, key, size, renamable, thunk_of=None):
+        # type (int, int, bool, int) -> None
+        self.callees.setdefault(key, set())
+        self.callers.setdefault(key, set())
+        self.sizes[key] = size
+        if renamable:
+            self.renamable.add(key)
+        if thunk_of is not None:
+            # * a thunk jumps to its target, count it as a call edge
+            self.thunk_of[key] = thunk_of
+            self.add_call(key, thunk_of)
+
+    def add_call(self, caller, callee):
+        # type (int, int) -> None
+        self.callees.setdefault(caller, set()).add(callee)
+        self.callers.setdefault(callee, set()).add(caller)
+
+    def __len__(self):
+        return len(self.callees)
+
+
+def _propagation_kind(graph, caller, callee):
+    # type (CallGraph, int, int) -> str
+    if graph.thunk_of.get(caller) == callee:
+        return KIND_THUNK
+    if (
+        graph.callees.get(caller) == set([callee])
+        and graph.sizes.get(caller, 0) <= WRAPPER_MAX_SIZE
+    ):
+        return KIND_WRAPPER
+    return None
+
+
+def propagate_names(graph, seeds, min_confidence, decay=PROPAGATION_DECAY):
+    # type (CallGraph, dict, float, float) -> OrderedDict
+    """Infer names of thunks and wrappers around the `seeds` functions
+
+    Args:
+        graph (CallGraph): program call graph.
+        seeds (dict): {entry point: (name, confidence)} of the matched functions.
+        min_confidence (float): propagation stops below this confidence.
+        decay (float, optional): confidence kept at each hop.
+
+    Returns:
+        OrderedDict: {entry point: (name, kind, confidence, source entry point)}
+                     in propagation order
+    """
+    known = dict(seeds)
+    inferred = OrderedDict()
+    worklist = deque(sorted(seeds))
+
+    while worklist:
+        callee = worklist.popleft()
+        name, confidence = known[callee]
+        confidence *= decay
+        if confidence < min_confidence:
+            continue
+        for caller in sorted(graph.callers.get(callee, ())):
+            if caller in known or caller not in graph.renamable:
+                continue
+            kind = _propagation_kind(graph, caller, callee)
+            if kind is None:
+                continue
+            prefix = THUNK_PREFIX if kind == KIND_THUNK else WRAPPER_PREFIX
+            known[caller] = (prefix + name, confidence)
+            inferred[caller] = (prefix + name, kind, confidence, callee)
+            worklist.append(caller)
+    return inferred
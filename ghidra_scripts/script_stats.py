@@ -0,0 +1,139 @@
+# @author _raw_data_ @ https://github.com/raw-data
+
+"""
+Per-phase wall time and API call counters for the Ghidra scripts
+
+Enabled with the `--stats` script argument (or RE_MISC_STATS=1), add
+`--stats-json <path>` (or RE_MISC_STATS_JSON=<path>) to also dump a JSON
+profile. When disabled, scripts get a NullStats whose methods do nothing.
+
+    stats, args = stats_from_args("NostalgicIDA", getScriptArgs())
+    with stats.phase("collect"):
+        ...
+    stats.count("renames", len(renames))
+    stats.report()
+"""
+
+from collections import OrderedDict
+import json
+import os
+import time
+
+
+class _Phase(object):
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.time() - self.start
+        phases = self.stats.phases
+        phases[self.name] = phases.get(self.name, 0.0) + elapsed
+        return False
+
+
+class ScriptStats(object):
+    enabled = True
+
+    def __init__(self, script_name, json_path=None):
+        self.script_name = script_name
+        self.json_path = json_path
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        self.start = time.time()
+
+    def phase(self, name):
+        # type (str) -> _Phase
+        """Context manager adding the wall time of the block to phase `name`"""
+        return _Phase(self, name)
+
+    def count(self, name, value=1):
+        # type (str, int) -> None
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        # type (None) -> OrderedDict
+        return OrderedDict(
+            [
+                ("script", self.script_name),
+                ("total_seconds", round(time.time() - self.start, 6)),
+                (
+                    "phases",
+                    OrderedDict((k, round(v, 6)) for k, v in self.phases.items()),
+                ),
+                ("counters", self.counters),
+            ]
+        )
+
+    def report(self):
+        # type (None) -> None
+        """Print the summary table, and dump the JSON profile if requested"""
+        profile = self.as_dict()
+        lines = [
+            "[stats] %s - total %.3fs" % (self.script_name, profile["total_seconds"])
+        ]
+        for name, seconds in profile["phases"].items():
+            lines.append("[stats]   phase   %-28s %10.3fs" % (name, seconds))
+        for name, value in profile["counters"].items():
+            lines.append("[stats]   counter %-28s %10d" % (name, value))
+        print("\n".join(lines))
+
+        if self.json_path:
+            with open(self.json_path, "w") as f:
+                f.write(json.dumps(profile, indent=2))
+            print("[stats] JSON profile written to %s" % self.json_path)
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class NullStats(object):
+    """Disabled stats, same interface as ScriptStats"""
+
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def count(self, name, value=1):
+        pass
+
+    def report(self):
+        pass
+
+
+def stats_from_args(script_name, args):
+    # type (str, list) -> tuple (ScriptStats|NullStats, list)
+    """Build the stats object from the script arguments and environment,
+    returns it with the remaining (non stats) arguments"""
+    args = list(args)
+    enabled = os.environ.get("RE_MISC_STATS", "") not in ("", "0")
+    json_path = os.environ.get("RE_MISC_STATS_JSON") or None
+
+    if "--stats" in args:
+        args.remove("--stats")
+        enabled = True
+    if "--stats-json" in args:
+        index = args.index("--stats-json")
+        json_path = args[index + 1]
+        del args[index : index + 2]
+        enabled = True
+
+    if json_path:
+        enabled = True
+    if not enabled:
+        return NullStats(), args
+    return ScriptStats(script_name, json_path), args
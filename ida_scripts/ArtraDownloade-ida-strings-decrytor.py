@@ -1,52 +1,188 @@
-from idautils import *
-from idc import *
-
-############################################################################
-# ArtraDownloader v1 - strings decryptor
-#
-# Ref sample:
-#	file name: winsvc
-#   md5: 7cc0b212d1b8ceb808c250495d83bae4  
-#   sha1: d2c161ce52240b61d632607a2262890327d82502
-#   sha256: ef0cb0a1a29bcdf2b36622f72734aec8d38326fc8f7270f78bd956e706a5fd57
-#
-# Ref links: 
-#	2018.12.19 https://twitter.com/malwrhunterteam/status/1075454863008382976
-#	2018.12.21 https://gist.github.com/raw-data/14915eca4e5e2963a9056f935442358d
-#	2019.02.25 https://unit42.paloaltonetworks.com/multiple-artradownloader-variants-used-by-bitter-to-target-pakistan/
-############################################################################
-
-__author__ = 'raw-data'
-
-def decrypt_string(enc_str):
-	mapping = (enc_str, ''.join([chr(ord(char) - 1) for char in enc_str]))
-	return(mapping[1])
-
-def get_string(addr):
-	return GetString(addr)
-
-def get_function_args(addr):
-  while True:
-    addr = idc.PrevHead(addr)
-    if GetMnem(addr) == "mov" and "eax" in GetOpnd(addr, 0):
-      return GetOperandValue(addr, 1)
-      break
-
-def extract_encrypted_str(xrefs):
-	for addr in xrefs:
-	  ref = get_function_args((addr.frm))
-	  enc_str = get_string(ref)
-	  dec_str = decrypt_string(enc_str)
-
-	  # add comments
-	  MakeComm(addr.frm, dec_str)
-	  MakeComm(ref, dec_str)
-
-	  # print results to console
-	  print("Address: %-40s Enc string: %-40s Dec string: %-40s" % (addr.frm, dec_str, dec_str))
-
-def run():
-	xrefs = XrefsTo(0x004026b0, flags=0)
-	extract_encrypted_str(xrefs)
-
-run()
\ No newline at end of file
+import os
+import sys
+
+from idautils import *
+from idc import *
+
+############################################################################
+# Strings decryptor - ArtraDownloader v1 by default
+#
+# Ref sample:
+#	file name: winsvc
+#   md5: 7cc0b212d1b8ceb808c250495d83bae4
+#   sha1: d2c161ce52240b61d632607a2262890327d82502
+#   sha256: ef0cb0a1a29bcdf2b36622f72734aec8d38326fc8f7270f78bd956e706a5fd57
+#
+# Ref links:
+#	2018.12.19 https://twitter.com/malwrhunterteam/status/1075454863008382976
+#	2018.12.21 https://gist.github.com/raw-data/14915eca4e5e2963a9056f935442358d
+#	2019.02.25 https://unit42.paloaltonetworks.com/multiple-artradownloader-variants-used-by-bitter-to-target-pakistan/
+#
+# The sample profile (decryptor address, argument register, transform) is read
+# from common/strdecrypt_profiles.json, change PROFILE to decrypt other families.
+#
+# With SCAN_MODE (or a profile without a decryptor address) candidate
+# decryption routines are discovered by byte signature or xref-count
+# heuristic, and every xref is decrypted.
+#
+# Comments are written in one pass once all strings are decrypted, set
+# EXPORT_PATH to export results to JSON (or CSV, .csv extension),
+# CREATE_DATA to define the encrypted strings as byte arrays and
+# CREATE_LABELS to label them (s_<decrypted string>, made unique).
+############################################################################
+
+__author__ = 'raw-data'
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common")
+)
+
+from strdecrypt import (
+    c_string,
+    export_results,
+    label_name,
+    load_profile,
+    make_result,
+    to_bytes,
+    unique_label,
+)
+
+PROFILE = "artradownloader_v1"
+SCAN_MODE = False
+# instructions walked back from a call site looking for the string argument
+ARG_WINDOW = 32
+EXPORT_PATH = None
+CREATE_DATA = False
+CREATE_LABELS = False
+PRINT_RESULTS = True
+
+
+def get_string(addr, profile):
+    return c_string(to_bytes(GetString(addr) or b""))
+
+
+def get_function_args(addr, profile, window=ARG_WINDOW):
+    register = profile.arg_register.lower()
+    for _ in range(window):
+        addr = idc.PrevHead(addr)
+        if addr == BADADDR:
+            break
+        if GetMnem(addr) == "mov" and register in GetOpnd(addr, 0):
+            return GetOperandValue(addr, 1)
+    return None
+
+
+def extract_encrypted_str(xrefs, profile, enc_buffer):
+    # encrypted string address -> (encrypted string, call sites)
+    for addr in xrefs:
+        ref = get_function_args(addr.frm, profile)
+        if ref is None:
+            continue
+        if ref in enc_buffer:
+            enc_buffer[ref][1].append(addr.frm)
+            continue
+        enc_buffer[ref] = (get_string(ref, profile), [addr.frm])
+
+
+def decrypt_enc_str(enc_buffer, profile):
+    addresses = sorted(enc_buffer)
+    enc_strs = [enc_buffer[ref][0] for ref in addresses]
+    dec_strs = profile.decrypt_many(enc_strs)
+    return [
+        make_result(ref, enc_buffer[ref][1], enc_str, dec_str)
+        for ref, enc_str, dec_str in zip(addresses, enc_strs, dec_strs)
+    ]
+
+
+def write_annotations(results):
+    # labels given in this pass, IDA only knows them once named
+    labels = set()
+    for result in results:
+        ref = result["address"]
+        # add comments
+        for frm in result["call_sites"]:
+            MakeComm(frm, result["decrypted"])
+        MakeComm(ref, result["decrypted"])
+        if CREATE_DATA:
+            # the bytes are still encrypted, not a string to display
+            size = len(result["encrypted"]) + 1
+            MakeUnknown(ref, size, DOUNK_SIMPLE)
+            MakeByte(ref)
+            MakeArray(ref, size)
+        if CREATE_LABELS:
+            name = unique_label(
+                label_name(result["decrypted"]),
+                lambda candidate: candidate in labels
+                or LocByName(candidate) not in (BADADDR, ref),
+            )
+            # no warning dialog on failure, reported below instead
+            if MakeNameEx(ref, name, SN_NOWARN | SN_NOCHECK):
+                labels.add(name)
+            else:
+                print("[!] Cannot label 0x%x as %s" % (ref, name))
+
+
+def print_results(results, profile):
+    # a single write to the console
+    print("\n".join(
+        "Address: 0x%-38x Enc string: %-40s Dec string: %-40s" % (r["address"], r["encrypted"].decode(profile.encoding, "replace"), r["decrypted"])
+        for r in results
+    ))
+
+
+def find_decryptors(profile):
+    candidates = {}
+    scan = profile.scan
+
+    if scan["signature"]:
+        ea = FindBinary(MinEA(), SEARCH_DOWN, scan["signature"])
+        while ea != BADADDR:
+            start = GetFunctionAttr(ea, FUNCATTR_START)
+            if start != BADADDR:
+                candidates.setdefault(start, "signature")
+            ea = FindBinary(ea + 1, SEARCH_DOWN, scan["signature"])
+
+    # single pass over the function list for the xref heuristic
+    if scan["min_xrefs"] is not None:
+        for start in Functions():
+            if start in candidates:
+                continue
+            size = GetFunctionAttr(start, FUNCATTR_END) - start
+            if size <= scan["max_size"] and len(list(XrefsTo(start, flags=0))) >= scan["min_xrefs"]:
+                candidates[start] = "xrefs"
+
+    # keep candidates whose call sites mostly load a string argument
+    decryptors = []
+    for start, reason in sorted(candidates.items()):
+        xrefs = list(XrefsTo(start, flags=0))
+        if not xrefs:
+            continue
+        resolved = [x for x in xrefs if get_function_args(x.frm, profile) is not None]
+        if float(len(resolved)) / len(xrefs) >= scan["min_resolved"]:
+            print("[+] Decryptor candidate @ 0x%x (%s, %d/%d call sites resolved)" % (start, reason, len(resolved), len(xrefs)))
+            decryptors.append(start)
+    return decryptors
+
+
+def run():
+    profile = load_profile(PROFILE)
+    if SCAN_MODE or profile.decryptor is None:
+        decryptors = find_decryptors(profile)
+    else:
+        decryptors = [profile.decryptor]
+
+    enc_buffer = {}
+    for decryptor in decryptors:
+        extract_encrypted_str(XrefsTo(decryptor, flags=0), profile, enc_buffer)
+
+    results = decrypt_enc_str(enc_buffer, profile)
+    write_annotations(results)
+    if PRINT_RESULTS:
+        print_results(results, profile)
+    if EXPORT_PATH:
+        export_results(results, EXPORT_PATH)
+        print("[+] Results exported to %s" % EXPORT_PATH)
+    print("[+] %d strings decrypted from %d decryptor(s)" % (len(results), len(decryptors)))
+
+
+run()
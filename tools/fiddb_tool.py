@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+from typing import List
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "ghidra_scripts")
+)
+
+from fid_db import (  # noqa: E402
+    MERGE_MAJORITY,
+    MERGE_PRIORITY,
+    FunctionIdBinaryIndex,
+    FunctionIdDb,
+    write_binary_database,
+)
+
+"""
+Offline maintenance of FunctionIdMatcher databases (fiddb.json)
+
+    ./fiddb_tool.py merge personal.json team.json -o fiddb.json
+    ./fiddb_tool.py to-binary fiddb.json        # writes fiddb.bin
+    ./fiddb_tool.py to-json fiddb.bin -o fiddb.json
+"""
+
+
+def merge(inputs: List[str], output: str, strategy: str) -> None:
+    """
+    Merge databases into `output`, inputs listed by decreasing priority.
+
+    :param inputs: Database paths, highest priority first.
+    :type inputs: List[str]
+    :param output: Merged database path, overwritten.
+    :type output: str
+    :param strategy: Name conflict resolution strategy.
+    :type strategy: str
+    """
+    # * the output stays locked from loading the inputs to writing the merge
+    counts, functions, conflicts = FunctionIdDb(output).merge_databases(
+        inputs, strategy
+    )
+    for path, count in zip(inputs, counts):
+        print(f"[i] {path}: {count} entries")
+    for function_id, kept_name, other_names in conflicts:
+        print(
+            f"[i] FunctionID: {function_id} known as {', '.join(other_names)}, keeping {kept_name}"
+        )
+
+    print(
+        f"[+] {output}: {len(functions)} entries merged, {len(conflicts)} name conflicts"
+    )
+
+
+def compact(paths: List[str]) -> None:
+    """
+    Fold pending journal entries into each database.
+
+    :param paths: Database paths.
+    :type paths: List[str]
+    """
+    for path in paths:
+        FunctionIdDb(path).compact()
+        print(f"[+] {path} compacted")
+
+
+def to_binary(path: str, output: str) -> None:
+    """
+    Export a JSON database (and its pending journal) to the binary format.
+
+    :param path: fiddb.json path.
+    :type path: str
+    :param output: Binary database path, overwritten.
+    :type output: str
+    """
+    database = FunctionIdDb(path).load_database()["database"]
+    write_binary_database(
+        database["functions"], output, database.get("last_update_utc", "")
+    )
+    print(
+        f"[+] {output}: {len(database['functions'])} entries, "
+        f"{os.path.getsize(output)} bytes (JSON: {os.path.getsize(path)} bytes)"
+    )
+
+
+def to_json(path: str, output: str) -> None:
+    """
+    Convert a binary database back to the JSON format.
+
+    :param path: Binary database path.
+    :type path: str
+    :param output: fiddb.json path, overwritten.
+    :type output: str
+    """
+    index = FunctionIdBinaryIndex(path)
+    try:
+        functions = index.functions()
+        FunctionIdDb(output).replace_functions(functions, index.last_update_utc())
+    finally:
+        index.close()
+    print(f"[+] {output}: {len(functions)} entries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="FunctionIdMatcher database maintenance"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_merge = subparsers.add_parser(
+        "merge", help="Merge databases, deduplicating by FunctionID full hash."
+    )
+    parser_merge.add_argument(
+        "inputs", nargs="+", help="Databases to merge, highest priority first."
+    )
+    parser_merge.add_argument(
+        "-o", "--output", required=True, help="Merged database path."
+    )
+    parser_merge.add_argument(
+        "--strategy",
+        choices=[MERGE_PRIORITY, MERGE_MAJORITY],
+        default=MERGE_PRIORITY,
+        help="Name conflict resolution. (default: %(default)s)",
+    )
+
+    parser_compact = subparsers.add_parser(
+        "compact", help="Fold the append-only journal into the database."
+    )
+    parser_compact.add_argument("paths", nargs="+", help="Databases to compact.")
+
+    parser_to_binary = subparsers.add_parser(
+        "to-binary",
+        help="Export a database to the binary format read by FunctionIdMatcher.",
+    )
+    parser_to_binary.add_argument("path", help="JSON database.")
+    parser_to_binary.add_argument(
+        "-o", "--output", help="Binary database path. (default: <path>.bin)"
+    )
+
+    parser_to_json = subparsers.add_parser(
+        "to-json", help="Convert a binary database back to JSON."
+    )
+    parser_to_json.add_argument("path", help="Binary database.")
+    parser_to_json.add_argument(
+        "-o", "--output", required=True, help="JSON database path."
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        if os.path.exists(args.output) and not any(
+            os.path.samefile(args.output, path) for path in args.inputs
+        ):
+            parser.error(
+                f"{args.output} already exists, list it among the inputs to keep its entries"
+            )
+        merge(args.inputs, args.output, args.strategy)
+    elif args.command == "compact":
+        compact(args.paths)
+    elif args.command == "to-binary":
+        to_binary(args.path, args.output or os.path.splitext(args.path)[0] + ".bin")
+    elif args.command == "to-json":
+        to_json(args.path, args.output)
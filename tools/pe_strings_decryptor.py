@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common")
+)
+
+from strdecrypt import (  # noqa: E402
+    Profile,
+    c_string,
+    export_results,
+    load_profile,
+    make_result,
+)
+
+"""
+Offline strings decryption over raw PE files, no disassembler required.
+
+Call sites of the decryptor are located with a lightweight x86 scan for
+`mov <arg_register>, imm32` followed (within a few bytes) by `call rel32`
+to the decryptor RVA, the referenced strings are decrypted with the
+`common/strdecrypt.py` profile engine and emitted as JSON.
+
+The bytes between the `mov` and the `call` must decode, with the small
+length decoder below, as whole instructions ending exactly at the call and
+leaving the argument register alone, and the immediate must be an address
+inside the image: a 0xB8+r byte inside an immediate or a ModRM byte of
+another instruction is not taken for the `mov`.
+"""
+
+# * opcode of `mov r32, imm32` (B8+r)
+MOV_IMM32_OPCODES = {
+    "EAX": 0xB8,
+    "ECX": 0xB9,
+    "EDX": 0xBA,
+    "EBX": 0xBB,
+    "ESP": 0xBC,
+    "EBP": 0xBD,
+    "ESI": 0xBE,
+    "EDI": 0xBF,
+}
+# * max bytes between the end of the `mov` and the `call`
+MAX_MOV_CALL_GAP = 16
+
+# * instructions accepted between the `mov` and the `call`, by opcode:
+#   (ModRM byte, immediate size, writes: "reg" ModRM reg field, "rm" ModRM
+#   r/m field when a register, "op" low 3 bits of the opcode, None)
+GAP_OPCODES: Dict[int, Tuple[bool, int, Optional[str]]] = {
+    0x90: (False, 0, None),  # nop
+    0x6A: (False, 1, None),  # push imm8
+    0x68: (False, 4, None),  # push imm32
+    0x85: (True, 0, None),  # test r/m32, r32
+    0x83: (True, 1, "rm"),  # add/or/.../cmp r/m32, imm8
+    0x81: (True, 4, "rm"),  # add/or/.../cmp r/m32, imm32
+    0xC7: (True, 4, "rm"),  # mov r/m32, imm32
+    0xFF: (True, 0, "rm"),  # inc/dec/push r/m32 (call/jmp rejected)
+}
+GAP_OPCODES.update((opcode, (False, 0, None)) for opcode in range(0x50, 0x58))
+GAP_OPCODES.update((opcode, (False, 0, "op")) for opcode in range(0x58, 0x60))
+# * mov r8, imm8: AL CL DL BL then AH CH DH BH, parts of EAX to EBX
+GAP_OPCODES.update((opcode, (False, 1, "op")) for opcode in range(0xB0, 0xB8))
+GAP_OPCODES.update((opcode, (False, 4, "op")) for opcode in range(0xB8, 0xC0))
+# * ALU and mov: r/m32 <- r32 and r32 <- r/m32 (lea), cmp writes nothing
+for _opcode in (0x01, 0x09, 0x11, 0x19, 0x21, 0x29, 0x31, 0x89):
+    GAP_OPCODES[_opcode] = (True, 0, "rm")
+for _opcode in (0x03, 0x0B, 0x13, 0x1B, 0x23, 0x2B, 0x33, 0x8B, 0x8D):
+    GAP_OPCODES[_opcode] = (True, 0, "reg")
+for _opcode in (0x39, 0x3B):
+    GAP_OPCODES[_opcode] = (True, 0, None)
+# * group 1 /7 is cmp, group 5 /6 is push and /2 to /5 are call and jmp
+_NO_WRITE_EXTENSIONS = {0x83: (7,), 0x81: (7,), 0xFF: (6,)}
+_FF_ALLOWED_EXTENSIONS = (0, 1, 6)
+
+IMAGE_SCN_CNT_CODE = 0x00000020
+IMAGE_SCN_MEM_EXECUTE = 0x20000000
+
+
+class Section(NamedTuple):
+    name: str
+    virtual_size: int
+    virtual_address: int
+    raw_size: int
+    raw_offset: int
+    characteristics: int
+
+    @property
+    def is_code(self) -> bool:
+        return bool(
+            self.characteristics & (IMAGE_SCN_CNT_CODE | IMAGE_SCN_MEM_EXECUTE)
+        )
+
+
+class PEImage(object):
+    """
+    Minimal PE32 parser: image base and section table.
+    """
+
+    def __init__(self, data: mmap.mmap) -> None:
+        self.data = data
+        if data[:2] != b"MZ":
+            raise ValueError("Missing MZ header")
+        (pe_offset,) = struct.unpack_from("<I", data, 0x3C)
+        if data[pe_offset : pe_offset + 4] != b"PE\x00\x00":
+            raise ValueError("Missing PE header")
+
+        number_of_sections, optional_header_size = struct.unpack_from(
+            "<H12xH", data, pe_offset + 6
+        )
+        optional_header = pe_offset + 24
+        (magic,) = struct.unpack_from("<H", data, optional_header)
+        if magic != 0x10B:
+            raise ValueError("Only PE32 (x86) images are supported")
+        (self.image_base,) = struct.unpack_from("<I", data, optional_header + 28)
+
+        self.sections: List[Section] = []
+        section_table = optional_header + optional_header_size
+        for index in range(number_of_sections):
+            fields = struct.unpack_from(
+                "<8sIIII12xI", data, section_table + index * 40
+            )
+            name = fields[0].rstrip(b"\x00").decode("latin-1")
+            self.sections.append(Section(name, *fields[1:]))
+
+    def rva_to_offset(self, rva: int) -> Optional[int]:
+        """
+        Convert an RVA to a raw file offset.
+
+        :param rva: Relative virtual address.
+        :type rva: int
+        :return: File offset, None if the RVA is not backed by file data.
+        :rtype: Optional[int]
+        """
+        for section in self.sections:
+            if section.virtual_address <= rva < section.virtual_address + max(
+                section.virtual_size, section.raw_size
+            ):
+                delta = rva - section.virtual_address
+                if delta < section.raw_size:
+                    return section.raw_offset + delta
+        return None
+
+    def va_to_offset(self, va: int) -> Optional[int]:
+        return self.rva_to_offset(va - self.image_base)
+
+
+def _modrm_length(data: mmap.mmap, position: int) -> int:
+    """
+    Size of a 32-bit addressing ModRM byte, with its SIB byte and displacement.
+    """
+    modrm = data[position]
+    mod, rm = modrm >> 6, modrm & 7
+    if mod == 3:
+        return 1
+    length = 1
+    if rm == 4:
+        length += 1
+        if mod == 0 and data[position + 1] & 7 == 5:
+            length += 4
+    elif mod == 0 and rm == 5:
+        length += 4
+    return length + {0: 0, 1: 1, 2: 4}[mod]
+
+
+def _decodes_to(data: mmap.mmap, position: int, end: int, register: int) -> bool:
+    """
+    True if data[position:end] decodes as whole GAP_OPCODES instructions
+    that do not write `register` (0 EAX ... 7 EDI).
+    """
+    while position < end:
+        opcode = data[position]
+        if opcode not in GAP_OPCODES:
+            return False
+        has_modrm, immediate_size, writes = GAP_OPCODES[opcode]
+        length = 1 + immediate_size
+        written = None
+        if has_modrm:
+            modrm = data[position + 1]
+            extension = (modrm >> 3) & 7
+            if opcode == 0xFF and extension not in _FF_ALLOWED_EXTENSIONS:
+                return False
+            if extension in _NO_WRITE_EXTENSIONS.get(opcode, ()):
+                writes = None
+            length += _modrm_length(data, position + 1)
+            if writes == "reg":
+                written = extension
+            elif writes == "rm" and modrm >> 6 == 3:
+                written = modrm & 7
+        elif writes == "op":
+            written = opcode & (3 if 0xB4 <= opcode < 0xB8 else 7)
+        if written == register:
+            return False
+        position += length
+    return position == end
+
+
+def movs_before_call(
+    data: mmap.mmap, start: int, call_site: int, register: int
+) -> Iterator[int]:
+    """
+    Yields, closest first, the offsets of the `mov <register>, imm32` whose
+    end is an instruction boundary leading to the call, see _decodes_to.
+
+    :param data: File data.
+    :type data: mmap.mmap
+    :param start: Section start offset, never crossed.
+    :type start: int
+    :param call_site: Offset of the `call rel32`.
+    :type call_site: int
+    :param register: Register number, 0 EAX ... 7 EDI.
+    :type register: int
+    """
+    mov_opcode = 0xB8 + register
+    lowest = max(start, call_site - 5 - MAX_MOV_CALL_GAP)
+    for mov in range(call_site - 5, lowest - 1, -1):
+        if data[mov] == mov_opcode and _decodes_to(
+            data, mov + 5, call_site, register
+        ):
+            yield mov
+
+
+def find_call_sites(
+    pe: PEImage, decryptor_rva: int, arg_register: str
+) -> Iterator[Tuple[int, int]]:
+    """
+    Yields (call site VA, string VA) of `mov reg, imm32 ... call decryptor`.
+
+    :param pe: Parsed PE image.
+    :type pe: PEImage
+    :param decryptor_rva: RVA of the decryption routine.
+    :type decryptor_rva: int
+    :param arg_register: Register carrying the encrypted string address.
+    :type arg_register: str
+    """
+    register = MOV_IMM32_OPCODES[arg_register.upper()] - 0xB8
+    data = pe.data
+
+    for section in pe.sections:
+        if not section.is_code:
+            continue
+        start = section.raw_offset
+        end = start + min(section.raw_size, max(section.virtual_size, 1))
+        # * `call rel32` is 0xE8 + displacement from the next instruction
+        call_site = data.find(b"\xE8", start, end - 4)
+        while call_site != -1:
+            (displacement,) = struct.unpack_from("<i", data, call_site + 1)
+            call_rva = section.virtual_address + (call_site - start)
+            if (call_rva + 5 + displacement) & 0xFFFFFFFF == decryptor_rva:
+                for mov in movs_before_call(data, start, call_site, register):
+                    (string_va,) = struct.unpack_from("<I", data, mov + 1)
+                    # * the bytes before the `mov` are unknown, an immediate
+                    # * outside the image is not the string argument either
+                    if pe.va_to_offset(string_va) is not None:
+                        yield pe.image_base + call_rva, string_va
+                        break
+            call_site = data.find(b"\xE8", call_site + 1, end - 4)
+
+
+def decrypt_file(path: str, profile: Profile) -> Dict:
+    """
+    Decrypt the strings of a single sample.
+
+    :param path: PE file path.
+    :type path: str
+    :param profile: Decryption profile, `decryptor` is a VA.
+    :type profile: Profile
+    :return: Sample report.
+    :rtype: Dict
+    """
+    report: Dict = {"file": path, "profile": profile.name, "strings": []}
+    try:
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            pe = PEImage(data)
+            enc_buffer: Dict[int, Tuple[bytes, List[int]]] = {}
+            for call_site, string_va in find_call_sites(
+                pe, profile.decryptor - pe.image_base, profile.arg_register
+            ):
+                if string_va in enc_buffer:
+                    enc_buffer[string_va][1].append(call_site)
+                    continue
+                offset = pe.va_to_offset(string_va)
+                if offset is None:
+                    continue
+                enc_str = c_string(data[offset : offset + profile.max_length])
+                enc_buffer[string_va] = (enc_str, [call_site])
+
+        addresses = sorted(enc_buffer)
+        enc_strs = [enc_buffer[address][0] for address in addresses]
+        report["strings"] = [
+            make_result(address, enc_buffer[address][1], enc_str, dec_str)
+            for address, enc_str, dec_str in zip(
+                addresses, enc_strs, profile.decrypt_many(enc_strs)
+            )
+        ]
+    except (OSError, ValueError, struct.error) as err:
+        report["error"] = str(err)
+    return report
+
+
+# * profile of the worker processes, loaded once by main, see _init_worker
+_worker_profile: Optional[Profile] = None
+
+
+def _init_worker(profile: Profile) -> None:
+    global _worker_profile
+    _worker_profile = profile
+
+
+def _decrypt_file_worker(path: str) -> Dict:
+    return decrypt_file(path, _worker_profile)
+
+
+def parse_va(value: str) -> int:
+    """
+    argparse type of a VA, decimal or 0x prefixed.
+    """
+    try:
+        return int(value, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid VA {value!r}") from None
+
+
+def iter_samples(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def export_paths(
+    reports: List[Dict], export_dir: str, export_format: str
+) -> List[str]:
+    """
+    Export path of every report, `<basename>.<format>` unless another
+    sample has the same basename: `<basename>-<path sha1 prefix>.<format>`.
+    """
+    basenames: Dict[str, int] = {}
+    for report in reports:
+        basename = os.path.basename(report["file"])
+        basenames[basename] = basenames.get(basename, 0) + 1
+
+    paths = []
+    for report in reports:
+        name = os.path.basename(report["file"])
+        if basenames[name] > 1:
+            path_hash = hashlib.sha1(
+                os.path.abspath(report["file"]).encode("utf-8")
+            ).hexdigest()
+            name = f"{name}-{path_hash[:8]}"
+        paths.append(os.path.join(export_dir, f"{name}.{export_format}"))
+    return paths
+
+
+def _to_json(report: Dict) -> Dict:
+    report = dict(report)
+    report["strings"] = [
+        {
+            "address": f"0x{r['address']:08x}",
+            "call_sites": [f"0x{call_site:08x}" for call_site in r["call_sites"]],
+            "encrypted_hex": r["encrypted"].hex(),
+            "decrypted": r["decrypted"],
+        }
+        for r in report["strings"]
+    ]
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline strings decryptor over raw PE files"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="PE files or directories of samples."
+    )
+    parser.add_argument(
+        "--profile",
+        default="artradownloader_v1",
+        help="Profile from common/strdecrypt_profiles.json. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--decryptor",
+        type=parse_va,
+        help="Decryptor VA (e.g. 0x004026b0), overrides the profile one.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Worker processes. (default: %(default)s)",
+    )
+    parser.add_argument("-o", "--output", help="JSON report path. (default: stdout)")
+    parser.add_argument(
+        "--export-dir",
+        help="Also write one export per sample, see strdecrypt.export_results.",
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=("json", "csv"),
+        default="json",
+        help="Format of the per-sample exports. (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    try:
+        profile = load_profile(args.profile)
+    except KeyError as err:
+        parser.error(err.args[0])
+    if args.decryptor is not None:
+        profile.decryptor = args.decryptor
+    if profile.decryptor is None:
+        parser.error(f"profile {args.profile} has no decryptor, use --decryptor")
+
+    # * the profile is loaded here once, the workers get a copy at startup
+    with ProcessPoolExecutor(
+        max_workers=args.jobs, initializer=_init_worker, initargs=(profile,)
+    ) as executor:
+        # * map() keeps the reports in input order
+        reports = list(
+            executor.map(_decrypt_file_worker, iter_samples(args.paths), chunksize=8)
+        )
+
+    if args.export_dir:
+        os.makedirs(args.export_dir, exist_ok=True)
+        for report, export_path in zip(
+            reports, export_paths(reports, args.export_dir, args.export_format)
+        ):
+            # * failed samples have no results, they are only in the report
+            if "error" in report:
+                print(f"[!] {report['file']}: {report['error']}", file=sys.stderr)
+                continue
+            export_results(report["strings"], export_path)
+
+    output = json.dumps([_to_json(report) for report in reports], indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    decrypted = sum(len(report["strings"]) for report in reports)
+    failed = sum(1 for report in reports if "error" in report)
+    print(
+        f"[+] {len(reports)} samples, {decrypted} strings decrypted, {failed} errors",
+        file=sys.stderr,
+    )